@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+BLE 名稱/PIN 批次設定
+經由 nRF 的 UART (VESC 端) 送出 COMM_SET_BLE_NAME / COMM_SET_BLE_PIN，
+韌體 (main.c process_packet_vesc) 儲存設定並在 3 秒後重置；重置後
+COMM_EXT_NRF_PRESENT 心跳 (每秒一次) 恢復即確認設定完成。
+CSV 中的每個序列埠由獨立的執行緒同時處理。
+
+CSV (第一列為欄位名稱):
+  port,name,pin
+  COM5,SPEsc-001,123456
+  COM6,SPEsc-002,          空白 = 不變更
+  COM7,-,-                 - = 清除 (恢復預設名稱 / 不使用 PIN)
+
+用法:
+  python ble_provision.py units.csv [--output results.csv] [--baudrate 115200]
+  python ble_provision.py units.csv --simulate      以模擬的橋接器測試
+"""
+
+import argparse
+import csv
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vesc_packet import (PacketDecoder, PacketLink, encode_packet,
+                         COMM_EXT_NRF_PRESENT, COMM_SET_BLE_NAME, COMM_SET_BLE_PIN)
+
+# 導入 pyserial (使用 pip install pyserial)
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    serial = None
+    SERIAL_AVAILABLE = False
+
+DEFAULT_BAUDRATE = 115200
+
+# COMM_EXT_NRF_PRESENT 第二個位元組：支援名稱與 PIN 設定
+CAPS_NAME_PIN = 3
+
+# 名稱長度 (韌體檢查封包長度 > 3 且 <= 30，包含命令位元組)
+NAME_MIN_LEN = 3
+NAME_MAX_LEN = 29
+PIN_LEN = 6
+CLEAR = '-'
+
+HEARTBEAT_PERIOD = 1.0
+# 等待第一個心跳的時間
+HEARTBEAT_TIMEOUT = 3.0 * HEARTBEAT_PERIOD
+# 收到設定後重置的時間 (main.c m_reset_timer)
+RESET_DELAY = 3.0
+# 開機後第一個心跳的延遲 (main.c 第一次啟動 m_nrf_timer 為 1200 ms)
+BOOT_HEARTBEAT_DELAY = 1.2
+# 重置後要先開機再等 BOOT_HEARTBEAT_DELAY 才有心跳，正常心跳間隔只有一個週期：
+# 跨過重置時間點且超過此值的心跳間隔表示已重置
+RESET_GAP = BOOT_HEARTBEAT_DELAY + 0.1 * HEARTBEAT_PERIOD
+# 裝置端重置計時從收到設定才開始：重置前最後一個心跳可能比本機預估的重置時間稍晚
+RESET_SLACK = 0.5
+# 送出設定後等待重置並恢復心跳的時間
+CONFIRM_TIMEOUT = 10.0
+# 只清除時等待可能的重置的時間：原本已設定名稱或 PIN 時韌體同樣會重置，
+# 要等重置、開機後第一個心跳再加一個週期，另留 2 秒開機時間
+CLEAR_WAIT = RESET_DELAY + BOOT_HEARTBEAT_DELAY + HEARTBEAT_PERIOD + 2.0
+
+RESULT_FIELDS = ('port', 'name', 'pin', 'success', 'message', 'duration')
+
+
+class Unit:
+    """CSV 中的一台裝置；name/pin 為 None 表示不變更，'' 表示清除"""
+
+    def __init__(self, port, name=None, pin=None):
+        self.port = port
+        self.name = name
+        self.pin = pin
+        self.success = False
+        self.message = ''
+        self.duration = 0.0
+
+    @property
+    def expects_reset(self):
+        """設定新的名稱或 PIN 時韌體一定重置；只清除時 (原本未設定) 不會重置"""
+        return bool(self.name) or bool(self.pin)
+
+    def payloads(self):
+        packets = []
+        if self.name is not None:
+            packets.append(bytes((COMM_SET_BLE_NAME,)) + self.name.encode('utf-8'))
+        if self.pin is not None:
+            packets.append(bytes((COMM_SET_BLE_PIN,)) + self.pin.encode('ascii'))
+        return packets
+
+    def row(self):
+        return {'port': self.port, 'name': self.name, 'pin': '******' if self.pin else self.pin,
+                'success': int(self.success), 'message': self.message,
+                'duration': f"{self.duration:.2f}"}
+
+
+def _parse_field(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    return '' if value == CLEAR else value
+
+
+def load_units(path):
+    """讀取並檢查 CSV，回傳 Unit 清單"""
+    units = []
+    ports = set()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or 'port' not in reader.fieldnames:
+            raise ValueError(f"{path} 缺少 port 欄位")
+        for line, row in enumerate(reader, start=2):
+            port = (row.get('port') or '').strip()
+            if not port:
+                continue
+            if port in ports:
+                raise ValueError(f"第 {line} 列: {port} 重複")
+            ports.add(port)
+            name = _parse_field(row.get('name'))
+            pin = _parse_field(row.get('pin'))
+            if name and not NAME_MIN_LEN <= len(name.encode('utf-8')) <= NAME_MAX_LEN:
+                raise ValueError(f"第 {line} 列: 名稱需為 {NAME_MIN_LEN}-{NAME_MAX_LEN} 位元組")
+            if pin and not (len(pin) == PIN_LEN and pin.isascii() and pin.isdigit()):
+                raise ValueError(f"第 {line} 列: PIN 需為 {PIN_LEN} 位數字")
+            if name is None and pin is None:
+                raise ValueError(f"第 {line} 列: 沒有要設定的名稱或 PIN")
+            units.append(Unit(port, name, pin))
+    return units
+
+
+def wait_heartbeat(link, timeout):
+    """回傳下一個 COMM_EXT_NRF_PRESENT 的資料，逾時回傳 None"""
+    deadline = time.monotonic() + timeout
+    while True:
+        packet = link.receive(max(0.0, deadline - time.monotonic()))
+        if packet is None:
+            return None
+        if packet[0] == COMM_EXT_NRF_PRESENT:
+            return packet
+
+
+def provision(unit, open_stream):
+    """設定一台裝置並等待重置後的心跳；結果寫入 unit"""
+    t0 = time.monotonic()
+    try:
+        with open_stream(unit.port) as stream:
+            link = PacketLink(stream)
+            heartbeat = wait_heartbeat(link, HEARTBEAT_TIMEOUT)
+            if heartbeat is None:
+                raise RuntimeError(f"{HEARTBEAT_TIMEOUT:g} 秒內沒有 nRF 心跳")
+            caps = heartbeat[1] if len(heartbeat) > 1 else 0
+            if caps < CAPS_NAME_PIN:
+                raise RuntimeError(f"韌體不支援名稱/PIN 設定 (心跳 {caps})")
+
+            last = time.monotonic()
+            for payload in unit.payloads():
+                link.send(payload)
+            reset_time = time.monotonic() + RESET_DELAY
+            wait = CONFIRM_TIMEOUT if unit.expects_reset else CLEAR_WAIT
+            deadline = time.monotonic() + wait
+            reset = False
+            while time.monotonic() < deadline:
+                if wait_heartbeat(link, min(1.0, deadline - time.monotonic())) is None:
+                    continue
+                now = time.monotonic()
+                # 間隔需跨過重置時間點，重置前後的其他延遲 (例如 USB) 不算重置
+                if now > reset_time and last <= reset_time + RESET_SLACK and now - last >= RESET_GAP:
+                    reset = True
+                    break
+                last = now
+            if reset:
+                unit.message = "已重置，心跳恢復"
+            elif not unit.expects_reset and time.monotonic() - last < RESET_GAP:
+                unit.message = "已清除 (原本未設定，不需重置)"
+            else:
+                raise RuntimeError(f"{wait:g} 秒內沒有重置後的心跳")
+        unit.success = True
+    except Exception as e:
+        unit.message = str(e)
+    unit.duration = time.monotonic() - t0
+    return unit
+
+
+def provision_all(units, open_stream, report=None, workers=None):
+    """同時設定所有裝置 (每個序列埠一個執行緒)，回傳總秒數"""
+    t0 = time.monotonic()
+    lock = threading.Lock()
+
+    def run(unit):
+        provision(unit, open_stream)
+        if report:
+            with lock:
+                report(unit)
+
+    with ThreadPoolExecutor(max_workers=workers or max(1, len(units))) as pool:
+        list(pool.map(run, units))
+    return time.monotonic() - t0
+
+
+class LoopbackBridge:
+    """模擬的 nRF 橋接器 (與 serial.Serial 相同的 read/write 介面)
+
+    每 HEARTBEAT_PERIOD 秒送出心跳；收到設定 (或清除原本已設定的值) 後 3 秒重置，開機後 BOOT_HEARTBEAT_DELAY 秒才有心跳
+    """
+
+    BOOT_TIME = 0.3
+
+    def __init__(self, caps=CAPS_NAME_PIN, phase=0.0, name=None, pin=None):
+        self.caps = caps
+        self.timeout = None
+        self.decoder = PacketDecoder()
+        self.name = name
+        self.pin = pin
+        self._next_heartbeat = time.monotonic() + phase
+        self._reset_at = None
+        self._ready = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def write(self, data):
+        for payload in self.decoder.feed(data):
+            value = payload[1:].decode('utf-8', 'replace')
+            if payload[0] == COMM_SET_BLE_NAME:
+                # 清除原本已設定的名稱/PIN 時也會重置
+                if 3 < len(payload) <= 30 or self.name is not None:
+                    self._reset_at = time.monotonic() + RESET_DELAY
+                self.name = value if 3 < len(payload) <= 30 else None
+            elif payload[0] == COMM_SET_BLE_PIN:
+                valid = len(payload) >= 7 and value[:6].isdigit()
+                if valid or self.pin is not None:
+                    self._reset_at = time.monotonic() + RESET_DELAY
+                self.pin = value[:6] if valid else None
+        return len(data)
+
+    def _tick(self, now):
+        if self._reset_at is not None and now >= self._reset_at:
+            self._reset_at = None
+            self._next_heartbeat = now + self.BOOT_TIME + BOOT_HEARTBEAT_DELAY
+        while now >= self._next_heartbeat:
+            self._ready += encode_packet(bytes((COMM_EXT_NRF_PRESENT, self.caps)))
+            self._next_heartbeat += HEARTBEAT_PERIOD
+
+    @property
+    def in_waiting(self):
+        self._tick(time.monotonic())
+        return len(self._ready)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            now = time.monotonic()
+            self._tick(now)
+            if self._ready or now >= deadline:
+                break
+            time.sleep(min(0.01, deadline - now))
+        data = bytes(self._ready[:size])
+        del self._ready[:size]
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BLE 名稱/PIN 批次設定")
+    parser.add_argument('csv', help="port,name,pin")
+    parser.add_argument('--output', help="結果 CSV")
+    parser.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE)
+    parser.add_argument('--workers', type=int, help="同時處理的序列埠數 (預設全部)")
+    parser.add_argument('--simulate', action='store_true', help="以模擬的橋接器代替序列埠")
+    args = parser.parse_args()
+
+    try:
+        units = load_units(args.csv)
+        if not units:
+            raise ValueError(f"{args.csv} 沒有裝置")
+        if args.simulate:
+            def open_stream(port):
+                return LoopbackBridge(phase=(hash(port) % 1000) / 1000)
+        else:
+            if not SERIAL_AVAILABLE:
+                raise RuntimeError("pyserial 未安裝 (pip install pyserial)")
+
+            def open_stream(port):
+                return serial.Serial(port, args.baudrate)
+
+        def report(unit):
+            mark = '✓' if unit.success else '✗'
+            print(f"{mark} {unit.port:<14} {unit.name or '':<20} {unit.duration:5.1f} 秒  {unit.message}",
+                  flush=True)
+
+        print(f"設定 {len(units)} 台裝置 ...")
+        total = provision_all(units, open_stream, report, args.workers)
+        succeeded = sum(1 for unit in units if unit.success)
+        print(f"\n完成: {succeeded}/{len(units)} 台成功, 總時間 {total:.1f} 秒 "
+              f"({len(units) * 60 / total:.1f} 台/分鐘)")
+        if args.output:
+            with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, RESULT_FIELDS)
+                writer.writeheader()
+                for unit in units:
+                    writer.writerow(unit.row())
+            print(f"結果已寫入 {args.output}")
+        return 0 if succeeded == len(units) else 1
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+步驟時限與重試
+每個探針步驟在獨立執行緒中執行並給予時間預算；超過預算視為探針卡住，
+放棄該次呼叫、重建探針連線並在退避後重試。整個工作的時限 (timeout)
+同時限制所有步驟的預算總和。
+被放棄的步驟不能再存取探針：每個原生呼叫之前檢查取消旗標 (GuardedApi)，
+pynrfjprog 不是執行緒安全的，舊連線要等卡住的呼叫返回後才能關閉。
+"""
+
+import threading
+import time
+
+# 各步驟的基本時間預算 (秒)
+DEFAULT_BUDGETS = {
+    'connect': 20.0,  # 包含 SWD 時脈校準
+    'recover': 20.0,
+    'erase_all': 20.0,
+    'program': 30.0,
+    'reset': 10.0,
+    'readback': 60.0,
+    'check_tag': 30.0,
+    'verify': 30.0,
+    'uicr': 10.0,
+    'tag': 10.0,
+    'clear_tag': 10.0,
+    'rtt': 10.0,
+}
+
+# 有預估時間的步驟，預算至少為預估的倍數
+ESTIMATE_FACTOR = 5.0
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+BACKOFF_FACTOR = 2.0
+
+# 逾時後等待被放棄的探針呼叫返回的秒數；仍未返回時不在同一探針上重新連線
+ABANDON_WAIT = 5.0
+
+
+class StepTimeout(Exception):
+    """步驟超過時間預算"""
+
+    def __init__(self, name, budget, thread=None, worker=None):
+        super().__init__(f"步驟 {name} 逾時 ({budget:.1f} 秒)")
+        self.name = name
+        self.budget = budget
+        self.thread = thread
+        self.worker = worker
+
+
+class StepAbandoned(Exception):
+    """步驟已逾時被放棄，之後的探針呼叫一律拒絕"""
+
+
+class GuardedApi:
+    """包裝探針 API：cancel (threading.Event) 設定後，每個呼叫之前拋出 StepAbandoned
+
+    已經在原生程式中的呼叫無法中斷，但呼叫返回後步驟不會再繼續存取探針
+    (例如燒錄迴圈不會再寫入下一頁)
+    """
+
+    def __init__(self, api, cancel):
+        self._api = api
+        self._cancel = cancel
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if self._cancel.is_set():
+                raise StepAbandoned(f"步驟已被放棄，不再呼叫 {name}")
+            return attr(*args, **kwargs)
+        return call
+
+
+class ProbeUnavailable(RuntimeError):
+    """重試後探針仍無回應，工作可以改由其他探針執行"""
+
+
+def call_with_deadline(func, budget, name='step', cancel=None):
+    """在背景執行緒執行 func，超過 budget 秒時設定 cancel 並拋出 StepTimeout
+
+    逾時的執行緒無法強制結束 (pynrfjprog 呼叫會阻塞在原生程式中)，
+    只能放棄並由呼叫端重建連線；StepTimeout.thread 為被放棄執行緒的識別碼，
+    StepTimeout.worker 為執行緒物件 (重新連線前等待它返回)
+    """
+    result = {}
+
+    def target():
+        try:
+            result['value'] = func()
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True, name=f"step-{name}")
+    thread.start()
+    thread.join(budget)
+    if thread.is_alive():
+        if cancel is not None:
+            cancel.set()
+        raise StepTimeout(name, budget, thread.ident, thread)
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+
+class DeadlineScheduler:
+    """分配每個步驟的時間預算與重試間隔，總和不超過工作時限"""
+
+    def __init__(self, job_timeout, budgets=None, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF):
+        self.job_timeout = job_timeout
+        self.deadline = time.monotonic() + job_timeout
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.retries = retries
+        self.backoff = backoff
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def budget(self, action, estimate=0.0):
+        """步驟的時間預算；不超過工作剩餘時間"""
+        base = max(self.budgets.get(action, 30.0), estimate * ESTIMATE_FACTOR)
+        return min(base, self.remaining())
+
+    def backoff_delay(self, attempt):
+        """第 attempt 次失敗後的等待秒數 (指數退避)"""
+        return min(self.backoff * BACKOFF_FACTOR ** (attempt - 1), self.remaining())
+
+    def can_retry(self, attempt):
+        return attempt <= self.retries and self.remaining() > 0
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+ESB 封包擷取與重播
+監聽 nRF 與 VESC 之間的 UART (115200 8N1)，解出韌體轉送的 ESB 遙控器封包：
+  COMM_EXT_NRF_ESB_RX_DATA    遙控器 → nRF → VESC (esb_timeslot_data_handler)
+  COMM_EXT_NRF_ESB_SEND_DATA  VESC → nRF → 遙控器 (rfhelp_send_data_crc)
+並寫入精簡的二進位記錄檔 (附時間索引)，供分析延遲、掉包與重播使用。
+
+記錄檔格式 (little endian):
+  檔頭   8s 魔術字 + d 開始時間 (Unix 秒) + I 保留
+  記錄   I 與前一筆相差的微秒 + B 種類 + H 長度 + 資料
+  索引   (Q 前一筆的絕對微秒, Q 檔案位置, I 記錄編號) * N
+  檔尾   Q 索引位置 + I 索引筆數 + 8s 魔術字
+擷取中斷而沒有檔尾時，讀取時重新掃描建立索引。
+
+用法:
+  python esb_capture.py capture COM5 [COM6] -o remote.esb [--duration 60]
+  python esb_capture.py stats remote.esb [--start 10 --end 20]
+  python esb_capture.py dump remote.esb [--start 10] [--limit 50]
+  python esb_capture.py replay remote.esb --port COM7 [--speed 4] [--only rx]
+"""
+
+import argparse
+import bisect
+import os
+import queue
+import statistics
+import struct
+import sys
+import threading
+import time
+
+from vesc_packet import (PacketDecoder, encode_packet, crc16, mote_name, comm_name,
+                         COMM_EXT_NRF_ESB_RX_DATA, COMM_EXT_NRF_ESB_SEND_DATA,
+                         MOTE_PACKET_BUTTONS, PACKET_RX_TIMEOUT)
+
+# 導入 pyserial (使用 pip install pyserial)
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    serial = None
+    SERIAL_AVAILABLE = False
+
+DEFAULT_BAUDRATE = 115200
+
+FILE_MAGIC = b'ESBCAP\x00\x01'
+INDEX_MAGIC = b'ESBIDX\x00\x01'
+HEADER = struct.Struct('<8sdI')
+RECORD = struct.Struct('<IBH')
+INDEX_ENTRY = struct.Struct('<QQI')
+FOOTER = struct.Struct('<QI8s')
+
+# 記錄種類
+KIND_RX = 0         # 遙控器 → VESC
+KIND_TX = 1         # VESC → 遙控器
+KIND_TIME = 0xFF    # 間隔超過 uint32 微秒時插入，資料為 Q 絕對微秒
+KIND_NAMES = {KIND_RX: 'rx', KIND_TX: 'tx'}
+COMMAND_KINDS = {COMM_EXT_NRF_ESB_RX_DATA: KIND_RX, COMM_EXT_NRF_ESB_SEND_DATA: KIND_TX}
+KIND_COMMANDS = {kind: command for command, kind in COMMAND_KINDS.items()}
+
+# 每隔多久 (微秒) 建立一筆索引
+INDEX_INTERVAL_US = 1000000
+
+# 讀取 UART 的單次最大位元組數
+READ_CHUNK = 4096
+
+
+class EsbRecord:
+    """一筆 ESB 封包
+
+    time 為距離擷取開始的秒數；data 為空中傳送的資料 (RX 含遙控器附加的 CRC16，
+    TX 為 VESC 要求送出的資料，韌體送出前才附加 CRC)
+    """
+
+    __slots__ = ('time_us', 'kind', 'data')
+
+    def __init__(self, time_us, kind, data):
+        self.time_us = time_us
+        self.kind = kind
+        self.data = data
+
+    @property
+    def time(self):
+        return self.time_us / 1e6
+
+    @property
+    def mote_type(self):
+        return self.data[0] if self.data else None
+
+    @property
+    def crc_ok(self):
+        """RX 資料的 CRC16 是否正確 (TX 資料沒有 CRC，一律為 True)"""
+        if self.kind != KIND_RX:
+            return True
+        if len(self.data) < 3:
+            return False
+        return crc16(self.data[:-2]) == (self.data[-2] << 8 | self.data[-1])
+
+    @property
+    def body(self):
+        """MOTE 封包內容 (去掉種類與 CRC)"""
+        return self.data[1:-2] if self.kind == KIND_RX else self.data[1:]
+
+    def describe(self):
+        text = f"{self.time:10.6f} {KIND_NAMES.get(self.kind, '?')} "
+        if not self.data:
+            return text + "(空)"
+        text += f"{mote_name(self.data[0]):<22}"
+        body = self.body
+        if self.data[0] == MOTE_PACKET_BUTTONS and len(body) >= 5:
+            buttons = body[2]
+            vbat = struct.unpack('>h', bytes(body[3:5]))[0] / 1000.0
+            text += (f" x={body[0]:3d} y={body[1]:3d} c={buttons >> 4 & 1} z={buttons >> 3 & 1}"
+                     f" push={buttons >> 2 & 1} rev={buttons & 1} vbat={vbat:.2f}")
+        else:
+            text += " " + bytes(body).hex(' ')
+        if not self.crc_ok:
+            text += "  ✗ CRC"
+        return text
+
+
+class CaptureWriter:
+    """寫入記錄檔；多個擷取執行緒共用時由呼叫端保證單一寫入者"""
+
+    def __init__(self, path, start_time=None):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(FILE_MAGIC, start_time or time.time(), 0))
+        self.last_us = 0
+        self.count = 0
+        self.index = []
+        self.next_index_us = 0
+
+    def write(self, time_us, kind, data):
+        time_us = max(time_us, self.last_us)
+        if time_us >= self.next_index_us:
+            self.index.append((self.last_us, self.file.tell(), self.count))
+            self.next_index_us = time_us + INDEX_INTERVAL_US
+        delta = time_us - self.last_us
+        if delta > 0xFFFFFFFF:
+            self.file.write(RECORD.pack(0, KIND_TIME, 8) + struct.pack('<Q', time_us))
+            delta = 0
+        self.file.write(RECORD.pack(delta, kind, len(data)))
+        self.file.write(data)
+        self.last_us = time_us
+        self.count += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureLog:
+    """讀取記錄檔；read(start) 以時間索引直接跳到開始時間附近"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, self.start_time, _ = HEADER.unpack(f.read(HEADER.size))
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{path} 不是 ESB 擷取檔")
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            self.index, self.data_end = self._read_index(f, size)
+        if self.index is None:
+            self.index, self.count = self._scan()
+        else:
+            self.count = None
+
+    def _read_index(self, f, size):
+        if size < HEADER.size + FOOTER.size:
+            return None, size
+        f.seek(size - FOOTER.size)
+        index_offset, entries, magic = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != INDEX_MAGIC or index_offset + entries * INDEX_ENTRY.size + FOOTER.size != size:
+            return None, size
+        f.seek(index_offset)
+        raw = f.read(entries * INDEX_ENTRY.size)
+        return [INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size) for i in range(entries)], index_offset
+
+    def _scan(self):
+        """沒有索引 (擷取中斷) 時逐筆掃描建立"""
+        index = []
+        count = 0
+        next_index_us = 0
+        last_us = 0
+        for offset, record in self._iter(HEADER.size, 0):
+            if record.time_us >= next_index_us:
+                index.append((last_us, offset, count))
+                next_index_us = record.time_us + INDEX_INTERVAL_US
+            last_us = record.time_us
+            count += 1
+        return index, count
+
+    def _iter(self, offset, base_us):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            time_us = base_us
+            # 時間記錄與其後的資料記錄視為同一筆 (索引指向時間記錄)
+            record_offset = offset
+            while offset + RECORD.size <= self.data_end:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                delta, kind, length = RECORD.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                offset += RECORD.size + length
+                if kind == KIND_TIME:
+                    time_us = struct.unpack('<Q', data)[0]
+                    continue
+                time_us += delta
+                yield record_offset, EsbRecord(time_us, kind, data)
+                record_offset = offset
+
+    def read(self, start=0.0, end=None):
+        """依序產生 EsbRecord (start/end 為距離擷取開始的秒數)"""
+        start_us = int(start * 1e6)
+        end_us = None if end is None else int(end * 1e6)
+        offset, base_us = HEADER.size, 0
+        if self.index:
+            # 最後一個在開始時間之前的索引點 (之前的記錄都早於開始時間)
+            position = bisect.bisect_left([entry[0] for entry in self.index], start_us) - 1
+            if position >= 0:
+                base_us, offset, _ = self.index[position]
+        for _, record in self._iter(offset, base_us):
+            if end_us is not None and record.time_us > end_us:
+                return
+            if record.time_us >= start_us:
+                yield record
+
+    def __len__(self):
+        if self.count is None:
+            self.count = sum(1 for _ in self.read())
+        return self.count
+
+
+class UartTap(threading.Thread):
+    """讀取一個 UART 並把 ESB 封包放入佇列 (時間戳, 種類, 資料)"""
+
+    def __init__(self, port, out_queue, t0_ns, baudrate=DEFAULT_BAUDRATE):
+        super().__init__(daemon=True, name=f"tap-{port}")
+        self.port = port
+        self.queue = out_queue
+        self.t0_ns = t0_ns
+        self.baudrate = baudrate
+        self.decoder = PacketDecoder()
+        self.other = {}
+        self.bytes = 0
+        self.error = None
+        self.running = True
+
+    def run(self):
+        try:
+            with serial.Serial(self.port, self.baudrate, timeout=PACKET_RX_TIMEOUT / 2) as uart:
+                last_ns = time.perf_counter_ns()
+                while self.running:
+                    chunk = uart.read(min(max(uart.in_waiting, 1), READ_CHUNK))
+                    now_ns = time.perf_counter_ns()
+                    if not chunk:
+                        continue
+                    # 與韌體相同，超過接收逾時的不完整封包直接丟棄
+                    if now_ns - last_ns > PACKET_RX_TIMEOUT * 1e9:
+                        self.decoder.reset()
+                    last_ns = now_ns
+                    self.bytes += len(chunk)
+                    time_us = (now_ns - self.t0_ns) // 1000
+                    for packet in self.decoder.feed(chunk):
+                        kind = COMMAND_KINDS.get(packet[0])
+                        if kind is None:
+                            self.other[packet[0]] = self.other.get(packet[0], 0) + 1
+                        else:
+                            self.queue.put((time_us, kind, packet[1:]))
+        except Exception as e:
+            self.error = e
+            self.queue.put(None)
+
+    def stop(self):
+        self.running = False
+
+
+def capture(ports, path, duration=None, baudrate=DEFAULT_BAUDRATE, quiet=False):
+    """擷取直到 duration 秒或 Ctrl+C；同一 UART 兩個方向可以用兩個埠同時監聽"""
+    if not SERIAL_AVAILABLE:
+        raise RuntimeError("pyserial 未安裝 (pip install pyserial)")
+    records = queue.Queue()
+    t0_ns = time.perf_counter_ns()
+    taps = [UartTap(port, records, t0_ns, baudrate) for port in ports]
+    counts = {KIND_RX: 0, KIND_TX: 0}
+    deadline = None if duration is None else time.monotonic() + duration
+    next_report = time.monotonic() + 1
+    with CaptureWriter(path) as writer:
+        for tap in taps:
+            tap.start()
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                try:
+                    item = records.get(timeout=0.2)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    break
+                if item:
+                    writer.write(*item)
+                    counts[item[1]] += 1
+                if not quiet and time.monotonic() >= next_report:
+                    next_report += 1
+                    print(f"\rRX {counts[KIND_RX]}  TX {counts[KIND_TX]}  "
+                          f"丟棄 {sum(t.decoder.dropped for t in taps)} 位元組", end='', flush=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for tap in taps:
+                tap.stop()
+            for tap in taps:
+                tap.join(1)
+            while True:
+                try:
+                    item = records.get_nowait()
+                except queue.Empty:
+                    break
+                if item:
+                    writer.write(*item)
+                    counts[item[1]] += 1
+    if not quiet:
+        print()
+    for tap in taps:
+        if tap.error:
+            raise RuntimeError(f"{tap.port}: {tap.error}")
+    return counts, taps
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def analyze(log, start=0.0, end=None):
+    """延遲與掉包統計
+
+    遙控器以固定週期送出封包，RX 間隔超過中位數 1.5 倍視為中間遺失封包；
+    TX 到下一筆 RX 的時間作為往返延遲的估計
+    """
+    counts = {}
+    types = {}
+    crc_errors = 0
+    rx_times = []
+    latencies = []
+    pending_tx = None
+    first = last = None
+    for record in log.read(start, end):
+        first = record.time if first is None else first
+        last = record.time
+        counts[record.kind] = counts.get(record.kind, 0) + 1
+        name = mote_name(record.mote_type) if record.data else '(空)'
+        types[name] = types.get(name, 0) + 1
+        if record.kind == KIND_RX:
+            if not record.crc_ok:
+                crc_errors += 1
+                continue
+            rx_times.append(record.time)
+            if pending_tx is not None:
+                latencies.append(record.time - pending_tx)
+                pending_tx = None
+        elif pending_tx is None:
+            pending_tx = record.time
+
+    gaps = [b - a for a, b in zip(rx_times, rx_times[1:])]
+    period = statistics.median(gaps) if gaps else None
+    lost = 0
+    if period:
+        lost = sum(round(gap / period) - 1 for gap in gaps if gap > 1.5 * period)
+    received = len(rx_times)
+    return {
+        'duration': (last - first) if first is not None else 0.0,
+        'rx': counts.get(KIND_RX, 0),
+        'tx': counts.get(KIND_TX, 0),
+        'types': types,
+        'crc_errors': crc_errors,
+        'period': period,
+        'gap_p99': _percentile(gaps, 0.99),
+        'gap_max': max(gaps) if gaps else None,
+        'lost': lost,
+        'loss_rate': lost / (received + lost) if received + lost else 0.0,
+        'latency_median': statistics.median(latencies) if latencies else None,
+        'latency_p95': _percentile(latencies, 0.95),
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+
+def format_stats(stats):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.2f} ms"
+
+    lines = [
+        f"時間長度: {stats['duration']:.2f} 秒",
+        f"RX: {stats['rx']} 筆  TX: {stats['tx']} 筆  CRC 錯誤: {stats['crc_errors']}",
+        f"RX 週期: {ms(stats['period'])}  P99 間隔: {ms(stats['gap_p99'])}  最大間隔: {ms(stats['gap_max'])}",
+        f"估計遺失: {stats['lost']} 筆 ({stats['loss_rate'] * 100:.2f}%)",
+        f"TX→RX 延遲: 中位數 {ms(stats['latency_median'])}  P95 {ms(stats['latency_p95'])}"
+        f"  最大 {ms(stats['latency_max'])}",
+        "封包種類:",
+    ]
+    for name, count in sorted(stats['types'].items(), key=lambda item: -item[1]):
+        lines.append(f"  {name:<22} {count}")
+    return "\n".join(lines)
+
+
+def replay(log, send, speed=1.0, start=0.0, end=None, kinds=(KIND_RX, KIND_TX)):
+    """依原始時間 (除以 speed) 重播；speed 為 0 時不等待
+
+    send(record, frame) 收到以原本指令編碼的 VESC 封包；回傳 (筆數, 最大延遲秒數)
+    """
+    t0 = None
+    base = None
+    sent = 0
+    max_lag = 0.0
+    for record in log.read(start, end):
+        if record.kind not in kinds:
+            continue
+        if t0 is None:
+            t0 = time.perf_counter()
+            base = record.time
+        if speed:
+            target = t0 + (record.time - base) / speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        frame = encode_packet(bytes((KIND_COMMANDS[record.kind],)) + record.data)
+        send(record, frame)
+        sent += 1
+    return sent, max_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESB 封包擷取與重播")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    cap = sub.add_parser('capture', help="監聽 UART 並寫入記錄檔")
+    cap.add_argument('ports', nargs='+', help="UART 埠 (監聽兩個方向時給兩個埠)")
+    cap.add_argument('-o', '--output', required=True)
+    cap.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE)
+    cap.add_argument('--duration', type=float, help="擷取秒數 (預設直到 Ctrl+C)")
+
+    for name, help_text in (('stats', "延遲與掉包統計"), ('dump', "列出封包")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('log')
+        p.add_argument('--start', type=float, default=0.0, help="開始時間 (秒)")
+        p.add_argument('--end', type=float)
+        if name == 'dump':
+            p.add_argument('--limit', type=int)
+
+    rep = sub.add_parser('replay', help="重播到 UART")
+    rep.add_argument('log')
+    rep.add_argument('--port', help="輸出 UART (未指定時只列出)")
+    rep.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE)
+    rep.add_argument('--speed', type=float, default=1.0, help="速度倍數 (0 為不等待)")
+    rep.add_argument('--start', type=float, default=0.0)
+    rep.add_argument('--end', type=float)
+    rep.add_argument('--only', choices=('rx', 'tx'), help="只重播一個方向")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'capture':
+            counts, taps = capture(args.ports, args.output, args.duration, args.baudrate)
+            print(f"已寫入 {args.output}: RX {counts[KIND_RX]} 筆, TX {counts[KIND_TX]} 筆")
+            for tap in taps:
+                other = ', '.join(f"{comm_name(c)} x{n}" for c, n in sorted(tap.other.items()))
+                print(f"  {tap.port}: {tap.bytes} 位元組, 封包 {tap.decoder.packets}, "
+                      f"丟棄 {tap.decoder.dropped} 位元組" + (f", 其他: {other}" if other else ""))
+            return 0
+
+        log = CaptureLog(args.log)
+        if args.command == 'stats':
+            print(format_stats(analyze(log, args.start, args.end)))
+        elif args.command == 'dump':
+            for number, record in enumerate(log.read(args.start, args.end)):
+                if args.limit is not None and number >= args.limit:
+                    break
+                print(record.describe())
+        elif args.command == 'replay':
+            kinds = (KIND_RX, KIND_TX) if not args.only else (KIND_RX if args.only == 'rx' else KIND_TX,)
+            if args.port:
+                if not SERIAL_AVAILABLE:
+                    raise RuntimeError("pyserial 未安裝 (pip install pyserial)")
+                with serial.Serial(args.port, args.baudrate) as uart:
+                    sent, lag = replay(log, lambda record, frame: uart.write(frame),
+                                       args.speed, args.start, args.end, kinds)
+            else:
+                sent, lag = replay(log, lambda record, frame: print(record.describe()),
+                                   args.speed, args.start, args.end, kinds)
+            print(f"已重播 {sent} 筆 (最大落後 {lag * 1000:.1f} ms)")
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
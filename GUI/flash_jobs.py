@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+"""
+燒錄工作 - 不依賴 Qt 的燒錄流程
+GUI 的 FlashThread 與本機燒錄服務共用
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flash_pipeline import prepare_image, validate_segments, PAGE_SIZE, UICR_START
+from hex_library import FirmwareImage
+from flash_plan import EraseState, plan_for_operation, estimates_from_history, ESTIMATE_WINDOW
+from flash_recipe import get_compiled
+from deadlines import (DeadlineScheduler, StepTimeout, ProbeUnavailable, GuardedApi,
+                       call_with_deadline, ABANDON_WAIT)
+import image_tag
+import readback
+import swd_speed
+from rtt_capture import RttCapture, STOP_PATTERN, STOP_ABORTED
+
+# 導入 pynrfjprog (使用 pip install pynrfjprog)
+try:
+    from pynrfjprog import HighLevel, LowLevel
+    PYNRFJPROG_AVAILABLE = True
+except ImportError as e:
+    print(f"警告: 無法導入 pynrfjprog: {e}")
+    HighLevel = LowLevel = None
+    PYNRFJPROG_AVAILABLE = False
+
+OPERATIONS = ('auto', 'flash', 'flash_sd', 'flash_app', 'flash_separate',
+              'erase', 'recover', 'verify', 'readback', 'recipe')
+
+# 不需要探針的操作
+HOST_ONLY_OPERATIONS = ('verify',)
+
+# FICR DEVICEID[0..1]
+FICR_DEVICEID = 0x10000060
+
+
+class Signal:
+    """與 pyqtSignal 相同用法 (connect/emit) 的回呼清單
+
+    accept 傳回 False 時忽略該次 emit
+    """
+
+    def __init__(self, accept=None):
+        self._slots = []
+        self._lock = threading.Lock()
+        self._accept = accept
+
+    def connect(self, slot):
+        with self._lock:
+            self._slots.append(slot)
+
+    def emit(self, *args):
+        if self._accept is not None and not self._accept():
+            return
+        with self._lock:
+            slots = list(self._slots)
+        for slot in slots:
+            slot(*args)
+
+
+class ProbeSession:
+    """探針連線 (LowLevel.API)；步驟逾時且卡住的呼叫返回後關閉並重新開啟
+
+    pynrfjprog 不是執行緒安全的：仍有執行緒在舊 API 的原生呼叫中時，
+    不能從其他執行緒關閉它，也不能對同一探針開第二個連線
+    """
+
+    def __init__(self, family='NRF52'):
+        self.family = family
+        self.api = None
+
+    def open(self):
+        self.api = LowLevel.API(self.family)
+        self.api.open()
+        return self.api
+
+    def close(self):
+        api, self.api = self.api, None
+        if api is not None:
+            _close_quietly(api)
+
+    def close_after(self, worker):
+        """worker 仍卡在舊 API 中：放棄此連線，等 worker 返回後才在背景關閉"""
+        api, self.api = self.api, None
+        if api is None:
+            return
+
+        def close_when_done():
+            worker.join()
+            _close_quietly(api)
+
+        threading.Thread(target=close_when_done, daemon=True, name="probe-close").start()
+
+    def reset(self):
+        """重新連線 (呼叫前被放棄的步驟必須已經返回)"""
+        self.close()
+        self.open()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _close_quietly(api):
+    try:
+        api.close()
+    except Exception:
+        pass
+
+
+class FlashJob:
+    """燒錄工作 - 使用 pynrfjprog
+
+    snr 指定探針序號，None 時使用第一個連接的探針；
+    history 為 JobHistory 時，結束後寫入工作紀錄 (各步驟耗時、裝置 ID、映像雜湊)；
+    dump_path 為讀回 (readback) 的輸出檔，hex_file 可指定比對的映像；
+    timeout 為整個工作的時限，各探針步驟另有時間預算，逾時會重新連線並重試；
+    up_to_date 為 'tag' 或 'verify' 時，裝置的 UICR 韌體標記與映像相同就略過燒錄
+    ('verify' 另外比對每頁雜湊)；rtt_timeout 大於 0 時，燒錄後重置並擷取 RTT 日誌，
+    直到出現 rtt_pattern (正規表示式) 或逾時；
+    SWD 時脈依探針序號與治具 fixture (預設為環境變數 NRF_FIXTURE) 校準並快取；
+    operation 為 'recipe' 時 hex_file 為燒錄配方檔，韌體標記與 RTT 設定改由配方決定
+    """
+
+    def __init__(self, hex_file, operation='flash', sd_file=None, timeout=300, snr=None,
+                 history=None, dump_path=None, up_to_date=None, rtt_timeout=0, rtt_pattern=None,
+                 fixture=None, speed_cache=None):
+        # 逾時被放棄的步驟執行緒之後的輸出一律忽略
+        self._abandoned = set()
+        self.output_signal = Signal(self._is_current)
+        self.progress_signal = Signal(self._is_current)
+        self.finished_signal = Signal()
+        self.hex_file = hex_file
+        self.operation = operation
+        self.sd_file = sd_file
+        self.timeout = timeout  # 秒數，預設 300 秒 (5 分鐘)
+        self.snr = snr
+        self.history = history
+        self.dump_path = dump_path
+        self.up_to_date = up_to_date
+        self.rtt_timeout = rtt_timeout
+        self.rtt_pattern = rtt_pattern
+        self.fixture = fixture or swd_speed.DEFAULT_FIXTURE
+        self.speed_cache = speed_cache if speed_cache is not None else swd_speed.SpeedCache()
+        self._stop_flag = False
+        
+        # 工作紀錄
+        self.probe_snr = None
+        self.device_id = None
+        self.swd_khz = None
+        self.image = None
+        self.recipe = None
+        self.steps = []
+        self.timeouts = []
+        self.retries = 0
+        self.result = None
+        # 裝置已是相同韌體 (依韌體標記)，略過燒錄
+        self.skipped = False
+        # 重試後探針仍無回應 (服務可改用其他探針)
+        self.probe_failure = False
+        self.finished_signal.connect(self._on_finished)
+
+    def _on_finished(self, success, message):
+        if self.result is None:
+            self.result = (success, message)
+
+    @contextmanager
+    def step(self, name):
+        """記錄一個步驟的耗時與結果"""
+        started = time.time()
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._add_step({'name': name, 'started': started,
+                            'duration': time.perf_counter() - t0,
+                            'success': False, 'error': str(e)})
+            raise
+        self._add_step({'name': name, 'started': started,
+                        'duration': time.perf_counter() - t0, 'success': True})
+
+    def _is_current(self):
+        return threading.get_ident() not in self._abandoned
+
+    def _add_step(self, record):
+        if self._is_current():
+            self.steps.append(record)
+
+    def record_timeout(self, name, attempt, budget):
+        """記錄一次步驟逾時 (同時寫入步驟清單)"""
+        started = time.time() - budget
+        self.timeouts.append({'step': name, 'attempt': attempt, 'budget': budget,
+                              'time': time.time()})
+        self.steps.append({'name': name, 'started': started, 'duration': budget,
+                           'success': False, 'error': f"逾時 ({budget:.1f} 秒)",
+                           'attempt': attempt, 'timed_out': True})
+
+    def history_record(self, started, finished):
+        """組成 JobHistory 的工作紀錄"""
+        success, message = self.result or (False, "工作未回報結果")
+        failed_steps = [s for s in self.steps if not s['success']]
+        return {
+            'started': started,
+            'finished': finished,
+            'operation': self.operation,
+            'probe_snr': self.probe_snr,
+            'device_id': self.device_id,
+            'swd_khz': self.swd_khz,
+            'fixture': self.fixture,
+            'image_hash': self.image.hash if self.image else None,
+            'image_path': ' + '.join(self.image.sources) if self.image else self.hex_file or None,
+            'success': success,
+            'message': message,
+            'error': None if success else (failed_steps[-1]['error'] if failed_steps else message),
+            'timeouts': len(self.timeouts),
+            'retries': self.retries,
+            'skipped': self.skipped,
+            'steps': self.steps,
+        }
+
+    def run(self):
+        started = time.time()
+        try:
+            self._run_operation()
+        finally:
+            if self.history is not None:
+                try:
+                    self.history.record(self.history_record(started, time.time()))
+                except Exception as e:
+                    self.output_signal.emit(f"⚠ 無法寫入工作紀錄: {str(e)}\n")
+
+    def _run_operation(self):
+        try:
+            if not PYNRFJPROG_AVAILABLE:
+                self.finished_signal.emit(False, "pynrfjprog 未安裝!")
+                return
+            
+            if self._stop_flag:
+                self.finished_signal.emit(False, "操作已被中止")
+                return
+            
+            if self.operation == 'erase':
+                self.erase_chip()
+            elif self.operation == 'flash':
+                self.flash_hex()
+            elif self.operation == 'flash_sd':
+                self.flash_sd_only()
+            elif self.operation == 'flash_app':
+                self.flash_app_only()
+            elif self.operation == 'verify':
+                self.verify_hex()
+            elif self.operation == 'recover':
+                self.recover_device()
+            elif self.operation == 'auto':
+                self.auto_flash()
+            elif self.operation == 'flash_separate':
+                self.flash_separate()
+            elif self.operation == 'readback':
+                self.readback_device()
+            elif self.operation == 'recipe':
+                self.flash_recipe()
+            else:
+                self.finished_signal.emit(False, f"未知的操作: {self.operation}")
+        except Exception as e:
+            self.finished_signal.emit(False, f"錯誤: {str(e)}")
+
+    def stop_operation(self):
+        """停止燒錄操作"""
+        self._stop_flag = True
+
+    @property
+    def stop_requested(self):
+        return self._stop_flag
+
+    def connect_probe(self, api):
+        """連接指定 (或第一個) J-Link 探針，回傳探針序號"""
+        probes = api.enum_emu_snr()
+        if not probes:
+            raise RuntimeError("未找到連接的 J-Link 探針!")
+        if self.snr is not None and self.snr not in probes:
+            raise RuntimeError(f"探針 {self.snr} 未連接!")
+        snr = self.snr if self.snr is not None else probes[0]
+        with self.step('connect'):
+            self.connect_swd(api, snr)
+        self.probe_snr = snr
+        self.read_device_id(api)
+        return snr
+
+    def connect_swd(self, api, snr):
+        """以快取的 SWD 時脈連線；沒有快取時由高到低校準並寫入快取"""
+        khz = self.speed_cache.get(snr, self.fixture)
+        source = "快取"
+        if khz is not None:
+            try:
+                api.connect_to_emu_with_snr(snr, khz)
+            except Exception as e:
+                # 治具或線材已更換：重新校準
+                self.output_signal.emit(f"⚠ 無法以 {khz} kHz 連線 ({str(e)})，重新校準 SWD 時脈\n")
+                khz = None
+        if khz is None:
+            khz = swd_speed.calibrate(api, snr, log=self.output_signal.emit)
+            if khz is None:
+                # 讀取保護啟用或所有時脈都無法驗證：以預設時脈連線，不快取
+                api.connect_to_emu_with_snr(snr)
+                khz = swd_speed.DEFAULT_SPEED_KHZ
+                source = "預設"
+            else:
+                self.speed_cache.set(snr, self.fixture, khz)
+                source = "校準"
+        if khz != self.swd_khz:
+            self.output_signal.emit(f"SWD 時脈: {khz} kHz ({source}, 治具 {self.fixture})\n")
+        self.swd_khz = khz
+
+    def demote_swd(self):
+        """步驟逾時或通訊錯誤：快取的 SWD 時脈降一級 (下次連線生效)"""
+        if self.probe_snr is None or self.swd_khz is None:
+            return
+        lower = self.speed_cache.demote(self.probe_snr, self.fixture, self.swd_khz)
+        if lower is not None and lower < self.swd_khz:
+            self.output_signal.emit(f"⚠ SWD 時脈降為 {lower} kHz\n")
+
+    def read_device_id(self, api):
+        """讀取 FICR 裝置 ID (讀取保護啟用時會失敗，稍後再試)"""
+        if self.device_id is not None:
+            return self.device_id
+        try:
+            low = api.read_u32(FICR_DEVICEID)
+            high = api.read_u32(FICR_DEVICEID + 4)
+            self.device_id = f"{high:08X}{low:08X}"
+        except Exception:
+            pass
+        return self.device_id
+
+    def write_pages(self, api, image, progress_start, progress_end, state):
+        """映像頁面一準備好就寫入；擦除狀態未知的頁面先擦除 (sector erase)
+
+        state 為 EraseState，回傳 (是否完成, 擦除頁數)，未完成表示被中止
+        """
+        written = 0
+        erased = 0
+        for page in image.iter_pages(stop_check=lambda: self._stop_flag):
+            if self._stop_flag or not self._is_current():
+                return False, erased
+            base = page.addr & ~(PAGE_SIZE - 1)
+            if state.needs_erase(base):
+                if base >= UICR_START:
+                    api.erase_uicr()
+                else:
+                    api.erase_page(base)
+                state.page_erased(base)
+                erased += 1
+            state.page_written(base)
+            # 頁面資料為映像的 memoryview，只在交給 pynrfjprog 時複製這一頁
+            api.write(page.addr, bytes(page.data), True)
+            written += len(page.data)
+            if image.data_size:
+                self.progress_signal.emit(
+                    progress_start + (progress_end - progress_start) * written // image.data_size)
+        return not self._stop_flag, erased
+
+    def write_uicr(self, api, writes):
+        """寫入 UICR 字；已是相同的值時略過，已寫入其他值 (UICR 未擦除) 時失敗"""
+        for addr, value, name in writes:
+            current = api.read_u32(addr)
+            if current == value:
+                self.output_signal.emit(f"  UICR {name} 已是 0x{value:08X}\n")
+                continue
+            if current != 0xFFFFFFFF:
+                raise RuntimeError(f"UICR {name} 已是 0x{current:08X}，"
+                                   "需要先擦除 UICR (配方 erase: recover 或 chip)")
+            api.write_u32(addr, value, True)
+            self.output_signal.emit(f"✓ UICR {name} = 0x{value:08X}\n")
+
+    def reset_device(self, api, disconnect=True):
+        """系統重置並讓目標開始執行，然後中斷連線 (之後要擷取 RTT 時保持連線)"""
+        with self.step('reset'):
+            api.sys_reset()
+            api.go()
+            if disconnect:
+                api.disconnect_from_emu()
+
+    def capture_rtt(self, api):
+        """擷取 RTT 日誌並寫入工作日誌；指定的樣式沒有出現時視為失敗"""
+        self.output_signal.emit("----- RTT -----\n")
+        capture = RttCapture(api, self.output_signal.emit, self.rtt_pattern, self.rtt_timeout,
+                             stop_check=lambda: self._stop_flag or not self._is_current())
+        with self.step('rtt'):
+            result = capture.run()
+            api.disconnect_from_emu()
+        self.output_signal.emit("\n---------------\n")
+        if result.reason == STOP_ABORTED:
+            return False
+        if result.reason == STOP_PATTERN:
+            self.output_signal.emit(f"✓ RTT 出現 \"{result.match}\" ({result.duration:.2f} 秒)\n")
+        elif self.rtt_pattern:
+            raise RuntimeError(f"{self.rtt_timeout:g} 秒內 RTT 未出現 \"{self.rtt_pattern}\" "
+                               f"(收到 {result.received} 位元組)")
+        elif result.received == 0:
+            self.output_signal.emit(f"⚠ {self.rtt_timeout:g} 秒內沒有 RTT 輸出 "
+                                    "(韌體需以 NRF_LOG_ENABLED 1 建置)\n")
+        else:
+            self.output_signal.emit(f"✓ RTT 擷取 {result.received} 位元組\n")
+        return True
+
+    def run_with_retry(self, session, scheduler, name, func, estimate=0.0, on_retry=None):
+        """在時間預算內執行探針步驟 func(api)；逾時或 SWD 通訊錯誤 (swd_speed.is_link_error)
+        時降低 SWD 時脈、重建連線並退避重試
+
+        func 取得的 api 在逾時後拒絕所有呼叫，被放棄的步驟不會再存取探針；
+        重新連線前等待卡住的呼叫返回 (最多 ABANDON_WAIT 秒)，仍未返回時不在同一探針上
+        重新連線，改為拋出 ProbeUnavailable (服務可改用其他探針)；
+        逾時重試次數或工作時限用完時也拋出 ProbeUnavailable；通訊錯誤重試用完時拋出原本的錯誤
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            budget = scheduler.budget(name, estimate)
+            if budget <= 0:
+                raise ProbeUnavailable(f"工作超過時限 ({scheduler.job_timeout} 秒)")
+            cancel = threading.Event()
+            api = GuardedApi(session.api, cancel)
+            try:
+                return call_with_deadline(lambda: func(api), budget, name, cancel)
+            except StepTimeout as e:
+                self._abandoned.add(e.thread)
+                self.record_timeout(name, attempt, budget)
+                if not scheduler.can_retry(attempt):
+                    self.demote_swd()
+                    session.close_after(e.worker)
+                    raise ProbeUnavailable(f"{e}，重試 {attempt - 1} 次後仍無回應") from None
+                e.worker.join(min(ABANDON_WAIT, scheduler.remaining()))
+                if e.worker.is_alive():
+                    session.close_after(e.worker)
+                    raise ProbeUnavailable(f"{e}，探針呼叫 {ABANDON_WAIT:g} 秒內未返回，"
+                                           "不在同一探針上重新連線") from None
+                reason = str(e)
+            except Exception as e:
+                if not swd_speed.is_link_error(e):
+                    raise
+                if not scheduler.can_retry(attempt):
+                    # 下一個工作以較低的時脈連線
+                    self.demote_swd()
+                    raise
+                reason = f"步驟 {name} 通訊錯誤 ({str(e)})"
+            delay = scheduler.backoff_delay(attempt)
+            self.output_signal.emit(f"⚠ {reason}，重新連線探針，{delay:.1f} 秒後重試 "
+                                    f"({attempt}/{scheduler.retries})\n")
+            time.sleep(delay)
+            self.retries += 1
+            self.demote_swd()
+            session.reset()
+            if name != 'connect':
+                self.run_with_retry(session, scheduler, 'connect', self.connect_probe)
+            if on_retry:
+                on_retry()
+
+    def history_estimates(self):
+        """最近 ESTIMATE_WINDOW 秒工作歷史的步驟預估值 (沒有歷史時回傳 None)"""
+        if self.history is None:
+            return None
+        return estimates_from_history(self.history, time.time() - ESTIMATE_WINDOW)
+
+    def build_plan(self):
+        """依操作組出執行計畫 (有工作歷史時以歷史平均耗時預估)"""
+        if self.recipe is not None:
+            return self.recipe.plan
+        estimates = self.history_estimates()
+        return plan_for_operation(self.operation, self.hex_file, self.sd_file, estimates,
+                                  self.up_to_date, self.rtt_timeout)
+
+    def run_plan(self, plan, success_message, fail_prefix):
+        """依計畫執行：所有映像先在背景準備，同時連線、Recover、擦除"""
+        self.output_signal.emit(plan.describe())
+        self.output_signal.emit(f"操作逾時設定: {self.timeout} 秒 (各步驟另有時間預算，逾時自動重新連線重試)\n")
+        self.progress_signal.emit(5)
+        
+        try:
+            if self._stop_flag:
+                self.finished_signal.emit(False, "燒錄已被中止")
+                return
+            
+            for step in plan.runnable():
+                if step.action == 'program':
+                    # 編譯過的配方已準備好映像，計畫由所有工作共用
+                    if step.image is None:
+                        step.image = prepare_image(*step.sources)
+                    self.image = step.image
+            
+            state = EraseState()
+            runnable = plan.runnable()
+            total = plan.total_estimate() or 1.0
+            elapsed = 0.0
+            scheduler = DeadlineScheduler(self.timeout)
+            
+            with ProbeSession() as session:
+                for index, step in enumerate(runnable, 1):
+                    if self._stop_flag:
+                        self.finished_signal.emit(False, "燒錄已被中止")
+                        return
+                    
+                    progress_start = 5 + int(90 * elapsed / total)
+                    elapsed += step.estimate
+                    progress_end = 5 + int(90 * elapsed / total)
+                    self.output_signal.emit(f"\n步驟 {index}/{len(runnable)}: {step.title}...\n")
+                    self.progress_signal.emit(progress_start)
+                    
+                    completed = self.run_with_retry(
+                        session, scheduler, step.action,
+                        lambda api: self.run_step(api, step, state, progress_start, progress_end),
+                        step.estimate,
+                        on_retry=state.rollback if step.action == 'program' else None)
+                    state.commit()
+                    if not completed:
+                        self.finished_signal.emit(False, "燒錄已被中止")
+                        return
+                    if self.skipped:
+                        message = "裝置已是相同韌體，略過燒錄"
+                        self.progress_signal.emit(100)
+                        self.output_signal.emit(f"\n✓ {message}\n")
+                        self.finished_signal.emit(True, message)
+                        return
+            
+            self.progress_signal.emit(100)
+            self.output_signal.emit(f"\n✓ {success_message}\n")
+            self.finished_signal.emit(True, success_message)
+        except ProbeUnavailable as e:
+            self.probe_failure = True
+            self.finished_signal.emit(False, f"{fail_prefix}: {str(e)}")
+        except Exception as e:
+            self.finished_signal.emit(False, f"{fail_prefix}: {str(e)}")
+
+    def run_step(self, api, step, state, progress_start, progress_end):
+        """執行計畫中的一個步驟並更新擦除狀態；回傳 False 表示被中止"""
+        if step.action == 'connect':
+            snr = self.connect_probe(api)
+            self.output_signal.emit(f"✓ 連接到探針: {snr}\n")
+        
+        elif step.action == 'recover':
+            try:
+                with self.step('recover'):
+                    api.recover()
+                self.output_signal.emit("✓ Recover 成功\n")
+            except Exception:
+                if not step.optional:
+                    raise
+                # 計畫中後續的擦除已因 Recover 省略，改在這裡擦除
+                self.output_signal.emit("⚠ Recover 失敗，改為擦除晶片...\n")
+                with self.step('erase'):
+                    api.erase_all()
+                self.output_signal.emit("✓ 擦除完成\n")
+            state.chip_erased()
+            self.read_device_id(api)
+        
+        elif step.action == 'erase_all':
+            with self.step('erase'):
+                api.erase_all()
+            state.chip_erased()
+            self.read_device_id(api)
+            self.output_signal.emit("✓ 擦除完成\n")
+        
+        elif step.action == 'program':
+            image = step.image
+            with self.step('program'):
+                completed, erased = self.write_pages(api, image, progress_start, progress_end, state)
+            if not completed:
+                return False
+            self.output_signal.emit(f"✓ 燒錄完成: {image.page_count()} 頁 (擦除 {erased} 頁), "
+                                    f"{image.data_size} 位元組, SHA-256 {image.hash[:16]}\n")
+        
+        elif step.action == 'verify':
+            with self.step('verify_pages'):
+                mismatched = image_tag.verify_pages(api, self.image, stop_check=lambda: self._stop_flag)
+            if self._stop_flag:
+                return False
+            if mismatched:
+                raise swd_speed.LinkError(f"{len(mismatched)} 頁內容與映像不符 "
+                                          f"(第一頁 0x{mismatched[0]:08X})")
+            self.output_signal.emit(f"✓ {self.image.page_count()} 頁雜湊一致\n")
+        
+        elif step.action == 'uicr':
+            with self.step('uicr'):
+                self.write_uicr(api, step.writes)
+        
+        elif step.action == 'check_tag':
+            return self.check_tag(api)
+        
+        elif step.action == 'tag':
+            with self.step('tag'):
+                if image_tag.overlaps_tag(self.image.firmware):
+                    self.output_signal.emit("⚠ 映像本身包含 UICR 標記位置的資料，未寫入韌體標記\n")
+                elif image_tag.write_tag(api, self.image.hash):
+                    self.output_signal.emit("✓ 已寫入 UICR 韌體標記\n")
+                else:
+                    self.output_signal.emit("⚠ UICR 標記位置未擦除，已清除舊標記\n")
+        
+        elif step.action == 'clear_tag':
+            # 只燒錄部分映像，裝置內容不再對應任何完整映像
+            with self.step('tag'):
+                if not image_tag.overlaps_tag(self.image.firmware):
+                    image_tag.invalidate_tag(api)
+            self.output_signal.emit("✓ 已清除 UICR 韌體標記\n")
+        
+        elif step.action == 'reset':
+            self.reset_device(api, disconnect=not self.rtt_timeout)
+            self.output_signal.emit("✓ 重置完成\n")
+        
+        elif step.action == 'rtt':
+            return self.capture_rtt(api)
+        
+        else:
+            raise ValueError(f"未知的計畫步驟: {step.action}")
+        return True
+
+    def check_tag(self, api):
+        """讀取韌體標記並與映像比對，相同時設定 skipped；回傳 False 表示被中止"""
+        image = self.image.wait()
+        try:
+            with self.step('check_tag'):
+                tag, _ = image_tag.read_tag(api)
+        except Exception as e:
+            # 讀取保護啟用時無法讀取 UICR，照常燒錄
+            self.output_signal.emit(f"無法讀取 UICR 韌體標記 ({str(e)})，繼續燒錄\n")
+            return True
+        if tag is None:
+            self.output_signal.emit("裝置沒有韌體標記，繼續燒錄\n")
+            return True
+        if not tag.matches(image.hash):
+            self.output_signal.emit(f"韌體標記不同 ({tag.describe()})，繼續燒錄\n")
+            return True
+        self.output_signal.emit(f"✓ 韌體標記相同: {tag.describe()}\n")
+        
+        if self.up_to_date == image_tag.UP_TO_DATE_VERIFY:
+            with self.step('verify_pages'):
+                mismatched = image_tag.verify_pages(api, image, stop_check=lambda: self._stop_flag)
+            if self._stop_flag:
+                return False
+            if mismatched:
+                self.output_signal.emit(f"✗ {len(mismatched)} 頁內容與映像不符 "
+                                        f"(第一頁 0x{mismatched[0]:08X})，繼續燒錄\n")
+                return True
+            self.output_signal.emit(f"✓ {image.page_count()} 頁雜湊一致\n")
+        self.skipped = True
+        return True
+
+    def flash_hex(self):
+        """燒錄 Merged HEX (全晶片擦除)"""
+        self.output_signal.emit(f"燒錄檔案: {self.hex_file}\n")
+        self.run_plan(self.build_plan(), "燒錄成功!", "燒錄失敗")
+
+    def flash_sd_only(self):
+        """僅燒錄 SoftDevice (只擦除映像涵蓋的頁面)"""
+        self.output_signal.emit(f"燒錄 SoftDevice: {self.hex_file}\n")
+        self.run_plan(self.build_plan(), "SoftDevice 燒錄成功!", "SoftDevice 燒錄失敗")
+
+    def flash_app_only(self):
+        """僅燒錄 Application (只擦除映像涵蓋的頁面)"""
+        self.output_signal.emit(f"燒錄 Application: {self.hex_file}\n")
+        self.run_plan(self.build_plan(), "Application 燒錄成功!", "Application 燒錄失敗")
+
+    def erase_chip(self):
+        """擦除晶片"""
+        self.output_signal.emit("開始擦除晶片...\n")
+        self.run_plan(self.build_plan(), "晶片擦除成功!", "擦除失敗")
+
+    def verify_hex(self):
+        """驗證 HEX 檔案"""
+        self.output_signal.emit(f"驗證檔案: {self.hex_file}\n")
+        self.progress_signal.emit(10)
+        
+        try:
+            self.output_signal.emit("解析 HEX 檔案...\n")
+            self.progress_signal.emit(30)
+            
+            # 只載入有資料的區段，不展開區段之間的空白
+            image = FirmwareImage.load(self.hex_file)
+            validate_segments(image.segments)
+            
+            self.output_signal.emit(f"✓ HEX 檔案有效\n")
+            self.output_signal.emit(f"  地址範圍: 0x{image.start:08X} - 0x{image.end - 1:08X}\n")
+            self.output_signal.emit(f"  資料大小: {image.data_size} 位元組 ({len(image.segments)} 個區段)\n")
+            self.output_signal.emit(f"  SHA-256: {image.hash[:16]}\n")
+            
+            self.progress_signal.emit(100)
+            self.finished_signal.emit(True, "驗證成功!")
+        except Exception as e:
+            self.finished_signal.emit(False, f"驗證失敗: {str(e)}")
+
+    def recover_device(self):
+        """恢復裝置（解除讀取保護）"""
+        self.output_signal.emit("開始恢復裝置...\n")
+        self.output_signal.emit("此操作將解除裝置的讀取保護\n")
+        self.run_plan(self.build_plan(), "裝置恢復成功!", "恢復失敗")
+
+    def readback_device(self):
+        """讀回 Flash/UICR/FICR 至檔案，並與指定映像比對"""
+        if not self.dump_path:
+            self.finished_signal.emit(False, "未指定讀回檔案!")
+            return
+        
+        self.output_signal.emit("=== 讀回裝置記憶體 ===\n")
+        self.output_signal.emit(f"輸出檔案: {self.dump_path}\n")
+        self.progress_signal.emit(5)
+        
+        def on_progress(done, total):
+            self.progress_signal.emit(5 + 85 * done // total)
+        
+        def read_all(api):
+            with self.step('readback'):
+                return readback.readback(api, self.dump_path, on_progress,
+                                         stop_check=lambda: self._stop_flag)
+        
+        try:
+            scheduler = DeadlineScheduler(self.timeout)
+            with ProbeSession() as session:
+                self.run_with_retry(session, scheduler, 'connect', self.connect_probe)
+                self.output_signal.emit("已連接裝置\n")
+                dump = self.run_with_retry(session, scheduler, 'readback', read_all)
+                session.api.disconnect_from_emu()
+            
+            with dump:
+                self.output_signal.emit(f"✓ 讀回完成: Flash {dump.flash_size // 1024} KB + UICR + FICR\n")
+                hex_path = self.dump_path.rsplit('.', 1)[0] + '.hex'
+                readback.export_hex(dump, hex_path)
+                self.output_signal.emit(f"  已匯出 HEX: {hex_path}\n")
+                
+                if self.hex_file:
+                    self.output_signal.emit(f"\n比對映像: {self.hex_file}\n")
+                    with self.step('diff'):
+                        ranges, compared = readback.diff_image(dump, self.hex_file)
+                    self.output_signal.emit(readback.format_diff(ranges, compared))
+            
+            self.progress_signal.emit(100)
+            if self.hex_file and ranges:
+                self.finished_signal.emit(True, f"讀回完成，與映像有 {len(ranges)} 個差異範圍")
+            else:
+                self.finished_signal.emit(True, "讀回完成!")
+        except InterruptedError:
+            self.finished_signal.emit(False, "讀回已被中止")
+        except ProbeUnavailable as e:
+            self.probe_failure = True
+            self.finished_signal.emit(False, f"讀回失敗: {str(e)}")
+        except Exception as e:
+            self.finished_signal.emit(False, f"讀回失敗: {str(e)}")
+
+    def auto_flash(self):
+        """自動模式：Recover → Erase → Flash → Reset
+
+        Recover 已擦除整個晶片，計畫會省略之後的全晶片擦除 (Recover 失敗時才擦除)；
+        映像解析與頁面雜湊在背景進行，與 Recover 重疊
+        """
+        self.output_signal.emit("=== 自動燒錄模式 ===\n")
+        self.output_signal.emit(f"目標檔案: {self.hex_file}\n\n")
+        self.run_plan(self.build_plan(), "自動燒錄完成!", "自動燒錄失敗")
+
+    def flash_recipe(self):
+        """依燒錄配方執行；配方只在第一次 (或檔案變更後) 編譯，之後的工作共用計畫與映像"""
+        try:
+            t0 = time.perf_counter()
+            estimates = self.history_estimates()
+            self.recipe = get_compiled(self.hex_file, estimates)
+            elapsed = time.perf_counter() - t0
+        except Exception as e:
+            self.finished_signal.emit(False, f"配方錯誤: {str(e)}")
+            return
+        
+        recipe = self.recipe.recipe
+        self.up_to_date = recipe.skip_if_current
+        self.rtt_timeout = recipe.rtt_timeout
+        self.rtt_pattern = recipe.rtt_pattern
+        self.output_signal.emit(f"=== 燒錄配方: {recipe.name} ===\n")
+        self.output_signal.emit(f"配方檔: {self.hex_file} (載入 {elapsed * 1000:.0f} ms)\n")
+        self.run_plan(self.build_plan(), f"配方 {recipe.name} 完成!", "配方燒錄失敗")
+
+    def flash_separate(self):
+        """分開燒錄：SoftDevice + Application
+
+        兩個映像在背景合併 (檢查位址重疊)，擦除一次後直接寫入
+        """
+        if not self.sd_file:
+            self.finished_signal.emit(False, "未指定 SoftDevice 檔案!")
+            return
+        
+        self.output_signal.emit("=== 分開燒錄模式 ===\n")
+        self.output_signal.emit(f"SoftDevice: {self.sd_file}\n")
+        self.output_signal.emit(f"Application: {self.hex_file}\n\n")
+        self.run_plan(self.build_plan(), "分開燒錄完成!", "分開燒錄失敗")
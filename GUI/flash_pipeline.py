@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+燒錄前置處理管線
+在背景執行緒解析、驗證、合併映像並預先計算每頁雜湊，
+讓裝置端的連線、Recover、擦除可以同時進行
+"""
+
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+from hex_library import FirmwareImage
+
+PAGE_SIZE = 0x1000
+
+# 可燒錄的位址範圍 (Code flash 與 UICR)
+FLASH_END = 0x100000
+UICR_START = 0x10001000
+UICR_END = 0x10002000
+
+# 一頁中的連續資料區塊 (addr 不一定對齊頁首；data 為指向映像的唯讀 memoryview)
+Page = namedtuple('Page', ['addr', 'data', 'digest'])
+
+
+class PreparedImage:
+    """已解析並切成頁面的映像
+
+    頁面會在背景逐一加入，iter_pages() 可以邊準備邊取用；
+    頁面資料直接引用 firmware (FirmwareImage) 的記憶體，不另外複製。
+    完成後內容不再變動，可安全地在多個燒錄執行緒間共用。
+    """
+
+    def __init__(self, sources):
+        self.sources = tuple(str(p) for p in sources)
+        self.firmware = None
+        self.pages = []
+        self.hash = None
+        self.data_size = 0
+        self.error = None
+        self._done = False
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self._done
+
+    def _add_page(self, page):
+        with self._cond:
+            self.pages.append(page)
+            self._cond.notify_all()
+
+    def _finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self._done = True
+            self._cond.notify_all()
+
+    def iter_pages(self, stop_check=None):
+        """依序產生頁面，尚未準備好時等待；準備失敗時拋出例外"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.pages) and not self._done:
+                    if stop_check and stop_check():
+                        return
+                    self._cond.wait(0.1)
+                if index < len(self.pages):
+                    page = self.pages[index]
+                elif self.error:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield page
+
+    def wait(self, timeout=None):
+        """等待準備完成並回傳自身；失敗時拋出例外"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._done, timeout):
+                raise TimeoutError("映像準備逾時")
+        if self.error:
+            raise self.error
+        return self
+
+    def page_count(self):
+        """準備完成後的頁面數 (以頁首位址計)"""
+        return len({p.addr & ~(PAGE_SIZE - 1) for p in self.pages})
+
+
+def merge_segments(segment_lists, names):
+    """合併多個映像的區段，位址重疊時拋出 ValueError"""
+    tagged = []
+    for segments, name in zip(segment_lists, names):
+        tagged.extend((start, data, name) for start, data in segments)
+    tagged.sort(key=lambda s: s[0])
+
+    merged = []
+    prev_end, prev_name = None, None
+    for start, data, name in tagged:
+        if prev_end is not None and start < prev_end:
+            raise ValueError(f"{os.path.basename(name)} 與 {os.path.basename(prev_name)} "
+                             f"在 0x{start:08X} 位址重疊")
+        if merged and start == prev_end:
+            merged[-1][1] += data
+        else:
+            merged.append([start, bytearray(data)])
+        prev_end, prev_name = start + len(data), name
+    return merged
+
+
+def validate_segments(segments):
+    """確認所有資料都落在 Code flash 或 UICR 範圍內"""
+    if not segments:
+        raise ValueError("映像中沒有資料")
+    for start, data in segments:
+        end = start + len(data)
+        in_flash = end <= FLASH_END
+        in_uicr = UICR_START <= start and end <= UICR_END
+        if not (in_flash or in_uicr):
+            raise ValueError(f"資料 0x{start:08X}-0x{end:08X} 超出可燒錄範圍")
+
+
+def split_pages(firmware):
+    """把映像切成不跨頁的區塊並計算雜湊 (不複製資料)"""
+    for addr, view in firmware.page_views(PAGE_SIZE):
+        yield Page(addr, view, hashlib.sha256(view).digest())
+
+
+def _prepare(image):
+    try:
+        images = [FirmwareImage.load(p) for p in image.sources]
+        if len(images) == 1:
+            firmware = images[0]
+        else:
+            firmware = FirmwareImage(merge_segments([i.segments for i in images], image.sources))
+        validate_segments(firmware.segments)
+        image.firmware = firmware
+        image.data_size = firmware.data_size
+        image.hash = firmware.hash
+        for page in split_pages(firmware):
+            image._add_page(page)
+        image._finish()
+    except Exception as e:
+        image._finish(e)
+
+
+# 已準備映像快取：相同檔案 (路徑、大小、修改時間) 共用同一份唯讀資料
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_key(sources):
+    key = []
+    for path in sources:
+        stat = os.stat(path)
+        key.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(key)
+
+
+def prepare_image(*sources):
+    """在背景開始準備映像 (多個來源會合併)，立即回傳 PreparedImage"""
+    key = _cache_key(sources)
+    with _cache_lock:
+        image = _cache.get(key)
+        if image is not None and not (image.done and image.error):
+            return image
+        # 檔案已變更的舊版本不再保留
+        paths = [k[0] for k in key]
+        for old_key in [k for k in _cache if [e[0] for e in k] == paths]:
+            del _cache[old_key]
+        image = PreparedImage(sources)
+        _cache[key] = image
+    threading.Thread(target=_prepare, args=(image,), daemon=True,
+                     name=f"prepare-{os.path.basename(sources[-1])}").start()
+    return image
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+燒錄流程規劃
+依操作組出步驟清單並追蹤每個步驟後的擦除狀態：
+Recover 或全晶片擦除之後，後續燒錄直接寫入已擦除的頁面，不再重複擦除；
+只有狀態未知的頁面才在寫入前做 sector erase。
+每個步驟附有預估時間，執行前先顯示整份計畫。
+"""
+
+import os
+import threading
+import time
+
+from flash_pipeline import PAGE_SIZE
+
+# 預估時間 (秒)；實際數值可由工作歷史的步驟平均耗時取代
+DEFAULT_ESTIMATES = {
+    'connect': 0.3,
+    'recover': 1.0,
+    'erase_all': 0.3,
+    'erase_page': 0.09,
+    'reset': 0.1,
+    'check_tag': 0.02,
+    'tag': 0.02,
+    'uicr': 0.02,
+}
+
+# 歷史預估只參考最近的工作 (秒)，資料庫持續成長也不會越查越慢
+ESTIMATE_WINDOW = 7 * 86400
+
+# 寫入速度 (位元組/秒)
+DEFAULT_WRITE_RATE = 64 * 1024
+# 讀回速度 (位元組/秒，燒錄後驗證)
+DEFAULT_READ_RATE = 256 * 1024
+
+# HEX 檔每 16 位元組資料約佔 44 個字元 (含換行)
+HEX_BYTES_PER_DATA_BYTE = 44 / 16
+
+# 工作歷史中的步驟名稱對應到計畫動作
+HISTORY_STEP_NAMES = {
+    'connect': 'connect',
+    'recover': 'recover',
+    'erase': 'erase_all',
+    'reset': 'reset',
+    'check_tag': 'check_tag',
+    'tag': 'tag',
+    'uicr': 'uicr',
+}
+
+# 寫入前擦除方式
+ERASE_NONE = 'none'      # 目標頁面已確定為空白
+ERASE_PAGES = 'pages'    # 寫入前擦除狀態未知的頁面
+
+
+class EraseState:
+    """裝置 Flash 的擦除狀態 (以頁首位址記錄)
+
+    all_erased 表示整個晶片 (含 UICR) 已擦除；prepared 為本次工作中擦除過
+    或寫入過的頁面。這些頁面可以直接寫入：同一工作內的映像位址不重疊
+    (合併時已檢查)，寫入未使用的位元組不需要再擦除。
+    燒錄中斷後重試時，rollback() 讓中斷前寫入的頁面重新擦除。
+    """
+
+    def __init__(self):
+        self.all_erased = False
+        self.prepared = set()
+        self.dirty = set()
+        self.pending = set()
+
+    def chip_erased(self):
+        self.all_erased = True
+        self.prepared.clear()
+        self.dirty.clear()
+        self.pending.clear()
+
+    def needs_erase(self, page):
+        if page in self.dirty:
+            return True
+        return not self.all_erased and page not in self.prepared
+
+    def page_erased(self, page):
+        self.dirty.discard(page)
+        self.prepared.add(page)
+
+    def page_written(self, page):
+        self.prepared.add(page)
+        self.pending.add(page)
+
+    def commit(self):
+        """燒錄步驟完成，寫入的頁面內容已確定"""
+        self.pending.clear()
+
+    def rollback(self):
+        """燒錄步驟中斷，寫入一半的頁面需要重新擦除"""
+        self.dirty |= self.pending
+        self.pending.clear()
+
+
+class PlanStep:
+    """計畫中的一個步驟
+
+    action 為 connect / check_tag / recover / erase_all / program / verify / uicr / tag /
+    clear_tag / reset / rtt；skipped 不為 None 時表示此步驟因擦除狀態而省略，內容為原因；
+    writes 為 uicr 步驟寫入的 (位址, 值, 名稱)
+    """
+
+    def __init__(self, action, title, estimate=0.0, sources=(), erase=ERASE_NONE,
+                 optional=False, skipped=None, writes=()):
+        self.action = action
+        self.title = title
+        self.estimate = estimate
+        self.sources = tuple(sources)
+        self.erase = erase
+        self.optional = optional
+        self.skipped = skipped
+        self.writes = tuple(writes)
+        self.image = None
+
+    def describe(self):
+        if self.skipped:
+            return f"(略過) {self.title} - {self.skipped}"
+        return f"{self.title}  ~{self.estimate:.1f} 秒"
+
+
+class FlashPlan:
+    """依序執行的步驟清單"""
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+
+    def runnable(self):
+        return [s for s in self.steps if not s.skipped]
+
+    def total_estimate(self):
+        return sum(s.estimate for s in self.runnable())
+
+    def describe(self):
+        """計畫文字 (每行一個步驟)"""
+        lines = [f"執行計畫: {self.name} (預估 {self.total_estimate():.1f} 秒)"]
+        index = 0
+        for step in self.steps:
+            if step.skipped:
+                lines.append(f"  -  {step.describe()}")
+            else:
+                index += 1
+                lines.append(f"  {index}. {step.describe()}")
+        return "\n".join(lines) + "\n"
+
+
+class PlanBuilder:
+    """組出計畫並同時模擬擦除狀態，移除多餘的擦除"""
+
+    def __init__(self, name, estimates=None, write_rate=DEFAULT_WRITE_RATE):
+        self.name = name
+        self.estimates = dict(DEFAULT_ESTIMATES)
+        if estimates:
+            self.estimates.update(estimates)
+        self.write_rate = write_rate
+        self.chip_erased = False
+        self.programmed = False
+        self.steps = []
+
+    def connect(self):
+        self.steps.append(PlanStep('connect', "連接探針", self.estimates['connect']))
+        return self
+
+    def recover(self, optional=False):
+        """Recover 會擦除全部 Flash 與 UICR；optional 時失敗則改為全晶片擦除"""
+        self.steps.append(PlanStep('recover', "恢復裝置 (Recover)", self.estimates['recover'],
+                                   optional=optional))
+        self.chip_erased = True
+        self.programmed = False
+        return self
+
+    def erase_all(self):
+        step = PlanStep('erase_all', "擦除晶片", self.estimates['erase_all'])
+        if self.chip_erased and not self.programmed:
+            step.skipped = "晶片已由前一步驟擦除"
+        self.steps.append(step)
+        self.chip_erased = True
+        self.programmed = False
+        return self
+
+    def program(self, title, *sources):
+        """燒錄映像；晶片已擦除時不擦除，否則只擦除映像涵蓋的頁面"""
+        size = sum(image_size_hint(p) for p in sources)
+        estimate = size / self.write_rate
+        if self.chip_erased:
+            erase = ERASE_NONE
+            title = f"{title} (已擦除, 直接寫入)"
+        else:
+            erase = ERASE_PAGES
+            estimate += self.estimates['erase_page'] * -(-size // PAGE_SIZE)
+            title = f"{title} (寫入前擦除涵蓋頁面)"
+        self.steps.append(PlanStep('program', title, estimate, sources=sources, erase=erase))
+        self.programmed = True
+        return self
+
+    def verify(self):
+        """讀回前一個燒錄步驟的每一頁並比對雜湊"""
+        sources = next(s.sources for s in reversed(self.steps) if s.action == 'program')
+        size = sum(image_size_hint(p) for p in sources)
+        self.steps.append(PlanStep('verify', "驗證寫入的頁面", size / DEFAULT_READ_RATE,
+                                   sources=sources))
+        return self
+
+    def uicr(self, writes):
+        """寫入 UICR 字 (writes 為 (位址, 值, 名稱))；未擦除整個晶片時只能寫入空白或相同的值"""
+        self.steps.append(PlanStep('uicr', f"寫入 UICR ({len(writes)} 個字)",
+                                   self.estimates['uicr'], writes=writes))
+        return self
+
+    def check_tag(self):
+        """讀取 UICR 韌體標記，與映像相同時略過其餘步驟"""
+        self.steps.append(PlanStep('check_tag', "檢查 UICR 韌體標記", self.estimates['check_tag']))
+        return self
+
+    def tag(self):
+        """燒錄後寫入韌體標記；只燒錄部分映像 (未擦除整個晶片) 時讓舊標記失效"""
+        if self.chip_erased:
+            self.steps.append(PlanStep('tag', "寫入 UICR 韌體標記", self.estimates['tag']))
+        else:
+            self.steps.append(PlanStep('clear_tag', "清除 UICR 韌體標記", self.estimates['tag']))
+        return self
+
+    def reset(self):
+        self.steps.append(PlanStep('reset', "重置裝置", self.estimates['reset']))
+        return self
+
+    def rtt(self, timeout):
+        """重置後擷取 RTT 日誌 (最多 timeout 秒)"""
+        self.steps.append(PlanStep('rtt', f"擷取 RTT 日誌 (最多 {timeout:g} 秒)", timeout))
+        return self
+
+    def build(self):
+        return FlashPlan(self.name, self.steps)
+
+
+def image_size_hint(path):
+    """由 HEX 檔大小估計資料量 (位元組)"""
+    try:
+        return int(os.path.getsize(path) / HEX_BYTES_PER_DATA_BYTE)
+    except OSError:
+        return 0
+
+
+def estimates_from_history(history, since=None, image_hash=None):
+    """以工作歷史中各步驟的平均耗時作為預估值 (可只取 since 之後、指定映像的工作)"""
+    estimates = {}
+    try:
+        rows = history.step_stats(since, image_hash)
+    except Exception:
+        return estimates
+    for name, count, avg, _, _, _ in rows:
+        action = HISTORY_STEP_NAMES.get(name)
+        if action and count and avg is not None:
+            estimates[action] = avg
+    return estimates
+
+
+class HistoryEstimates:
+    """最近 window 秒工作歷史的預估值快取 (依映像雜湊)
+
+    查詢在背景執行緒中進行 (refresh_in_background)，get() 只讀取快取；
+    指定映像時以該映像的平均耗時覆蓋所有映像的平均
+    """
+
+    def __init__(self, history, window=ESTIMATE_WINDOW):
+        self.history = history
+        self.window = window
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _query(self, image_hash):
+        since = time.time() - self.window
+        estimates = estimates_from_history(self.history, since)
+        if image_hash:
+            estimates.update(estimates_from_history(self.history, since, image_hash))
+        return estimates
+
+    def get(self, image_hash=None):
+        """快取的預估值
+
+        指定映像還沒有快取時先回傳所有映像的預估，並在背景查詢該映像；
+        完全沒有快取 (啟動時的查詢尚未完成) 時才直接查詢
+        """
+        with self._lock:
+            estimates = self._cache.get(image_hash)
+            fallback = self._cache.get(None)
+        if estimates is None and fallback is not None:
+            threading.Thread(target=self._fill, args=(image_hash,), daemon=True,
+                             name="estimates").start()
+            return dict(fallback)
+        if estimates is None:
+            estimates = self._fill(image_hash)
+        return dict(estimates)
+
+    def _fill(self, image_hash):
+        estimates = self._query(image_hash)
+        with self._lock:
+            self._cache[image_hash] = estimates
+        return estimates
+
+    def refresh(self, image_hashes=(None,)):
+        """重新查詢 (工作完成後呼叫)；其他映像的快取捨棄，下次使用時再查詢"""
+        fresh = {h: self._query(h) for h in image_hashes}
+        with self._lock:
+            self._cache = fresh
+
+    def refresh_in_background(self, image_hashes=(None,)):
+        threading.Thread(target=self.refresh, args=(tuple(image_hashes),), daemon=True,
+                         name="estimates").start()
+
+
+def plan_for_operation(operation, hex_file, sd_file=None, estimates=None, up_to_date=None,
+                       rtt_timeout=0):
+    """依燒錄操作組出計畫；不支援的操作回傳 None
+
+    up_to_date 不為 None 時，整個晶片重新燒錄的操作在連線後先檢查韌體標記；
+    rtt_timeout 大於 0 時，燒錄操作在重置後擷取 RTT 日誌
+    """
+    if operation == 'auto':
+        builder = PlanBuilder("自動燒錄", estimates)
+        builder.connect()
+        if up_to_date:
+            builder.check_tag()
+        builder.recover(optional=True).erase_all()
+        builder.program("燒錄韌體", hex_file)
+    elif operation == 'flash':
+        builder = PlanBuilder("燒錄 Merged HEX", estimates)
+        builder.connect()
+        if up_to_date:
+            builder.check_tag()
+        builder.erase_all()
+        builder.program("燒錄韌體", hex_file)
+    elif operation == 'flash_sd':
+        builder = PlanBuilder("僅燒錄 SoftDevice", estimates)
+        builder.connect()
+        builder.program("燒錄 SoftDevice", hex_file)
+    elif operation == 'flash_app':
+        builder = PlanBuilder("僅燒錄 Application", estimates)
+        builder.connect()
+        builder.program("燒錄 Application", hex_file)
+    elif operation == 'flash_separate':
+        builder = PlanBuilder("分開燒錄", estimates)
+        builder.connect()
+        if up_to_date:
+            builder.check_tag()
+        builder.erase_all()
+        # 兩個映像在主機端合併為同一份頁面序列 (檢查位址重疊)
+        builder.program("燒錄 SoftDevice + Application", sd_file, hex_file)
+    elif operation == 'erase':
+        return PlanBuilder("擦除晶片", estimates).connect().erase_all().build()
+    elif operation == 'recover':
+        return PlanBuilder("恢復裝置", estimates).connect().recover().build()
+    else:
+        return None
+    builder.tag().reset()
+    if rtt_timeout:
+        builder.rtt(rtt_timeout)
+    return builder.build()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+燒錄配方
+以 JSON (或安裝 PyYAML 時的 YAML) 描述映像、擦除方式、UICR 寫入、
+燒錄後驗證與測試 (RTT 樣式)。配方只編譯一次：映像在編譯時解析並計算
+每頁雜湊，組出的計畫由之後每一台裝置共用，每台只剩下裝置端的 I/O。
+
+配方範例:
+  {
+    "name": "SPEsc nRF52832 量產",
+    "images": ["../hex/merge/merged_nrf52832_xxaa.hex"],
+    "erase": "recover",
+    "skip_if_current": "tag",
+    "verify": "pages",
+    "uicr": [{"address": "0x100010A0", "value": "0x00000002", "name": "硬體版本"}],
+    "rtt": {"timeout": 5, "pattern": "VESC bridge ready"}
+  }
+
+  images           一個或多個 HEX (多個時合併並檢查位址重疊)，相對路徑以配方檔所在目錄為準
+  erase            recover (Recover，失敗時全晶片擦除) / chip (全晶片擦除) /
+                   pages (只擦除映像涵蓋的頁面)
+  skip_if_current  tag / verify：裝置的韌體標記與映像相同時略過 (需要全晶片擦除)
+  verify           pages：燒錄後讀回每頁比對雜湊；none (預設) 不驗證
+  uicr             寫入的 UICR 字 (位址需 4 位元組對齊，不可與韌體標記或映像重疊)
+  tag              是否寫入韌體標記 (預設 true)
+  rtt              重置後擷取 RTT 日誌，pattern 沒有出現時燒錄失敗
+
+用法:
+  python flash_recipe.py recipe.json     編譯配方並顯示計畫
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+
+from flash_plan import PlanBuilder
+from flash_pipeline import prepare_image, UICR_START, UICR_END
+import image_tag
+
+# 導入 PyYAML (選用，使用 pip install pyyaml)
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    yaml = None
+    YAML_AVAILABLE = False
+
+ERASE_RECOVER = 'recover'
+ERASE_CHIP = 'chip'
+ERASE_PAGES = 'pages'
+ERASE_MODES = (ERASE_RECOVER, ERASE_CHIP, ERASE_PAGES)
+
+VERIFY_NONE = 'none'
+VERIFY_PAGES = 'pages'
+VERIFY_MODES = (VERIFY_NONE, VERIFY_PAGES)
+
+RECIPE_FIELDS = ('name', 'images', 'erase', 'skip_if_current', 'verify', 'uicr', 'tag', 'rtt')
+
+# 映像準備的時限 (秒)
+PREPARE_TIMEOUT = 60
+
+
+def load_recipe(path):
+    """讀取配方檔 (.json / .yaml / .yml)，回傳 dict"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if str(path).lower().endswith(('.yaml', '.yml')):
+        if not YAML_AVAILABLE:
+            raise ValueError("YAML 配方需要 PyYAML (pip install pyyaml)")
+        data = yaml.safe_load(text)
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"{path} JSON 格式錯誤: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} 需為物件 (鍵值對)")
+    return data
+
+
+def _int_value(value, field):
+    """接受整數或 "0x..." 字串"""
+    if isinstance(value, bool):
+        raise ValueError(f"{field} 需為整數")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value, 0)
+        except ValueError:
+            pass
+    raise ValueError(f"{field} 需為整數或十六進位字串: {value!r}")
+
+
+def _uicr_writes(entries):
+    """檢查 UICR 寫入清單，回傳 ((位址, 值, 名稱), ...)"""
+    if not isinstance(entries, list):
+        raise ValueError("uicr 需為清單")
+    writes = []
+    addresses = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"uicr[{index}] 需為 {{address, value}}")
+        addr = _int_value(entry.get('address'), f"uicr[{index}].address")
+        value = _int_value(entry.get('value'), f"uicr[{index}].value")
+        label = f"0x{addr:08X}"
+        name = f"{entry['name']} ({label})" if entry.get('name') else label
+        if addr % 4 or not UICR_START <= addr < UICR_END:
+            raise ValueError(f"uicr[{index}]: 0x{addr:08X} 不是 UICR 中對齊的字")
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"uicr[{index}]: 值超出 32 位元")
+        if image_tag.TAG_ADDR <= addr < image_tag.TAG_ADDR + image_tag.TAG_SIZE:
+            raise ValueError(f"uicr[{index}]: 0x{addr:08X} 為韌體標記的位置")
+        if addr in addresses:
+            raise ValueError(f"uicr[{index}]: 0x{addr:08X} 重複")
+        addresses.add(addr)
+        writes.append((addr, value, name))
+    return tuple(writes)
+
+
+class Recipe:
+    """已檢查的配方 (映像為絕對路徑)"""
+
+    def __init__(self, data, path=None):
+        unknown = sorted(set(data) - set(RECIPE_FIELDS))
+        if unknown:
+            raise ValueError(f"未知的配方欄位: {', '.join(unknown)}")
+        self.path = os.path.abspath(path) if path else None
+        base = os.path.dirname(self.path) if self.path else os.getcwd()
+        self.name = str(data.get('name') or (os.path.basename(path) if path else "配方"))
+
+        images = data.get('images')
+        if isinstance(images, str):
+            images = [images]
+        if not images or not all(isinstance(p, str) and p for p in images):
+            raise ValueError("images 需為一個或多個 HEX 檔路徑")
+        self.images = tuple(os.path.normpath(os.path.join(base, p)) for p in images)
+        for path in self.images:
+            if not os.path.isfile(path):
+                raise ValueError(f"映像不存在: {path}")
+
+        self.erase = data.get('erase', ERASE_CHIP)
+        if self.erase not in ERASE_MODES:
+            raise ValueError(f"erase 需為 {' / '.join(ERASE_MODES)}")
+        self.skip_if_current = data.get('skip_if_current')
+        if self.skip_if_current is not None:
+            if self.skip_if_current not in image_tag.UP_TO_DATE_MODES:
+                raise ValueError(f"skip_if_current 需為 {' / '.join(image_tag.UP_TO_DATE_MODES)}")
+            if self.erase == ERASE_PAGES:
+                raise ValueError("skip_if_current 需要全晶片擦除 (erase: recover 或 chip)")
+        self.verify = data.get('verify', VERIFY_NONE)
+        if self.verify not in VERIFY_MODES:
+            raise ValueError(f"verify 需為 {' / '.join(VERIFY_MODES)}")
+        self.uicr = _uicr_writes(data.get('uicr') or [])
+        self.tag = data.get('tag', True)
+        if not isinstance(self.tag, bool):
+            raise ValueError("tag 需為 true / false")
+
+        rtt = data.get('rtt') or {}
+        if not isinstance(rtt, dict):
+            raise ValueError("rtt 需為 {timeout, pattern}")
+        self.rtt_pattern = rtt.get('pattern') or None
+        try:
+            self.rtt_timeout = float(rtt.get('timeout', 5 if rtt else 0))
+        except (TypeError, ValueError):
+            raise ValueError("rtt.timeout 需為秒數") from None
+        if self.rtt_pattern is not None:
+            try:
+                re.compile(self.rtt_pattern)
+            except re.error as e:
+                raise ValueError(f"rtt.pattern 不是有效的正規表示式: {e}") from None
+            if self.rtt_timeout <= 0:
+                raise ValueError("指定 rtt.pattern 時 rtt.timeout 需大於 0")
+
+    @classmethod
+    def load(cls, path):
+        return cls(load_recipe(path), path)
+
+
+class CompiledRecipe:
+    """編譯後的配方：映像已準備好 (含每頁雜湊)，計畫可由多台裝置、多個探針共用"""
+
+    def __init__(self, recipe, plan, image, stamps):
+        self.recipe = recipe
+        self.plan = plan
+        self.image = image
+        self.stamps = stamps
+
+    @property
+    def name(self):
+        return self.recipe.name
+
+    def describe(self):
+        recipe = self.recipe
+        lines = [f"配方: {recipe.name}" + (f" ({recipe.path})" if recipe.path else "")]
+        lines.append(f"  映像: {' + '.join(os.path.basename(p) for p in recipe.images)} "
+                     f"({self.image.page_count()} 頁, {self.image.data_size} 位元組, "
+                     f"SHA-256 {self.image.hash[:16]})")
+        for addr, value, name in recipe.uicr:
+            lines.append(f"  UICR {name} = 0x{value:08X}")
+        return "\n".join(lines) + "\n" + self.plan.describe()
+
+
+def _stamps(recipe):
+    """配方檔與映像的 (路徑, 大小, 修改時間)，任何一個變更時需要重新編譯"""
+    paths = ([recipe.path] if recipe.path else []) + list(recipe.images)
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(stamps)
+
+
+def _check_overlaps(recipe, firmware):
+    """UICR 寫入不可覆蓋映像本身的資料"""
+    for addr, _, name in recipe.uicr:
+        for start, data in firmware.segments:
+            if start <= addr < start + len(data):
+                raise ValueError(f"UICR {name} 與映像資料重疊")
+
+
+def compile_recipe(recipe, estimates=None):
+    """準備映像並組出計畫 (阻塞到映像準備完成)"""
+    stamps = _stamps(recipe)
+    image = prepare_image(*recipe.images)
+    image.wait(PREPARE_TIMEOUT)
+    _check_overlaps(recipe, image.firmware)
+
+    builder = PlanBuilder(f"配方: {recipe.name}", estimates)
+    builder.connect()
+    if recipe.skip_if_current:
+        builder.check_tag()
+    if recipe.erase == ERASE_RECOVER:
+        builder.recover(optional=True).erase_all()
+    elif recipe.erase == ERASE_CHIP:
+        builder.erase_all()
+    builder.program("燒錄韌體", *recipe.images)
+    if recipe.verify == VERIFY_PAGES:
+        builder.verify()
+    if recipe.uicr:
+        builder.uicr(recipe.uicr)
+    if recipe.tag:
+        builder.tag()
+    builder.reset()
+    if recipe.rtt_timeout:
+        builder.rtt(recipe.rtt_timeout)
+    plan = builder.build()
+    for step in plan.runnable():
+        if step.action == 'program':
+            step.image = image
+    return CompiledRecipe(recipe, plan, image, stamps)
+
+
+# 已編譯配方快取 (配方檔絕對路徑 -> CompiledRecipe)
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def get_compiled(path, estimates=None):
+    """回傳已編譯的配方；配方或映像變更後重新編譯"""
+    path = os.path.abspath(path)
+    with _compiled_lock:
+        compiled = _compiled.get(path)
+        if compiled is not None:
+            try:
+                if _stamps(compiled.recipe) == compiled.stamps:
+                    return compiled
+            except OSError:
+                pass
+        compiled = compile_recipe(Recipe.load(path), estimates)
+        _compiled[path] = compiled
+        return compiled
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        return 1
+    try:
+        compiled = get_compiled(sys.argv[1])
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+    print(compiled.describe(), end='')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+本機燒錄服務
+服務擁有所有 J-Link 探針，透過 HTTP 提供工作 API；GUI 與腳本都是用戶端
+
+API (JSON):
+  GET  /probes                 探針與忙碌狀態
+  GET  /jobs                   所有工作
+  POST /jobs                   提交工作 {"operation", "hex_file", "sd_file", "timeout", "snr", "dump_path",
+                                         "up_to_date", "rtt_timeout", "rtt_pattern"}
+  GET  /jobs/<id>              工作狀態
+  GET  /jobs/<id>/log?offset=N&wait=S
+                               從 offset 開始的日誌 (最多等待 S 秒新內容)
+  POST /jobs/<id>/cancel       取消工作
+
+安全性:
+  服務預設只接受本機連線；綁定其他位址時必須設定存取權杖 (--token 或環境變數
+  NRF_FLASHER_TOKEN)，用戶端以 X-Flasher-Token 標頭送出。hex_file/sd_file (與配方中的映像)
+  只能位於映像目錄 (預設 hex/、recipes/、../app_hex、../_build，可用 --image-dir 增加)，
+  dump_path 一律存在讀回目錄 (預設 readback/，--dump-dir) 中。
+
+用法:
+  python flasher_service.py serve [--host 127.0.0.1] [--port 8765] [--probe SNR ...] [--fixture NAME]
+                                  [--token TOKEN] [--image-dir DIR ...] [--dump-dir DIR]
+  python flasher_service.py submit auto merged.hex [--follow] [--up-to-date tag|verify]
+                                   [--rtt SECONDS [--rtt-pattern REGEX]]
+  python flasher_service.py submit recipe recipe.json [--follow]    依燒錄配方 (見 flash_recipe.py)
+  python flasher_service.py status [JOB_ID]
+  python flasher_service.py logs JOB_ID [--follow]
+  python flasher_service.py cancel JOB_ID
+"""
+
+import argparse
+import hmac
+import ipaddress
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flash_jobs import FlashJob, OPERATIONS, HOST_ONLY_OPERATIONS, LowLevel, PYNRFJPROG_AVAILABLE
+from flash_recipe import Recipe, get_compiled
+from job_history import JobHistory, DEFAULT_DB_PATH
+from image_tag import UP_TO_DATE_MODES
+from swd_speed import DEFAULT_FIXTURE
+from verify_setup import run_diagnostics, failed_checks
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 存取權杖 (服務與用戶端共用)，綁定非本機位址時必須設定
+TOKEN_ENV = 'NRF_FLASHER_TOKEN'
+TOKEN_HEADER = 'X-Flasher-Token'
+
+# 工作可以使用的映像目錄與讀回檔目錄
+GUI_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGE_DIRS = (os.path.join(GUI_DIR, 'hex'), os.path.join(GUI_DIR, 'recipes'),
+                      os.path.join(os.path.dirname(GUI_DIR), 'app_hex'),
+                      os.path.join(os.path.dirname(GUI_DIR), '_build'))
+DEFAULT_DUMP_DIR = os.path.join(GUI_DIR, 'readback')
+
+STATE_QUEUED = 'queued'
+STATE_RUNNING = 'running'
+STATE_SUCCEEDED = 'succeeded'
+STATE_FAILED = 'failed'
+STATE_CANCELLED = 'cancelled'
+FINAL_STATES = (STATE_SUCCEEDED, STATE_FAILED, STATE_CANCELLED)
+
+# 長輪詢最長等待秒數
+MAX_LOG_WAIT = 30
+
+
+class ServiceJob:
+    """服務中的一筆工作：FlashJob 加上狀態與日誌"""
+
+    def __init__(self, job_id, operation, hex_file, sd_file=None, timeout=300, snr=None,
+                 dump_path=None, up_to_date=None, rtt_timeout=0, rtt_pattern=None):
+        self.id = job_id
+        self.operation = operation
+        self.hex_file = hex_file
+        self.sd_file = sd_file
+        self.timeout = timeout
+        self.snr = snr
+        self.dump_path = dump_path
+        self.up_to_date = up_to_date
+        self.rtt_timeout = rtt_timeout
+        self.rtt_pattern = rtt_pattern
+        self.probe = None
+        # 無回應而放棄的探針 (工作改由其他探針執行)
+        self.failed_probes = []
+        self.state = STATE_QUEUED
+        self.progress = 0
+        self.message = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.flash_job = None
+        # 日誌：已合併的文字與之後新增、尚未合併的片段 (讀取時才合併一次)
+        self._log = ''
+        self._log_pending = []
+        self._log_len = 0
+        self._cond = threading.Condition()
+
+    def append_log(self, text):
+        with self._cond:
+            self._log_pending.append(text)
+            self._log_len += len(text)
+            self._cond.notify_all()
+
+    def read_log(self, offset, wait=0):
+        """讀取 offset 之後的日誌，沒有新內容時最多等待 wait 秒"""
+        deadline = time.monotonic() + min(wait, MAX_LOG_WAIT)
+        with self._cond:
+            while self._log_len <= offset and self.state not in FINAL_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._log_pending:
+                self._log += ''.join(self._log_pending)
+                self._log_pending = []
+            text = self._log[offset:]
+            return text, offset + len(text), self.state in FINAL_STATES
+
+    def set_state(self, state, message=None):
+        with self._cond:
+            self.state = state
+            if message is not None:
+                self.message = message
+            if state == STATE_RUNNING:
+                self.started = time.time()
+            elif state in FINAL_STATES:
+                self.finished = time.time()
+            self._cond.notify_all()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'operation': self.operation,
+            'hex_file': self.hex_file,
+            'sd_file': self.sd_file,
+            'timeout': self.timeout,
+            'snr': self.snr,
+            'dump_path': self.dump_path,
+            'up_to_date': self.up_to_date,
+            'rtt_timeout': self.rtt_timeout,
+            'rtt_pattern': self.rtt_pattern,
+            'probe': self.probe,
+            'failed_probes': self.failed_probes,
+            'state': self.state,
+            'progress': self.progress,
+            'message': self.message,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobManager:
+    """工作佇列：每個探針一個工作執行緒，不需探針的工作另外執行
+
+    等待中的工作依提交順序排列，新工作只喚醒可以執行它的探針執行緒；
+    探針步驟逾時且重試後仍無回應時，未指定探針的工作會改由其他空閒探針執行
+    """
+
+    def __init__(self, probes, history=None, fixture=None, image_dirs=DEFAULT_IMAGE_DIRS,
+                 dump_dir=DEFAULT_DUMP_DIR):
+        # probes 為空時使用單一執行緒並連接第一個探針
+        self.probes = list(probes) or [None]
+        self.history = history
+        self.image_dirs = [os.path.realpath(d) for d in image_dirs]
+        self.dump_dir = os.path.realpath(dump_dir)
+        # 治具名稱 (SWD 時脈依探針序號 + 治具快取)
+        self.fixture = fixture
+        self.busy = {snr: None for snr in self.probes}
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # 等待中的工作 (依工作編號排序)；每個探針執行緒有自己的 Condition (共用 _lock)
+        self._pending = []
+        self._wakeups = {snr: threading.Condition(self._lock) for snr in self.probes}
+        for snr in self.probes:
+            threading.Thread(target=self._worker, args=(snr,), daemon=True,
+                             name=f"probe-{snr}").start()
+
+    def submit(self, operation, hex_file, sd_file=None, timeout=300, snr=None, dump_path=None,
+               up_to_date=None, rtt_timeout=0, rtt_pattern=None):
+        if operation not in OPERATIONS:
+            raise ValueError(f"未知的操作: {operation}")
+        if snr is not None and snr not in self.probes:
+            raise ValueError(f"探針 {snr} 不屬於此服務")
+        if up_to_date is not None and up_to_date not in UP_TO_DATE_MODES:
+            raise ValueError(f"未知的 up_to_date: {up_to_date}")
+        if rtt_pattern:
+            re.compile(rtt_pattern)
+        hex_file = self.image_path(hex_file)
+        sd_file = self.image_path(sd_file)
+        if dump_path:
+            dump_path = self.dump_file(dump_path)
+        if operation == 'recipe':
+            # 提交時就編譯配方：配方錯誤立即回報，之後的工作共用已準備的映像
+            try:
+                for image in Recipe.load(hex_file).images:
+                    self.image_path(image)
+                get_compiled(hex_file)
+            except OSError as e:
+                raise ValueError(f"無法讀取配方: {e}") from None
+        with self._lock:
+            job = ServiceJob(next(self._ids), operation, hex_file, sd_file, timeout, snr, dump_path,
+                             up_to_date, rtt_timeout, rtt_pattern)
+            self.jobs[job.id] = job
+        if operation in HOST_ONLY_OPERATIONS:
+            threading.Thread(target=self._execute, args=(job, None, False), daemon=True).start()
+        else:
+            self._enqueue(job)
+        return job
+
+    def image_path(self, path):
+        """映像 (或配方) 需位於映像目錄中，回傳實際路徑；空白表示未指定"""
+        if not path:
+            return path
+        real = os.path.realpath(path)
+        if not any(_inside(real, d) for d in self.image_dirs):
+            raise ValueError(f"{path} 不在允許的映像目錄中 ({', '.join(self.image_dirs)})")
+        return real
+
+    def dump_file(self, path):
+        """讀回檔一律存在讀回目錄中 (只取檔名)"""
+        name = os.path.basename(str(path).replace('\\', '/'))
+        if not name or name in ('.', '..'):
+            raise ValueError(f"無效的讀回檔名: {path}")
+        os.makedirs(self.dump_dir, exist_ok=True)
+        return os.path.join(self.dump_dir, name)
+
+    def _enqueue(self, job):
+        """依工作編號放入等待清單，並喚醒可以執行此工作的探針執行緒"""
+        with self._lock:
+            index = len(self._pending)
+            while index > 0 and self._pending[index - 1].id > job.id:
+                index -= 1
+            self._pending.insert(index, job)
+            for snr, wakeup in self._wakeups.items():
+                if self._can_take(job, snr):
+                    wakeup.notify()
+
+    @staticmethod
+    def _can_take(job, snr):
+        return (job.snr is None or job.snr == snr) and snr not in job.failed_probes
+
+    def _take(self, snr):
+        """取出此探針可以執行的第一個工作 (呼叫時需持有 _lock)，沒有時回傳 None"""
+        for job in list(self._pending):
+            if job.state == STATE_CANCELLED:
+                self._pending.remove(job)
+            elif self._can_take(job, snr):
+                self._pending.remove(job)
+                return job
+        return None
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.state == STATE_QUEUED:
+                if job in self._pending:
+                    self._pending.remove(job)
+                job.set_state(STATE_CANCELLED, "工作已取消")
+            elif job.state == STATE_RUNNING and job.flash_job:
+                job.flash_job.stop_operation()
+                job.append_log("\n⚠ 收到取消要求，正在停止...\n")
+        return job
+
+    def probe_status(self):
+        with self._lock:
+            return [{'snr': snr, 'job': job_id} for snr, job_id in self.busy.items()]
+
+    def _worker(self, snr):
+        wakeup = self._wakeups[snr]
+        while True:
+            # 指定其他探針的工作、或此探針已放棄的工作留在清單中給其他執行緒
+            with self._lock:
+                job = self._take(snr)
+                while job is None:
+                    wakeup.wait()
+                    job = self._take(snr)
+            self._execute(job, snr)
+
+    def _execute(self, job, snr, uses_probe=True):
+        with self._lock:
+            if job.state == STATE_CANCELLED:
+                return
+            flash_job = FlashJob(job.hex_file, job.operation, job.sd_file, job.timeout,
+                                 snr=job.snr if job.snr is not None else snr,
+                                 history=self.history, dump_path=job.dump_path,
+                                 up_to_date=job.up_to_date, rtt_timeout=job.rtt_timeout,
+                                 rtt_pattern=job.rtt_pattern, fixture=self.fixture)
+            job.flash_job = flash_job
+            job.probe = snr
+            if uses_probe:
+                self.busy[snr] = job.id
+            job.set_state(STATE_RUNNING)
+
+        result = {}
+
+        def on_progress(value):
+            job.progress = value
+
+        def on_finished(success, message):
+            result['success'] = success
+            result['message'] = message
+
+        flash_job.output_signal.connect(job.append_log)
+        flash_job.progress_signal.connect(on_progress)
+        flash_job.finished_signal.connect(on_finished)
+        try:
+            flash_job.run()
+        except Exception as e:
+            result.setdefault('success', False)
+            result.setdefault('message', f"錯誤: {str(e)}")
+
+        message = result.get('message', "工作未回報結果")
+        if uses_probe and self._failover(job, snr, flash_job, message):
+            return
+        if flash_job.stop_requested and not result.get('success'):
+            state = STATE_CANCELLED
+        else:
+            state = STATE_SUCCEEDED if result.get('success') else STATE_FAILED
+        job.append_log(f"\n[{state}] {message}\n")
+        with self._lock:
+            if uses_probe:
+                self.busy[snr] = None
+            job.set_state(state, message)
+
+    def _failover(self, job, snr, flash_job, message):
+        """探針無回應時把工作放回佇列給其他探針；回傳是否已轉移"""
+        if not flash_job.probe_failure or flash_job.stop_requested or job.snr is not None:
+            return False
+        others = [p for p in self.probes if p is not None and p != snr and p not in job.failed_probes]
+        if not others:
+            return False
+        job.append_log(f"\n⚠ 探針 {snr} 無回應 ({message})，工作改由其他探針執行\n")
+        with self._lock:
+            job.failed_probes.append(snr)
+            self.busy[snr] = None
+            job.set_state(STATE_QUEUED)
+        self._enqueue(job)
+        return True
+
+
+def _inside(path, directory):
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        # Windows 上不同磁碟機
+        return False
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP 請求處理 (設定 token 時每個請求都需要帶相同的權杖)"""
+    manager = None
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _route(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = urllib.parse.parse_qs(url.query)
+        return parts, query
+
+    def _job_or_404(self, parts):
+        try:
+            job = self.manager.get(int(parts[1]))
+        except ValueError:
+            job = None
+        if job is None:
+            self._send_json(404, {'error': '找不到工作'})
+        return job
+
+    def _authorized(self):
+        if not self.token:
+            return True
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.token):
+            return True
+        self._send_json(401, {'error': '存取權杖錯誤'})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts, query = self._route()
+        if parts == ['probes']:
+            self._send_json(200, {'probes': self.manager.probe_status()})
+        elif parts == ['jobs']:
+            self._send_json(200, {'jobs': self.manager.list()})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self._job_or_404(parts)
+            if job:
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'log':
+            job = self._job_or_404(parts)
+            if job:
+                try:
+                    offset = max(0, int(query.get('offset', ['0'])[0]))
+                    wait = float(query.get('wait', ['0'])[0])
+                    if not math.isfinite(wait):
+                        raise ValueError(wait)
+                except ValueError:
+                    self._send_json(400, {'error': 'offset / wait 需為數字'})
+                    return
+                text, offset, done = job.read_log(offset, wait)
+                self._send_json(200, {'text': text, 'offset': offset, 'done': done,
+                                      'state': job.state, 'progress': job.progress})
+        else:
+            self._send_json(404, {'error': '未知的路徑'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts, _ = self._route()
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json(400, {'error': 'JSON 格式錯誤'})
+            return
+        if parts == ['jobs']:
+            try:
+                job = self.manager.submit(
+                    payload.get('operation', 'flash'),
+                    payload.get('hex_file', ''),
+                    payload.get('sd_file'),
+                    int(payload.get('timeout', 300)),
+                    payload.get('snr'),
+                    payload.get('dump_path'),
+                    payload.get('up_to_date'),
+                    float(payload.get('rtt_timeout') or 0),
+                    payload.get('rtt_pattern'))
+            except (ValueError, TypeError, re.error) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            self._send_json(201, job.to_dict())
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self._job_or_404(parts)
+            if job:
+                self.manager.cancel(job.id)
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {'error': '未知的路徑'})
+
+
+def discover_probes():
+    """列出目前連接的探針序號"""
+    if not PYNRFJPROG_AVAILABLE:
+        return []
+    try:
+        with LowLevel.API('NRF52') as api:
+            return list(api.enum_emu_snr() or [])
+    except Exception as e:
+        print(f"警告: 無法列舉探針: {e}")
+        return []
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, probes=None, history=None, fixture=None,
+                  token=None, image_dirs=DEFAULT_IMAGE_DIRS, dump_dir=DEFAULT_DUMP_DIR):
+    """建立 HTTP 服務 (尚未開始 serve_forever)；非本機位址沒有權杖時拋出 ValueError"""
+    if not is_loopback(host) and not token:
+        raise ValueError(f"綁定 {host} 需要存取權杖 (--token 或環境變數 {TOKEN_ENV})")
+    manager = JobManager(probes if probes is not None else discover_probes(), history, fixture,
+                         image_dirs, dump_dir)
+    handler = type('BoundServiceHandler', (ServiceHandler,), {'manager': manager, 'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.manager = manager
+    return server
+
+
+class FlasherClient:
+    """燒錄服務用戶端"""
+
+    def __init__(self, base_url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=10, token=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+
+    def _request(self, method, path, payload=None, timeout=None):
+        data = None
+        headers = {}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read().decode('utf-8')).get('error', str(e))
+            except ValueError:
+                error = str(e)
+            raise RuntimeError(f"服務錯誤 ({e.code}): {error}") from None
+
+    def probes(self):
+        return self._request('GET', '/probes')['probes']
+
+    def jobs(self):
+        return self._request('GET', '/jobs')['jobs']
+
+    def submit(self, operation, hex_file, sd_file=None, timeout=300, snr=None, dump_path=None,
+               up_to_date=None, rtt_timeout=0, rtt_pattern=None):
+        return self._request('POST', '/jobs', {
+            'operation': operation, 'hex_file': hex_file, 'sd_file': sd_file,
+            'timeout': timeout, 'snr': snr, 'dump_path': dump_path, 'up_to_date': up_to_date,
+            'rtt_timeout': rtt_timeout, 'rtt_pattern': rtt_pattern})
+
+    def status(self, job_id):
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def log(self, job_id, offset=0, wait=0):
+        return self._request('GET', f'/jobs/{job_id}/log?offset={offset}&wait={wait}',
+                             timeout=self.timeout + wait)
+
+    def cancel(self, job_id):
+        return self._request('POST', f'/jobs/{job_id}/cancel')
+
+    def follow(self, job_id, wait=5):
+        """逐段產生日誌 (text, progress)，工作結束後停止"""
+        offset = 0
+        while True:
+            chunk = self.log(job_id, offset, wait)
+            offset = chunk['offset']
+            yield chunk['text'], chunk['progress']
+            if chunk['done']:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="nRF52 本機燒錄服務")
+    parser.add_argument('--url', default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", help="服務位址 (用戶端指令)")
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f"存取權杖 (預設為環境變數 {TOKEN_ENV})")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help="啟動服務")
+    serve.add_argument('--host', default=DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--probe', type=int, action='append', help="只使用指定的探針序號 (可重複)")
+    serve.add_argument('--db', default=str(DEFAULT_DB_PATH), help="工作歷史資料庫")
+    serve.add_argument('--fixture', help="治具名稱 (SWD 時脈依探針與治具快取，預設為 NRF_FIXTURE)")
+    serve.add_argument('--image-dir', action='append', default=[],
+                       help="另外允許的映像目錄 (可重複)")
+    serve.add_argument('--dump-dir', default=DEFAULT_DUMP_DIR, help="讀回檔目錄")
+
+    submit = sub.add_parser('submit', help="提交工作")
+    submit.add_argument('operation', choices=OPERATIONS)
+    submit.add_argument('hex_file', nargs='?', default='')
+    submit.add_argument('--sd', dest='sd_file')
+    submit.add_argument('--timeout', type=int, default=300)
+    submit.add_argument('--snr', type=int)
+    submit.add_argument('--dump', dest='dump_path', help="讀回 (readback) 的輸出檔")
+    submit.add_argument('--up-to-date', choices=UP_TO_DATE_MODES,
+                        help="UICR 韌體標記與映像相同時略過 (verify: 另外比對每頁雜湊)")
+    submit.add_argument('--rtt', dest='rtt_timeout', type=float, default=0,
+                        help="重置後擷取 RTT 日誌的秒數")
+    submit.add_argument('--rtt-pattern', help="RTT 出現此樣式 (正規表示式) 時停止")
+    submit.add_argument('--follow', action='store_true', help="持續輸出日誌直到結束")
+
+    status = sub.add_parser('status', help="查詢工作狀態")
+    status.add_argument('job_id', nargs='?', type=int)
+
+    logs = sub.add_parser('logs', help="輸出工作日誌")
+    logs.add_argument('job_id', type=int)
+    logs.add_argument('--follow', action='store_true')
+
+    cancel = sub.add_parser('cancel', help="取消工作")
+    cancel.add_argument('job_id', type=int)
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            server = create_server(args.host, args.port, args.probe, JobHistory(args.db), args.fixture,
+                                   args.token, list(DEFAULT_IMAGE_DIRS) + args.image_dir, args.dump_dir)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return 1
+        probes = ', '.join(str(p) for p in server.manager.probes if p is not None) or "自動"
+        fixture = args.fixture or DEFAULT_FIXTURE
+        print(f"燒錄服務啟動於 http://{args.host}:{args.port} (探針: {probes}, 治具: {fixture})")
+        for check in failed_checks(run_diagnostics()):
+            print(f"⚠ 環境檢查: {check['detail']}" + (f" (修復: {check['fix']})" if check.get('fix') else ""))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    client = FlasherClient(args.url, token=args.token)
+    try:
+        if args.command == 'submit':
+            job = client.submit(args.operation, args.hex_file, args.sd_file, args.timeout, args.snr,
+                                args.dump_path, args.up_to_date, args.rtt_timeout, args.rtt_pattern)
+            print(f"工作 {job['id']} 已提交 ({job['state']})")
+            if not args.follow:
+                return 0
+            job_id = job['id']
+        elif args.command == 'status':
+            jobs = [client.status(args.job_id)] if args.job_id else client.jobs()
+            for job in jobs:
+                print(f"{job['id']:>5}  {job['operation']:<15} {job['state']:<10} "
+                      f"{job['progress']:>3}%  探針 {job['probe']}  {job['message']}")
+            return 0
+        elif args.command == 'cancel':
+            job = client.cancel(args.job_id)
+            print(f"工作 {job['id']}: {job['state']}")
+            return 0
+        else:
+            job_id = args.job_id
+            if not args.follow:
+                print(client.log(job_id)['text'], end='')
+                return 0
+
+        for text, _ in client.follow(job_id):
+            print(text, end='', flush=True)
+        return 0 if client.status(job_id)['state'] == STATE_SUCCEEDED else 1
+    except (OSError, RuntimeError) as e:
+        print(f"✗ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+韌體庫索引
+記錄 hex 目錄與 app_hex/ 中每個映像檔的晶片、位址範圍、SoftDevice/App 分界與雜湊
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+INDEX_VERSION = 1
+
+# SoftDevice 資訊結構 (MBR 之後 0x2000)
+SD_INFO_ADDR = 0x3000
+SD_MAGIC = 0x51B1E5DB
+SD_ID_CHIPS = {132: 'nrf52832', 140: 'nrf52840'}
+
+# App 向量表第一個字 (初始堆疊指標) 對應的 RAM 大小
+STACK_TOP_CHIPS = {0x20010000: 'nrf52832', 0x20040000: 'nrf52840'}
+
+KIND_MERGED = 'merged'
+KIND_SOFTDEVICE = 'softdevice'
+KIND_APP = 'app'
+
+
+def parse_hex_segments(path):
+    """解析 Intel HEX，回傳依位址排序且已合併的 [起始位址, bytearray] 清單"""
+    segments = []
+    base = 0
+    cur_start = None
+    cur_data = None
+
+    with open(path, 'r', encoding='ascii') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] != ':':
+                raise ValueError(f"{path}:{line_no}: 不是 Intel HEX 記錄")
+            record = bytes.fromhex(line[1:])
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise ValueError(f"{path}:{line_no}: 記錄長度錯誤")
+            if sum(record) & 0xFF:
+                raise ValueError(f"{path}:{line_no}: 校驗和錯誤")
+
+            rec_type = record[3]
+            data = record[4:-1]
+            if rec_type == 0x00:
+                addr = base + ((record[1] << 8) | record[2])
+                if cur_data is not None and addr == cur_start + len(cur_data):
+                    cur_data += data
+                else:
+                    if cur_data is not None:
+                        segments.append([cur_start, cur_data])
+                    cur_start = addr
+                    cur_data = bytearray(data)
+            elif rec_type == 0x01:
+                break
+            elif rec_type == 0x02:
+                base = int.from_bytes(data, 'big') << 4
+            elif rec_type == 0x04:
+                base = int.from_bytes(data, 'big') << 16
+            # 0x03 / 0x05 為起始位址記錄，與燒錄內容無關
+
+    if cur_data is not None:
+        segments.append([cur_start, cur_data])
+
+    # 記錄不一定依位址排列，排序後再合併相鄰區段
+    segments.sort(key=lambda s: s[0])
+    merged = []
+    for start, data in segments:
+        if merged and start == merged[-1][0] + len(merged[-1][1]):
+            merged[-1][1] += data
+        elif merged and start < merged[-1][0] + len(merged[-1][1]):
+            raise ValueError(f"{path}: 位址 0x{start:08X} 重疊")
+        else:
+            merged.append([start, data])
+    return merged
+
+
+def segments_hash(segments):
+    """以內容 (位址 + 資料) 計算 SHA-256，與 HEX 行長度等格式無關"""
+    h = hashlib.sha256()
+    for start, data in segments:
+        h.update(struct.pack('<II', start, len(data)))
+        h.update(data)
+    return h.hexdigest()
+
+
+class FirmwareImage:
+    """記憶體中的映像：只保存有資料的區段，每段為一塊連續的 bytearray
+
+    區段之間的空白 (例如 SoftDevice 與 App 之間) 不佔記憶體。建立後內容不再變動，
+    可以在多個執行緒間共用；view() 與 page_views() 回傳唯讀 memoryview，不複製資料
+    """
+
+    __slots__ = ('path', 'segments', 'starts', 'data_size', '_hash')
+
+    def __init__(self, segments, path=None):
+        self.path = path
+        self.segments = tuple((start, data) for start, data in segments)
+        self.starts = [start for start, _ in self.segments]
+        self.data_size = sum(len(data) for _, data in self.segments)
+        self._hash = None
+
+    @classmethod
+    def load(cls, path):
+        return cls(parse_hex_segments(path), str(path))
+
+    @property
+    def start(self):
+        return self.segments[0][0] if self.segments else None
+
+    @property
+    def end(self):
+        """最後一個位元組之後的位址"""
+        if not self.segments:
+            return None
+        start, data = self.segments[-1]
+        return start + len(data)
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = segments_hash(self.segments)
+        return self._hash
+
+    def __len__(self):
+        return self.data_size
+
+    def view(self, addr, length):
+        """addr 起 length 位元組的唯讀 memoryview，不在同一區段內時回傳 None"""
+        index = bisect.bisect_right(self.starts, addr) - 1
+        if index >= 0:
+            start, data = self.segments[index]
+            if addr + length <= start + len(data):
+                return memoryview(data)[addr - start:addr - start + length].toreadonly()
+        return None
+
+    def read_word(self, addr):
+        """讀取一個 32 位元字，不存在時回傳 None"""
+        view = self.view(addr, 4)
+        return None if view is None else struct.unpack('<I', view)[0]
+
+    def page_views(self, page_size):
+        """依位址產生 (位址, memoryview)，每一塊都不跨頁"""
+        for start, data in self.segments:
+            view = memoryview(data).toreadonly()
+            offset = 0
+            while offset < len(data):
+                addr = start + offset
+                length = min(page_size - addr % page_size, len(data) - offset)
+                yield addr, view[offset:offset + length]
+                offset += length
+
+    def memory_size(self):
+        """資料佔用的記憶體 (位元組，含 bytearray 預留的空間)"""
+        return sum(sys.getsizeof(data) for _, data in self.segments)
+
+
+def describe_image(path):
+    """分析映像檔內容並回傳索引項目"""
+    path = Path(path)
+    image = FirmwareImage.load(path)
+    segments = image.segments
+    stat = path.stat()
+
+    entry = {
+        'path': str(path),
+        'name': path.name,
+        'build': path.stem,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': image.hash,
+        'start': image.start,
+        'end': image.end,
+        'data_size': image.data_size,
+        'chip': None,
+        'sd_id': None,
+        'sd_version': None,
+        'sd_size': None,
+        'app_start': None,
+        'app_size': 0,
+        'kind': None,
+    }
+
+    sd_size = None
+    if image.read_word(SD_INFO_ADDR + 4) == SD_MAGIC:
+        sd_size = image.read_word(SD_INFO_ADDR + 8)
+        sd_id = image.read_word(SD_INFO_ADDR + 0x10)
+        sd_ver = image.read_word(SD_INFO_ADDR + 0x14)
+        entry['sd_id'] = sd_id
+        entry['sd_size'] = sd_size
+        if sd_ver is not None:
+            entry['sd_version'] = f"{sd_ver // 1000000}.{sd_ver // 1000 % 1000}.{sd_ver % 1000}"
+        entry['chip'] = SD_ID_CHIPS.get(sd_id)
+
+    if sd_size is not None:
+        app_bytes = sum(len(d) for s, d in segments if s >= sd_size)
+        if app_bytes:
+            entry['app_start'] = min(s for s, _ in segments if s >= sd_size)
+            entry['app_size'] = app_bytes
+        entry['kind'] = KIND_MERGED if app_bytes else KIND_SOFTDEVICE
+    elif segments:
+        entry['app_start'] = segments[0][0]
+        entry['app_size'] = entry['data_size']
+        entry['kind'] = KIND_APP
+
+    if entry['chip'] is None and entry['app_start'] is not None:
+        entry['chip'] = STACK_TOP_CHIPS.get(image.read_word(entry['app_start']))
+
+    return entry
+
+
+def describe_label(entry):
+    """組合下拉選單顯示文字"""
+    parts = []
+    if entry.get('chip'):
+        parts.append(entry['chip'].replace('nrf', 'nRF'))
+    if entry.get('sd_id'):
+        parts.append(f"S{entry['sd_id']} {entry.get('sd_version') or ''}".strip())
+    if entry.get('app_start') is not None and entry.get('app_size'):
+        parts.append(f"App@0x{entry['app_start']:05X}")
+    parts.append(f"{entry['data_size'] / 1024:.0f} KB")
+    folder = Path(entry['path']).parent.name
+    return f"{folder}/{entry['name']}  [{' | '.join(parts)}]"
+
+
+class FirmwareLibrary:
+    """持久化的韌體索引，依檔案大小與修改時間增量更新"""
+
+    def __init__(self, index_path, directories):
+        self.index_path = Path(index_path)
+        self.directories = [Path(d) for d in directories]
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """讀取索引檔，格式不符時視為空索引"""
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self._entries = {e['path']: e for e in data.get('images', [])}
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        """寫入索引檔 (先寫暫存檔再取代，避免中斷時損毀)"""
+        with self._lock:
+            images = sorted(self._entries.values(), key=lambda e: e['path'])
+        tmp_path = self.index_path.with_suffix('.tmp')
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'images': images}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self, directories=None):
+        """掃描目錄並只重新解析有變動的檔案，回傳 (新增/更新, 移除, 錯誤) 清單"""
+        directories = [Path(d) for d in directories] if directories else self.directories
+        changed, removed, errors = [], [], []
+
+        for directory in directories:
+            present = set()
+            if directory.exists():
+                for hex_path in sorted(directory.glob("*.hex")):
+                    key = str(hex_path)
+                    present.add(key)
+                    try:
+                        stat = hex_path.stat()
+                    except OSError:
+                        continue
+                    with self._lock:
+                        old = self._entries.get(key)
+                    if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                        continue
+                    try:
+                        entry = describe_image(hex_path)
+                    except (OSError, ValueError) as e:
+                        errors.append((key, str(e)))
+                        continue
+                    with self._lock:
+                        self._entries[key] = entry
+                    changed.append(key)
+
+            prefix = str(directory) + os.sep
+            with self._lock:
+                for key in list(self._entries):
+                    if key.startswith(prefix) and os.sep not in key[len(prefix):] and key not in present:
+                        del self._entries[key]
+                        removed.append(key)
+
+        if changed or removed:
+            self.save()
+        return changed, removed, errors
+
+    def entries(self, kind=None, chip=None):
+        """依種類與晶片篩選索引項目"""
+        with self._lock:
+            items = list(self._entries.values())
+        if kind:
+            items = [e for e in items if e['kind'] == kind]
+        if chip:
+            items = [e for e in items if e['chip'] in (chip, None)]
+        return sorted(items, key=lambda e: (e['kind'] or '', e['name'], e['path']))
+
+    def get(self, path):
+        """取得指定路徑的索引項目"""
+        with self._lock:
+            return self._entries.get(str(path))
+
+    def find_by_hash(self, image_hash):
+        """依內容雜湊尋找映像"""
+        with self._lock:
+            return [e for e in self._entries.values() if e['hash'] == image_hash]
+
+
+def chip_from_device_version(version):
+    """將 pynrfjprog 的裝置版本字串轉成晶片名稱"""
+    text = str(version).upper()
+    for chip in ('nrf52832', 'nrf52840'):
+        if chip[3:] in text:
+            return chip
+    return None
+
+
+if __name__ == '__main__':
+    root = Path(__file__).parent
+    library = FirmwareLibrary(
+        root / "hex" / "library_index.json",
+        [root / "hex" / "merge", root / "hex" / "softdevice", root / "hex" / "app",
+         root.parent / "app_hex"])
+    _, _, errs = library.refresh()
+    for e in library.entries():
+        print(f"{e['kind']:<10} {describe_label(e)}  {e['hash'][:12]}")
+    for path, err in errs:
+        print(f"錯誤 {path}: {err}")
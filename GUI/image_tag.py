@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+UICR 韌體標記
+燒錄完成後在 UICR CUSTOMER[0..7] 寫入映像雜湊、燒錄工具版本與時間；
+下次燒錄前先讀取標記，與選擇的映像相同時可以直接略過 (或只做頁面雜湊比對)。
+
+標記 (32 位元組, little endian):
+  I 魔術字 + B B 工具版本 + H 保留 + 16s 映像 SHA-256 前 16 位元組
+  + I 燒錄時間 (Unix 秒) + I 前 28 位元組的 CRC32
+
+UICR 只能在擦除後寫入一次：目前位置不是空白時 (部分燒錄未擦除 UICR)，
+把魔術字清為 0 讓舊標記失效，不會留下與內容不符的標記。
+"""
+
+import hashlib
+import struct
+import time
+import zlib
+
+from flash_pipeline import PAGE_SIZE
+
+# UICR CUSTOMER[0] (韌體未使用)
+TAG_ADDR = 0x10001080
+TAG_MAGIC = 0x4754464E  # 'NFTG'
+TAG_FORMAT = struct.Struct('<IBBH16sI')
+TAG_SIZE = TAG_FORMAT.size + 4
+
+# 寫入標記的燒錄工具版本 (標記格式或燒錄流程有變動時遞增)
+TOOL_VERSION = (1, 0)
+
+# 已是相同韌體時的處理方式
+UP_TO_DATE_TAG = 'tag'          # 標記相同即略過
+UP_TO_DATE_VERIFY = 'verify'    # 標記相同時再比對每頁雜湊
+UP_TO_DATE_MODES = (UP_TO_DATE_TAG, UP_TO_DATE_VERIFY)
+
+
+class ImageTag:
+    """UICR 中的韌體標記"""
+
+    __slots__ = ('image_hash', 'tool_version', 'timestamp')
+
+    def __init__(self, image_hash, tool_version=TOOL_VERSION, timestamp=None):
+        self.image_hash = image_hash
+        self.tool_version = tuple(tool_version)
+        self.timestamp = int(time.time() if timestamp is None else timestamp)
+
+    def pack(self):
+        body = TAG_FORMAT.pack(TAG_MAGIC, self.tool_version[0], self.tool_version[1], 0,
+                               bytes.fromhex(self.image_hash)[:16], self.timestamp)
+        return body + struct.pack('<I', zlib.crc32(body))
+
+    @classmethod
+    def unpack(cls, raw):
+        """解析讀回的內容；沒有標記、已失效或 CRC 錯誤時回傳 None"""
+        raw = bytes(raw)
+        if len(raw) < TAG_SIZE:
+            return None
+        body = raw[:TAG_FORMAT.size]
+        magic, major, minor, _, digest, timestamp = TAG_FORMAT.unpack(body)
+        if magic != TAG_MAGIC or struct.unpack_from('<I', raw, TAG_FORMAT.size)[0] != zlib.crc32(body):
+            return None
+        return cls(digest.hex(), (major, minor), timestamp)
+
+    def matches(self, image_hash):
+        return bytes.fromhex(image_hash)[:16].hex() == self.image_hash
+
+    def describe(self):
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.timestamp))
+        return (f"映像 {self.image_hash[:16]}, 工具 v{self.tool_version[0]}.{self.tool_version[1]}, "
+                f"燒錄於 {when}")
+
+
+def is_blank(raw):
+    return all(b == 0xFF for b in raw)
+
+
+def overlaps_tag(firmware):
+    """映像本身有資料落在標記位置時不寫入標記"""
+    return any(start < TAG_ADDR + TAG_SIZE and TAG_ADDR < start + len(data)
+               for start, data in firmware.segments)
+
+
+def read_tag(api):
+    """讀取標記，回傳 (ImageTag 或 None, 原始內容)"""
+    raw = bytes(api.read(TAG_ADDR, TAG_SIZE))
+    return ImageTag.unpack(raw), raw
+
+
+def write_tag(api, image_hash):
+    """寫入標記；位置不是空白時讓舊標記失效並回傳 False"""
+    tag, raw = read_tag(api)
+    if is_blank(raw):
+        api.write(TAG_ADDR, ImageTag(image_hash).pack(), True)
+        return True
+    if tag is not None and tag.matches(image_hash):
+        return True
+    invalidate_tag(api, raw)
+    return False
+
+
+def invalidate_tag(api, raw=None):
+    """把魔術字清為 0 (Flash 只能把位元由 1 寫成 0，不需要擦除)"""
+    if raw is None:
+        raw = bytes(api.read(TAG_ADDR, 4))
+    if struct.unpack_from('<I', raw)[0] != 0:
+        api.write(TAG_ADDR, bytes(4), True)
+
+
+def verify_pages(api, image, stop_check=None):
+    """讀回映像涵蓋的每一頁並比對雜湊，回傳不一致的頁首位址清單"""
+    mismatched = []
+    for page in image.iter_pages(stop_check=stop_check):
+        if stop_check and stop_check():
+            break
+        data = bytes(api.read(page.addr, len(page.data)))
+        if hashlib.sha256(data).digest() != page.digest:
+            mismatched.append(page.addr & ~(PAGE_SIZE - 1))
+    return mismatched
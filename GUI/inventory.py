@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+目標裝置清點
+同時連接所有 J-Link 探針，讀取 FICR (晶片型號、變體、封裝、Flash/RAM 大小、
+裝置 ID)、APPROTECT 與 UICR 狀態 (含韌體標記)，並從韌體庫為每個探針選出
+符合晶片的 Merged 映像，避免選錯映像造成燒錄失敗再 Recover。
+
+用法:
+  python inventory.py           列出所有探針
+  python inventory.py --json    以 JSON 輸出
+"""
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import image_tag
+import swd_speed
+from hex_library import FirmwareLibrary, KIND_MERGED, chip_from_device_version
+
+# 導入 pynrfjprog
+try:
+    from pynrfjprog import LowLevel
+    PYNRFJPROG_AVAILABLE = True
+except ImportError:
+    LowLevel = None
+    PYNRFJPROG_AVAILABLE = False
+
+FICR_DEVICEID = 0x10000060
+FICR_INFO_PART = 0x10000100
+FICR_INFO_VARIANT = 0x10000104
+FICR_INFO_PACKAGE = 0x10000108
+FICR_INFO_RAM = 0x1000010C
+FICR_INFO_FLASH = 0x10000110
+
+UICR_START = 0x10001000
+UICR_SIZE = 0x310
+UICR_NRFFW0 = 0x10001014
+UICR_APPROTECT = 0x10001208
+
+PARTS = {0x52832: 'nrf52832', 0x52840: 'nrf52840'}
+PACKAGES = {0x2000: 'QF', 0x2001: 'CH', 0x2002: 'CI', 0x2004: 'QI', 0x2005: 'CK'}
+
+
+def _variant_text(value):
+    """INFO.VARIANT 為 4 個 ASCII 字元 (例如 0x41414530 = 'AAE0')"""
+    text = value.to_bytes(4, 'big').decode('ascii', 'replace')
+    return text if text.isalnum() else f"0x{value:08X}"
+
+
+def read_inventory(api):
+    """從已連線的目標讀取清點資料；讀取保護啟用時只有晶片型號 (若可取得)"""
+    record = {'part': None, 'variant': None, 'package': None, 'flash_kb': None,
+              'ram_kb': None, 'device_id': None, 'protected': swd_speed.is_protected(api),
+              'uicr_words': None, 'bootloader': None, 'tag': None}
+    if record['protected']:
+        try:
+            record['part'] = chip_from_device_version(api.read_device_version())
+        except Exception:
+            pass
+        return record
+
+    part = api.read_u32(FICR_INFO_PART)
+    record['part'] = PARTS.get(part, f"0x{part:X}")
+    record['variant'] = _variant_text(api.read_u32(FICR_INFO_VARIANT))
+    package = api.read_u32(FICR_INFO_PACKAGE)
+    record['package'] = PACKAGES.get(package, f"0x{package:X}")
+    record['flash_kb'] = api.read_u32(FICR_INFO_FLASH)
+    record['ram_kb'] = api.read_u32(FICR_INFO_RAM)
+    low = api.read_u32(FICR_DEVICEID)
+    high = api.read_u32(FICR_DEVICEID + 4)
+    record['device_id'] = f"{high:08X}{low:08X}"
+
+    uicr = bytes(api.read(UICR_START, UICR_SIZE))
+    record['uicr_words'] = sum(1 for i in range(0, len(uicr), 4) if uicr[i:i + 4] != b'\xff' * 4)
+    bootloader = int.from_bytes(uicr[UICR_NRFFW0 - UICR_START:UICR_NRFFW0 - UICR_START + 4], 'little')
+    record['bootloader'] = None if bootloader == 0xFFFFFFFF else bootloader
+    tag, _ = image_tag.read_tag(api)
+    record['tag'] = tag.image_hash if tag else None
+    return record
+
+
+def scan_probe(snr, family='NRF52', speed_cache=None):
+    """連接一個探針並讀取清點資料 (使用快取的 SWD 時脈，不重新校準)"""
+    record = {'snr': snr, 'error': None}
+    cache = speed_cache if speed_cache is not None else swd_speed.SpeedCache()
+    try:
+        with LowLevel.API(family) as api:
+            khz = cache.get(snr)
+            if khz is not None:
+                api.connect_to_emu_with_snr(snr, khz)
+            else:
+                api.connect_to_emu_with_snr(snr)
+            try:
+                record.update(read_inventory(api))
+            finally:
+                api.disconnect_from_emu()
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
+
+def scan_all(probes=None, family='NRF52'):
+    """同時清點所有 (或指定的) 探針，依序號排序回傳"""
+    if not PYNRFJPROG_AVAILABLE:
+        raise RuntimeError("pynrfjprog 未安裝!")
+    if probes is None:
+        with LowLevel.API(family) as api:
+            probes = list(api.enum_emu_snr() or [])
+    if not probes:
+        return []
+    cache = swd_speed.SpeedCache()
+    with ThreadPoolExecutor(max_workers=len(probes)) as pool:
+        records = list(pool.map(lambda snr: scan_probe(snr, family, cache), probes))
+    return sorted(records, key=lambda r: r['snr'])
+
+
+def select_image(library, record, preferred=None):
+    """為探針選擇符合晶片的 Merged 映像
+
+    目前選擇的映像 (preferred) 符合時沿用，否則選最新的；晶片未知時回傳 None
+    """
+    chip = record.get('part')
+    if not chip:
+        return None
+    candidates = [e for e in library.entries(KIND_MERGED) if e['chip'] == chip]
+    for entry in candidates:
+        if entry['path'] == preferred:
+            return entry
+    if not candidates:
+        return None
+    return max(candidates, key=lambda e: e['mtime_ns'])
+
+
+def assign_images(library, records, preferred=None):
+    """record['image'] 設為選出的映像路徑，record['image_current'] 表示韌體標記與該映像相同"""
+    for record in records:
+        entry = select_image(library, record, preferred)
+        record['image'] = entry['path'] if entry else None
+        record['image_current'] = bool(entry and record.get('tag')
+                                       and entry['hash'][:32] == record['tag'])
+    return records
+
+
+def format_table(records):
+    """清點結果表格"""
+    header = (f"{'探針':<12}{'晶片':<10}{'變體':<6}{'封裝':<5}{'Flash':>7}{'RAM':>6}  "
+              f"{'裝置 ID':<17}{'保護':<5}{'UICR':<11}映像")
+    lines = [header, '-' * 100]
+    for r in records:
+        if r.get('error'):
+            lines.append(f"{r['snr']:<12}✗ {r['error']}")
+            continue
+        chip = r['part'].replace('nrf', 'nRF') if r.get('part') else '?'
+        flash = f"{r['flash_kb']}K" if r.get('flash_kb') else '-'
+        ram = f"{r['ram_kb']}K" if r.get('ram_kb') else '-'
+        if r['protected']:
+            uicr = '-'
+        elif r['uicr_words'] == 0:
+            uicr = '空白'
+        else:
+            uicr = '標記' if r['tag'] else f"{r['uicr_words']} 字"
+        image = Path(r['image']).name if r.get('image') else '(韌體庫中沒有符合的映像)'
+        if r.get('image_current'):
+            image += ' (已是此韌體)'
+        lines.append(f"{r['snr']:<12}{chip:<10}{r.get('variant') or '-':<6}{r.get('package') or '-':<5}"
+                     f"{flash:>7}{ram:>6}  {r.get('device_id') or '-':<17}"
+                     f"{'是' if r['protected'] else '否':<5}{uicr:<11}{image}")
+    return '\n'.join(lines)
+
+
+def main():
+    root = Path(__file__).parent
+    library = FirmwareLibrary(
+        root / "hex" / "library_index.json",
+        [root / "hex" / "merge", root / "hex" / "softdevice", root / "hex" / "app",
+         root.parent / "app_hex"])
+    library.refresh()
+    try:
+        records = assign_images(library, scan_all())
+    except RuntimeError as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+    if '--json' in sys.argv:
+        print(json.dumps(records, indent=1))
+    elif not records:
+        print("未找到連接的 J-Link 探針!")
+    else:
+        print(format_table(records))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
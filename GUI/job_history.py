@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+燒錄工作歷史資料庫 (SQLite)
+記錄每一筆工作的探針、裝置 ID、映像雜湊、各步驟耗時與結果，並提供良率與週期時間統計
+
+用法:
+  python job_history.py report [--days 7] [--image HASH] [--operation OP|all] [--db PATH]
+
+統計預設只包含燒錄操作 (FLASH_OPERATIONS)；週期時間不計入韌體相同而略過燒錄的工作
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_DB_PATH = Path(__file__).parent / "job_history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    duration REAL NOT NULL,
+    operation TEXT NOT NULL,
+    probe_snr TEXT,
+    device_id TEXT,
+    image_hash TEXT,
+    image_path TEXT,
+    success INTEGER NOT NULL,
+    message TEXT,
+    error TEXT,
+    timeouts INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    swd_khz INTEGER,
+    fixture TEXT,
+    skipped INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS steps (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    timed_out INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_started ON jobs(started);
+CREATE INDEX IF NOT EXISTS idx_jobs_image ON jobs(image_hash, started);
+CREATE INDEX IF NOT EXISTS idx_jobs_probe ON jobs(probe_snr, started);
+"""
+
+# 舊版資料庫缺少的欄位：(資料表, 欄位, 定義)
+MIGRATIONS = [
+    ('jobs', 'timeouts', "INTEGER NOT NULL DEFAULT 0"),
+    ('jobs', 'retries', "INTEGER NOT NULL DEFAULT 0"),
+    ('steps', 'attempt', "INTEGER NOT NULL DEFAULT 1"),
+    ('steps', 'timed_out', "INTEGER NOT NULL DEFAULT 0"),
+    ('jobs', 'swd_khz', "INTEGER"),
+    ('jobs', 'fixture', "TEXT"),
+    ('jobs', 'skipped', "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# 會燒錄韌體的操作 (統計的預設範圍；驗證、讀回、擦除等工作的耗時不可比較)
+FLASH_OPERATIONS = ('auto', 'flash', 'flash_sd', 'flash_app', 'flash_separate', 'recipe')
+
+# 新增 skipped 欄位時補上舊紀錄：成功但沒有 program 步驟的燒錄工作是略過燒錄
+BACKFILL_SKIPPED = (
+    "UPDATE jobs SET skipped = 1 WHERE success = 1"
+    f" AND operation IN ({', '.join('?' * len(FLASH_OPERATIONS))})"
+    " AND NOT EXISTS (SELECT 1 FROM steps WHERE steps.job_id = jobs.id AND steps.name = 'program')")
+
+
+class JobHistory:
+    """工作歷史資料庫；每次操作開啟獨立連線，可在多個執行緒中使用"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, definition in MIGRATIONS:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    if column == 'skipped':
+                        conn.execute(BACKFILL_SKIPPED, FLASH_OPERATIONS)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, job):
+        """寫入一筆工作 (dict，格式見 FlashJob.history_record)，回傳工作 ID"""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (started, finished, duration, operation, probe_snr, device_id,"
+                " image_hash, image_path, success, message, error, timeouts, retries, swd_khz, fixture,"
+                " skipped) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job['started'], job['finished'], job['finished'] - job['started'],
+                 job['operation'], _text(job.get('probe_snr')), job.get('device_id'),
+                 job.get('image_hash'), job.get('image_path'), int(bool(job['success'])),
+                 job.get('message'), job.get('error'), job.get('timeouts', 0),
+                 job.get('retries', 0), job.get('swd_khz'), job.get('fixture'),
+                 int(bool(job.get('skipped')))))
+            job_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO steps (job_id, seq, name, started, duration, success, error,"
+                " attempt, timed_out) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job_id, seq, s['name'], s['started'], s['duration'], int(bool(s['success'])),
+                  s.get('error'), s.get('attempt', 1), int(bool(s.get('timed_out'))))
+                 for seq, s in enumerate(job.get('steps', []))])
+        return job_id
+
+    def _where(self, since=None, image_hash=None, operation=None, table=''):
+        prefix = f"{table}." if table else ''
+        clauses, params = [], []
+        if since is not None:
+            clauses.append(f"{prefix}started >= ?")
+            params.append(since)
+        if image_hash:
+            clauses.append(f"{prefix}image_hash LIKE ?")
+            params.append(image_hash + '%')
+        if operation:
+            # 單一操作或操作清單
+            operations = (operation,) if isinstance(operation, str) else tuple(operation)
+            clauses.append(f"{prefix}operation IN ({', '.join('?' * len(operations))})")
+            params.extend(operations)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def yield_stats(self, since=None, image_hash=None, operation=None):
+        """良率：回傳 (總數, 成功數, 良率)"""
+        where, params = self._where(since, image_hash, operation)
+        with self._connect() as conn:
+            total, passed = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(success), 0) FROM jobs{where}", params).fetchone()
+        return total, passed, (passed / total if total else None)
+
+    def cycle_time_stats(self, since=None, image_hash=None, operation=None):
+        """成功工作的週期時間 (不含略過燒錄的工作)：回傳 (平均, p95)，單位秒"""
+        where, params = self._where(since, image_hash, operation)
+        done = "success = 1 AND skipped = 0"
+        where = (where + " AND " + done) if where else " WHERE " + done
+        with self._connect() as conn:
+            durations = [row[0] for row in conn.execute(
+                f"SELECT duration FROM jobs{where} ORDER BY duration", params)]
+        if not durations:
+            return None, None
+        return sum(durations) / len(durations), percentile(durations, 0.95)
+
+    def step_stats(self, since=None, image_hash=None, operation=None):
+        """各步驟平均耗時、失敗次數與逾時次數 (平均只計入未逾時的執行)"""
+        where, params = self._where(since, image_hash, operation, table='j')
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT s.name, COUNT(*), AVG(CASE WHEN s.timed_out = 0 THEN s.duration END),"
+                " MAX(s.duration), SUM(1 - s.success), SUM(s.timed_out)"
+                f" FROM steps s JOIN jobs j ON j.id = s.job_id{where}"
+                " GROUP BY s.name ORDER BY 3 DESC", params).fetchall()
+
+    def timeout_stats(self, since=None, image_hash=None, operation=None):
+        """逾時與重試：回傳 (發生逾時的工作數, 逾時總次數, 重試總次數)"""
+        where, params = self._where(since, image_hash, operation)
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COALESCE(SUM(timeouts > 0), 0), COALESCE(SUM(timeouts), 0),"
+                f" COALESCE(SUM(retries), 0) FROM jobs{where}", params).fetchone()
+
+    def slowest_probes(self, since=None, image_hash=None, operation=None, limit=5):
+        """平均週期時間最長的探針：(序號, 工作數, 平均秒數, 失敗數, 最低 SWD 時脈)
+
+        平均秒數不含略過燒錄的工作
+        """
+        where, params = self._where(since, image_hash, operation)
+        where = (where + " AND probe_snr IS NOT NULL") if where else " WHERE probe_snr IS NOT NULL"
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT probe_snr, COUNT(*), AVG(CASE WHEN success = 1 AND skipped = 0 THEN duration END),"
+                f" SUM(1 - success), MIN(swd_khz) FROM jobs{where}"
+                " GROUP BY probe_snr ORDER BY 3 DESC LIMIT ?", params + [limit]).fetchall()
+
+    def recent_jobs(self, limit=20):
+        """最近的工作"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, started, operation, probe_snr, device_id, success, duration, message"
+                " FROM jobs ORDER BY started DESC LIMIT ?", (limit,)).fetchall()
+
+    def report(self, since=None, image_hash=None, operation=FLASH_OPERATIONS):
+        """產生文字統計報告 (operation 為操作或操作清單，None 表示所有操作)"""
+        lines = []
+        total, passed, ratio = self.yield_stats(since, image_hash, operation)
+        scope = time.strftime('%Y-%m-%d %H:%M', time.localtime(since)) + " 之後" if since else "全部"
+        if operation == FLASH_OPERATIONS:
+            scope += ", 燒錄操作"
+        elif operation:
+            scope += ", " + (operation if isinstance(operation, str) else " / ".join(operation))
+        lines.append(f"=== 燒錄統計 ({scope}{', 映像 ' + image_hash[:12] if image_hash else ''}) ===")
+        if not total:
+            lines.append("沒有工作紀錄")
+            return "\n".join(lines) + "\n"
+        lines.append(f"工作數: {total}  成功: {passed}  失敗: {total - passed}  良率: {ratio * 100:.1f}%")
+        mean, p95 = self.cycle_time_stats(since, image_hash, operation)
+        if mean is not None:
+            lines.append(f"週期時間: 平均 {mean:.2f} 秒, p95 {p95:.2f} 秒")
+
+        timed_out_jobs, timeouts, retries = self.timeout_stats(since, image_hash, operation)
+        if timeouts:
+            lines.append(f"逾時: {timeouts} 次 ({timed_out_jobs} 筆工作), 重試: {retries} 次")
+
+        steps = self.step_stats(since, image_hash, operation)
+        if steps:
+            lines.append("步驟耗時:")
+            for name, count, avg, worst, failed, timed_out in steps:
+                avg_text = f"{avg:6.2f}" if avg is not None else "   -  "
+                lines.append(f"  {name:<10} 平均 {avg_text} 秒  最長 {worst:6.2f} 秒  "
+                             f"{count} 次{f', 失敗 {failed}' if failed else ''}"
+                             f"{f', 逾時 {timed_out}' if timed_out else ''}")
+
+        probes = self.slowest_probes(since, image_hash, operation)
+        if probes:
+            lines.append("最慢的探針:")
+            for snr, count, avg, failed, khz in probes:
+                avg_text = f"{avg:6.2f} 秒" if avg is not None else "   無成功"
+                khz_text = f", 最低 SWD {khz} kHz" if khz else ""
+                lines.append(f"  {snr:<12} 平均 {avg_text}  {count} 筆工作, 失敗 {failed}{khz_text}")
+        return "\n".join(lines) + "\n"
+
+
+def percentile(sorted_values, fraction):
+    """已排序數列的百分位數 (線性內插)"""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * fraction
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="燒錄工作歷史統計")
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH))
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help="良率、週期時間與最慢探針")
+    report.add_argument('--days', type=float, help="只統計最近 N 天")
+    report.add_argument('--image', help="只統計指定映像雜湊 (可用前綴)")
+    report.add_argument('--operation', help="只統計指定操作 (all: 所有操作；預設為燒錄操作)")
+    recent = sub.add_parser('recent', help="最近的工作")
+    recent.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    history = JobHistory(args.db)
+    if args.command == 'report':
+        since = time.time() - args.days * 86400 if args.days else None
+        if args.operation is None:
+            operation = FLASH_OPERATIONS
+        else:
+            operation = None if args.operation == 'all' else args.operation
+        print(history.report(since, args.image, operation), end='')
+    else:
+        for job_id, started, op, snr, dev, ok, duration, message in history.recent_jobs(args.limit):
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))
+            print(f"{job_id:>6} {stamp} {op:<15} {snr or '-':<12} {dev or '-':<18} "
+                  f"{'✓' if ok else '✗'} {duration:6.2f}s {message or ''}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
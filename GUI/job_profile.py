@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+燒錄工作效能分析
+取樣式分析器：背景執行緒每隔固定時間讀取所有執行緒的呼叫堆疊
+(sys._current_frames)，涵蓋 Qt 主執行緒、工作執行緒、步驟執行緒 (step-*)
+與映像準備執行緒 (prepare-*)，不需要在每個函式呼叫插入量測，
+對燒錄本身的時間影響很小。
+
+結果存成 pstats 格式 (.prof，可用 python -m pstats 或 snakeviz 開啟)，
+另外產生文字摘要：依類別 (pynrfjprog/J-Link、HEX 處理、Qt 訊號/日誌、等待)
+與執行緒分配的時間，以及最耗時的函式。
+
+用法:
+  python job_profile.py profiles/20250101-120000-123_auto.prof   重新顯示摘要
+"""
+
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+# 依最內層 Python 函式所在的檔案分類
+CATEGORY_J_LINK = "pynrfjprog / J-Link"
+CATEGORY_HEX = "HEX 處理 (解析/合併/雜湊)"
+CATEGORY_QT = "Qt 訊號/日誌"
+CATEGORY_WAIT = "等待 (執行緒/佇列/逾時)"
+CATEGORY_OTHER = "其他 Python"
+
+CATEGORY_FILES = (
+    (CATEGORY_J_LINK, ('pynrfjprog', 'rtt_capture.py', 'readback.py', 'swd_speed.py')),
+    (CATEGORY_HEX, ('hex_library.py', 'flash_pipeline.py', 'intelhex', 'image_tag.py')),
+    (CATEGORY_QT, ('nrf_flasher.py', 'PyQt6')),
+    (CATEGORY_WAIT, ('threading.py', 'queue.py', 'selectors.py', 'deadlines.py')),
+)
+
+
+def categorize(filename):
+    name = filename.replace('\\', '/')
+    for category, patterns in CATEGORY_FILES:
+        if any(p in name for p in patterns):
+            return category
+    return CATEGORY_OTHER
+
+
+def _is_idle(thread_name, frame):
+    """主執行緒停在主程式的 app.exec() (Qt 事件迴圈閒置，沒有執行 Python)"""
+    return (thread_name == 'MainThread' and frame.f_globals.get('__name__') == '__main__'
+            and frame.f_code.co_name in ('main', '<module>'))
+
+
+def _func_key(code):
+    """pstats 的函式鍵 (檔名, 行號, 函式名稱)"""
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class SamplingProfiler:
+    """所有執行緒的取樣式分析器
+
+    start() 後每 interval 秒取樣一次，stop() 後可以 save() 成 pstats 檔
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        # 函式鍵 -> [最內層次數, 出現在堆疊中的次數]
+        self.functions = {}
+        # (被呼叫者, 呼叫者) -> 次數
+        self.callers = {}
+        self.categories = {}
+        self.threads = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self._t0
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(names.get(ident, f"thread-{ident}"), frame)
+
+    def _sample(self, thread_name, frame):
+        if _is_idle(thread_name, frame):
+            return
+        self.samples += 1
+        category = categorize(frame.f_code.co_filename)
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self.threads[thread_name] = self.threads.get(thread_name, 0) + 1
+
+        seen = set()
+        callee = None
+        while frame is not None:
+            key = _func_key(frame.f_code)
+            entry = self.functions.setdefault(key, [0, 0])
+            if callee is None:
+                entry[0] += 1
+            # 遞迴時每個函式在同一個樣本只計一次累計時間
+            if key not in seen:
+                entry[1] += 1
+                seen.add(key)
+            if callee is not None:
+                pair = (callee, key)
+                self.callers[pair] = self.callers.get(pair, 0) + 1
+            callee = key
+            frame = frame.f_back
+
+    def stats(self):
+        """轉成 pstats 的統計 dict：{函式: (cc, nc, tt, ct, {呼叫者: (cc, nc, tt, ct)})}
+
+        取樣沒有呼叫次數，以樣本數代替；時間 = 樣本數 × 取樣間隔
+        """
+        callers = {}
+        for (callee, caller), count in self.callers.items():
+            callers.setdefault(callee, {})[caller] = (count, count, 0.0, count * self.interval)
+        stats = {}
+        for key, (own, total) in self.functions.items():
+            stats[key] = (total, total, own * self.interval, total * self.interval,
+                          callers.get(key, {}))
+        return stats
+
+    def save(self, path):
+        """存成 pstats 格式 (與 cProfile.Profile.dump_stats 相同)"""
+        with open(path, 'wb') as f:
+            marshal.dump(self.stats(), f)
+        return path
+
+    def summary(self, top=TOP_FUNCTIONS):
+        """類別、執行緒與最耗時函式的文字摘要"""
+        seconds = self.samples * self.interval
+        lines = [f"取樣: {self.samples} 次 (每 {self.interval * 1000:g} ms), "
+                 f"工作時間 {self.duration:.2f} 秒, 取樣合計 {seconds:.2f} 執行緒秒", ""]
+        lines.append("依類別 (最內層函式):")
+        lines.extend(_share_lines(self.categories, self.samples, self.interval))
+        lines.append("")
+        lines.append("依執行緒:")
+        lines.extend(_share_lines(self.threads, self.samples, self.interval))
+        lines.append("")
+        if self.samples:
+            stream = io.StringIO()
+            stats = pstats.Stats(_StatsHolder(self.stats()), stream=stream)
+            stats.sort_stats('tottime').print_stats(top)
+            lines.append(f"最耗時的函式 (自身時間前 {top} 名):")
+            lines.append(_table_only(stream.getvalue()))
+        return "\n".join(lines) + "\n"
+
+
+class _StatsHolder:
+    """pstats.Stats 可以直接載入的物件 (與 cProfile.Profile 相同的介面)"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _share_lines(counts, total, interval):
+    lines = []
+    for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+        lines.append(f"  {count * 100 / total:5.1f}%  {count * interval:7.2f} 秒  {name}")
+    return lines
+
+
+def _table_only(text):
+    """去掉 pstats 輸出開頭的檔名與總計行"""
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith('ncalls'):
+            return "\n".join(lines[index:]).rstrip()
+    return text.rstrip()
+
+
+def profile_paths(operation, directory=PROFILE_DIR, started=None, tag=None):
+    """工作的 .prof / .txt (摘要) / .log (工作日誌) 路徑
+
+    檔名包含毫秒與 tag (例如服務的工作編號或探針序號)；同名時加上序號，
+    .prof 以獨佔方式建立，同時結束的工作 (或多個程序) 不會互相覆蓋
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = started or time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(started))
+    stamp += f"-{int(started * 1000) % 1000:03d}"
+    name = f"{stamp}_{operation}" + (f"_{tag}" if tag else "")
+    for index in itertools.count(1):
+        base = os.path.join(directory, name if index == 1 else f"{name}-{index}")
+        try:
+            os.close(os.open(base + '.prof', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return base + '.prof', base + '.txt', base + '.log'
+
+
+def save_job_profile(profiler, operation, log_text, header='', directory=PROFILE_DIR, tag=None):
+    """停止分析並把分析檔、摘要與工作日誌存在一起，回傳 (prof, 摘要, 日誌) 路徑"""
+    if profiler.running:
+        profiler.stop()
+    prof_path, summary_path, log_path = profile_paths(operation, directory, profiler.started, tag)
+    profiler.save(prof_path)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        if header:
+            f.write(header.rstrip('\n') + "\n\n")
+        f.write(profiler.summary())
+    with open(log_path, 'w', encoding='utf-8') as f:
+        f.write(log_text)
+    return prof_path, summary_path, log_path
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        return 1
+    try:
+        stats = pstats.Stats(sys.argv[1])
+    except (OSError, ValueError, EOFError) as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+    summary = os.path.splitext(sys.argv[1])[0] + '.txt'
+    if os.path.exists(summary):
+        with open(summary, encoding='utf-8') as f:
+            print(f.read())
+    else:
+        stats.sort_stats('tottime').print_stats(TOP_FUNCTIONS)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
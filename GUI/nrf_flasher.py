@@ -12,386 +12,117 @@ from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QComboBox, QTextEdit, QFileDialog,
-    QGroupBox, QProgressBar, QMessageBox, QSpinBox
+    QGroupBox, QProgressBar, QMessageBox, QSpinBox, QCheckBox, QLineEdit
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtCore import QThread, pyqtSignal, Qt, QFileSystemWatcher, QTimer
 from PyQt6.QtGui import QFont, QTextCursor, QColor
 
-# 導入 pynrfjprog (使用 pip install pynrfjprog)
-try:
-    from pynrfjprog import HighLevel, LowLevel
-    PYNRFJPROG_AVAILABLE = True
-except ImportError as e:
-    print(f"警告: 無法導入 pynrfjprog: {e}")
-    PYNRFJPROG_AVAILABLE = False
+from flash_jobs import FlashJob, PYNRFJPROG_AVAILABLE, HighLevel, LowLevel
+from flasher_service import FlasherClient, STATE_SUCCEEDED
+from job_history import JobHistory, FLASH_OPERATIONS
+from flash_plan import plan_for_operation, HistoryEstimates
+from verify_setup import run_diagnostics, failed_checks
+from image_tag import UP_TO_DATE_TAG, UP_TO_DATE_VERIFY
+from inventory import scan_all, assign_images, format_table
+from flash_recipe import get_compiled
+from job_profile import SamplingProfiler, save_job_profile, PROFILE_DIR
+from hex_library import (
+    FirmwareLibrary, describe_label, chip_from_device_version,
+    KIND_MERGED, KIND_SOFTDEVICE, KIND_APP
+)
 
 
 class FlashThread(QThread):
-    """燒錄執行緒 - 使用 pynrfjprog"""
+    """燒錄執行緒 - 在 Qt 執行緒中執行 FlashJob"""
+    output_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(int)
+    finished_signal = pyqtSignal(bool, str)
+
+    def __init__(self, hex_file, operation='flash', sd_file=None, timeout=300, history=None,
+                 dump_path=None, **options):
+        super().__init__()
+        self.job = FlashJob(hex_file, operation, sd_file, timeout, history=history,
+                            dump_path=dump_path, **options)
+        self.job.output_signal.connect(self.output_signal.emit)
+        self.job.progress_signal.connect(self.progress_signal.emit)
+        self.job.finished_signal.connect(self.finished_signal.emit)
+
+    def run(self):
+        self.job.run()
+
+    def stop_operation(self):
+        """停止燒錄操作"""
+        self.job.stop_operation()
+
+
+class ServiceJobThread(QThread):
+    """透過本機燒錄服務執行工作，介面與 FlashThread 相同"""
     output_signal = pyqtSignal(str)
     progress_signal = pyqtSignal(int)
     finished_signal = pyqtSignal(bool, str)
 
-    def __init__(self, hex_file, operation='flash', sd_file=None, timeout=300):
+    def __init__(self, service_url, hex_file, operation='flash', sd_file=None, timeout=300,
+                 dump_path=None, **options):
         super().__init__()
+        self.client = FlasherClient(service_url)
         self.hex_file = hex_file
         self.operation = operation
         self.sd_file = sd_file
-        self.timeout = timeout  # 秒數，預設 300 秒 (5 分鐘)
+        self.timeout = timeout
+        self.dump_path = dump_path
+        self.options = options
+        self.job_id = None
         self._stop_flag = False
 
     def run(self):
         try:
-            if not PYNRFJPROG_AVAILABLE:
-                self.finished_signal.emit(False, "pynrfjprog 未安裝!")
-                return
-            
+            job = self.client.submit(self.operation, self.hex_file, self.sd_file, self.timeout,
+                                     dump_path=self.dump_path, **self.options)
+            self.job_id = job['id']
+            self.output_signal.emit(f"已提交到燒錄服務: 工作 {self.job_id} ({self.client.base_url})\n")
             if self._stop_flag:
-                self.finished_signal.emit(False, "操作已被中止")
-                return
-            
-            if self.operation == 'erase':
-                self.erase_chip()
-            elif self.operation == 'flash':
-                self.flash_hex()
-            elif self.operation == 'flash_sd':
-                self.flash_sd_only()
-            elif self.operation == 'flash_app':
-                self.flash_app_only()
-            elif self.operation == 'verify':
-                self.verify_hex()
-            elif self.operation == 'recover':
-                self.recover_device()
-            elif self.operation == 'auto':
-                self.auto_flash()
-            elif self.operation == 'flash_separate':
-                self.flash_separate()
+                self.client.cancel(self.job_id)
+            for text, progress in self.client.follow(self.job_id, wait=1):
+                if text:
+                    self.output_signal.emit(text)
+                self.progress_signal.emit(progress)
+            status = self.client.status(self.job_id)
+            self.finished_signal.emit(status['state'] == STATE_SUCCEEDED, status['message'])
         except Exception as e:
-            self.finished_signal.emit(False, f"錯誤: {str(e)}")
+            self.finished_signal.emit(False, f"燒錄服務錯誤: {str(e)}")
 
     def stop_operation(self):
-        """停止燒錄操作"""
+        """取消服務中的工作"""
         self._stop_flag = True
+        if self.job_id is not None:
+            try:
+                self.client.cancel(self.job_id)
+            except Exception:
+                pass
 
-    def flash_hex(self):
-        """使用 HighLevel API 燒錄 HEX 檔案"""
-        self.output_signal.emit(f"燒錄檔案: {self.hex_file}\n")
-        self.output_signal.emit(f"操作逾時設定: {self.timeout} 秒\n")
-        self.progress_signal.emit(10)
-        
-        try:
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                if not probes:
-                    self.finished_signal.emit(False, "未找到連接的 J-Link 探針!")
-                    return
-                
-                snr = probes[0]
-                self.output_signal.emit(f"連接到探針: {snr}\n")
-                self.progress_signal.emit(20)
-                
-                if self._stop_flag:
-                    self.finished_signal.emit(False, "燒錄已被中止")
-                    return
-                
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    self.output_signal.emit("開始燒錄...\n")
-                    self.progress_signal.emit(30)
-                    
-                    probe.program(self.hex_file)
-                    
-                    self.output_signal.emit("✓ 燒錄完成!\n")
-                    self.progress_signal.emit(100)
-                    self.finished_signal.emit(True, "燒錄成功!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"燒錄失敗: {str(e)}")
 
-    def flash_sd_only(self):
-        """僅燒錄 SoftDevice"""
-        self.output_signal.emit(f"燒錄 SoftDevice: {self.hex_file}\n")
-        self.output_signal.emit(f"操作逾時設定: {self.timeout} 秒\n")
-        self.progress_signal.emit(10)
-        
-        try:
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                if not probes:
-                    self.finished_signal.emit(False, "未找到連接的 J-Link 探針!")
-                    return
-                
-                snr = probes[0]
-                self.output_signal.emit(f"連接到探針: {snr}\n")
-                self.progress_signal.emit(20)
-                
-                if self._stop_flag:
-                    self.finished_signal.emit(False, "燒錄已被中止")
-                    return
-                
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    self.output_signal.emit("開始燒錄 SoftDevice...\n")
-                    self.progress_signal.emit(30)
-                    
-                    probe.program(self.hex_file)
-                    
-                    self.output_signal.emit("✓ SoftDevice 燒錄完成!\n")
-                    self.progress_signal.emit(100)
-                    self.finished_signal.emit(True, "SoftDevice 燒錄成功!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"SoftDevice 燒錄失敗: {str(e)}")
+class InventoryThread(QThread):
+    """同時清點所有探針 (FICR/APPROTECT/UICR)"""
+    result_signal = pyqtSignal(list)
+    error_signal = pyqtSignal(str)
 
-    def flash_app_only(self):
-        """僅燒錄 Application"""
-        self.output_signal.emit(f"燒錄 Application: {self.hex_file}\n")
-        self.output_signal.emit(f"操作逾時設定: {self.timeout} 秒\n")
-        self.progress_signal.emit(10)
-        
+    def run(self):
         try:
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                if not probes:
-                    self.finished_signal.emit(False, "未找到連接的 J-Link 探針!")
-                    return
-                
-                snr = probes[0]
-                self.output_signal.emit(f"連接到探針: {snr}\n")
-                self.progress_signal.emit(20)
-                
-                if self._stop_flag:
-                    self.finished_signal.emit(False, "燒錄已被中止")
-                    return
-                
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    self.output_signal.emit("開始燒錄 Application...\n")
-                    self.progress_signal.emit(30)
-                    
-                    probe.program(self.hex_file)
-                    
-                    self.output_signal.emit("✓ Application 燒錄完成!\n")
-                    self.progress_signal.emit(100)
-                    self.finished_signal.emit(True, "Application 燒錄成功!")
+            self.result_signal.emit(scan_all())
         except Exception as e:
-            self.finished_signal.emit(False, f"Application 燒錄失敗: {str(e)}")
+            self.error_signal.emit(str(e))
 
-    def erase_chip(self):
-        """擦除晶片"""
-        self.output_signal.emit("開始擦除晶片...\n")
-        self.progress_signal.emit(10)
-        
-        try:
-            if self._stop_flag:
-                self.finished_signal.emit(False, "擦除已被中止")
-                return
-            
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                self.output_signal.emit("已連接裝置\n")
-                self.progress_signal.emit(30)
-                
-                if self._stop_flag:
-                    self.finished_signal.emit(False, "擦除已被中止")
-                    return
-                
-                api.erase_all()
-                self.output_signal.emit("✓ 晶片擦除完成!\n")
-                self.progress_signal.emit(100)
-                self.finished_signal.emit(True, "晶片擦除成功!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"擦除失敗: {str(e)}")
 
-    def verify_hex(self):
-        """驗證 HEX 檔案"""
-        self.output_signal.emit(f"驗證檔案: {self.hex_file}\n")
-        self.progress_signal.emit(10)
-        
-        try:
-            from pynrfjprog import Hex
-            
-            self.output_signal.emit("解析 HEX 檔案...\n")
-            self.progress_signal.emit(30)
-            
-            hex_obj = Hex.Hex(self.hex_file)
-            
-            self.output_signal.emit(f"✓ HEX 檔案有效\n")
-            self.output_signal.emit(f"  地址範圍: 0x{hex_obj.address_range()[0]:08X} - 0x{hex_obj.address_range()[1]:08X}\n")
-            self.output_signal.emit(f"  檔案大小: {len(hex_obj.tobinarray())} 位元組\n")
-            
-            self.progress_signal.emit(100)
-            self.finished_signal.emit(True, "驗證成功!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"驗證失敗: {str(e)}")
+class DiagnosticsThread(QThread):
+    """在背景執行環境檢查 (verify_setup.py)"""
+    result_signal = pyqtSignal(dict)
+    error_signal = pyqtSignal(str)
 
-    def recover_device(self):
-        """恢復裝置（解除讀取保護）"""
-        self.output_signal.emit("開始恢復裝置...\n")
-        self.output_signal.emit("此操作將解除裝置的讀取保護\n")
-        self.progress_signal.emit(30)
-        
+    def run(self):
         try:
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                self.output_signal.emit("已連接裝置\n")
-                self.progress_signal.emit(50)
-                
-                api.recover()
-                self.output_signal.emit("✓ 裝置恢復成功!\n")
-                self.progress_signal.emit(100)
-                self.finished_signal.emit(True, "裝置恢復成功!")
+            self.result_signal.emit(run_diagnostics())
         except Exception as e:
-            self.finished_signal.emit(False, f"恢復失敗: {str(e)}")
-
-    def auto_flash(self):
-        """自動模式：Recover → Erase → Flash → Reset"""
-        self.output_signal.emit("=== 自動燒錄模式 ===\n")
-        self.output_signal.emit(f"目標檔案: {self.hex_file}\n\n")
-        
-        try:
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                
-                # Step 1: Recover
-                self.output_signal.emit("步驟 1/4: 恢復裝置 (Recover)...\n")
-                self.progress_signal.emit(10)
-                try:
-                    api.recover()
-                    self.output_signal.emit("✓ Recover 成功\n")
-                except:
-                    self.output_signal.emit("⚠ Recover 失敗，繼續嘗試擦除...\n")
-                
-                # Step 2: Erase
-                self.output_signal.emit("\n步驟 2/4: 擦除晶片...\n")
-                self.progress_signal.emit(30)
-                api.erase_all()
-                self.output_signal.emit("✓ 擦除完成\n")
-                
-                # 重新連接以完成燒錄
-                api.disconnect_from_emu()
-            
-            # Step 3: Flash
-            self.output_signal.emit("\n步驟 3/4: 燒錄韌體...\n")
-            self.progress_signal.emit(60)
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                if not probes:
-                    self.finished_signal.emit(False, "燒錄前未找到裝置!")
-                    return
-                
-                snr = probes[0]
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    probe.program(self.hex_file)
-                    self.output_signal.emit("✓ 燒錄完成\n")
-            
-            # Step 4: Reset
-            self.output_signal.emit("\n步驟 4/4: 重置裝置...\n")
-            self.progress_signal.emit(90)
-            
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                api.sys_reset()
-                self.output_signal.emit("✓ 重置完成\n")
-            
-            self.progress_signal.emit(100)
-            self.output_signal.emit("\n✓ 自動燒錄完成!\n")
-            self.finished_signal.emit(True, "自動燒錄完成!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"自動燒錄失敗: {str(e)}")
-
-    def flash_separate(self):
-        """分開燒錄：SoftDevice + Application"""
-        if not self.sd_file:
-            self.finished_signal.emit(False, "未指定 SoftDevice 檔案!")
-            return
-        
-        self.output_signal.emit("=== 分開燒錄模式 ===\n")
-        self.output_signal.emit(f"SoftDevice: {self.sd_file}\n")
-        self.output_signal.emit(f"Application: {self.hex_file}\n\n")
-        
-        try:
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                
-                # Step 1: Erase
-                self.output_signal.emit("步驟 1/4: 擦除晶片...\n")
-                self.progress_signal.emit(10)
-                api.erase_all()
-                self.output_signal.emit("✓ 擦除完成\n")
-                
-                api.disconnect_from_emu()
-            
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            # Step 2: Flash SoftDevice
-            self.output_signal.emit("\n步驟 2/4: 燒錄 SoftDevice...\n")
-            self.progress_signal.emit(35)
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                if not probes:
-                    self.finished_signal.emit(False, "燒錄前未找到裝置!")
-                    return
-                
-                snr = probes[0]
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    probe.program(self.sd_file)
-                    self.output_signal.emit("✓ SoftDevice 燒錄完成\n")
-            
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            # Step 3: Flash Application
-            self.output_signal.emit("\n步驟 3/4: 燒錄應用程式...\n")
-            self.progress_signal.emit(65)
-            
-            with HighLevel.API() as api:
-                probes = api.get_connected_probes()
-                snr = probes[0]
-                with HighLevel.DebugProbe(api, snr) as probe:
-                    probe.program(self.hex_file)
-                    self.output_signal.emit("✓ 應用程式燒錄完成\n")
-            
-            if self._stop_flag:
-                self.finished_signal.emit(False, "燒錄已被中止")
-                return
-            
-            # Step 4: Reset
-            self.output_signal.emit("\n步驟 4/4: 重置裝置...\n")
-            self.progress_signal.emit(90)
-            
-            with LowLevel.API('NRF52') as api:
-                api.enum_emu_snr()
-                api.connect_to_emu_without_snr()
-                api.sys_reset()
-                self.output_signal.emit("✓ 重置完成\n")
-            
-            self.progress_signal.emit(100)
-            self.output_signal.emit("\n✓ 分開燒錄完成!\n")
-            self.finished_signal.emit(True, "分開燒錄完成!")
-        except Exception as e:
-            self.finished_signal.emit(False, f"分開燒錄失敗: {str(e)}")
+            self.error_signal.emit(str(e))
 
 
 class NRFFlasherGUI(QMainWindow):
@@ -403,6 +134,21 @@ class NRFFlasherGUI(QMainWindow):
         self.sd_file = None
         self.app_file = None
         self.flash_thread = None
+        self.inventory_thread = None
+        self.diagnostics_thread = None
+        self.target_chip = None
+        # 效能分析：剩餘要分析的工作數與目前工作的分析器、日誌
+        self.profile_remaining = 0
+        self.profiler = None
+        self.profile_operation = None
+        self.profile_thread = None
+        self.profile_log = []
+        # 設定後所有燒錄工作交給本機燒錄服務執行 (例如 http://127.0.0.1:8765)
+        self.service_url = os.environ.get("NRF_FLASHER_SERVICE")
+        self.history = JobHistory()
+        # 步驟預估值 (最近 7 天的工作歷史)；在背景查詢，按鈕只讀取快取
+        self.estimates = HistoryEstimates(self.history)
+        self.estimates.refresh_in_background()
         
         # 預設路徑設定
         self.project_root = Path(__file__).parent
@@ -410,21 +156,53 @@ class NRFFlasherGUI(QMainWindow):
         self.merged_hex_dir = self.hex_base_dir / "merge"
         self.sd_hex_dir = self.hex_base_dir / "softdevice"
         self.app_hex_dir = self.hex_base_dir / "app"
+        self.release_hex_dir = self.project_root.parent / "app_hex"
         
         # 建立目錄（如果不存在）
         for directory in [self.merged_hex_dir, self.sd_hex_dir, self.app_hex_dir]:
             directory.mkdir(parents=True, exist_ok=True)
         
+        # 韌體庫索引：啟動時直接讀取索引，再增量掃描有變動的檔案
+        self.library = FirmwareLibrary(
+            self.hex_base_dir / "library_index.json",
+            [self.merged_hex_dir, self.sd_hex_dir, self.app_hex_dir, self.release_hex_dir])
+        
         self.init_ui()
-        self.load_hex_files()
-        self.load_sd_files()
-        self.load_app_files()
+        self.refresh_library()
+        self.init_library_watcher()
         
-        if not PYNRFJPROG_AVAILABLE:
-            QMessageBox.warning(self, "警告", 
-                "pynrfjprog 未正確安裝!\n"
-                "請確保已解壓縮 pynrfjprog-10.24.0 到 GUI 目錄\n"
-                "或執行: pip install pynrfjprog")
+        if self.service_url:
+            self.log_message(f"燒錄工作將交給燒錄服務執行: {self.service_url}\n")
+        
+        self.check_environment()
+
+    def check_environment(self):
+        """在背景讀取環境檢查報告 (verify_setup.py，環境沒有變動時直接使用快取)"""
+        self.diagnostics_thread = DiagnosticsThread()
+        self.diagnostics_thread.result_signal.connect(self.on_diagnostics_result)
+        self.diagnostics_thread.error_signal.connect(self.on_diagnostics_error)
+        self.diagnostics_thread.start()
+
+    def on_diagnostics_error(self, error):
+        self.log_message(f"⚠ 無法執行環境檢查: {error}\n")
+
+    def on_diagnostics_result(self, report):
+        """環境檢查完成：顯示未通過的項目"""
+        failed = failed_checks(report)
+        if not failed:
+            return
+        lines = []
+        for check in failed:
+            lines.append(f"✗ {check['detail']}")
+            if check.get('fix'):
+                lines.append(f"   修復: {check['fix']}")
+        self.log_message("環境檢查未通過:\n" + "\n".join(lines) + "\n")
+        
+        # 使用燒錄服務時由服務端負責探針與 pynrfjprog
+        if not report['can_flash'] and not self.service_url:
+            QMessageBox.warning(self, "警告",
+                "燒錄環境未就緒，燒錄功能將無法使用:\n\n" + "\n".join(lines) +
+                "\n\n詳細檢查: python verify_setup.py")
 
     def init_ui(self):
         """初始化 UI"""
@@ -449,7 +227,7 @@ class NRFFlasherGUI(QMainWindow):
         
         self.refresh_btn = QPushButton("重新整理")
         self.refresh_btn.setMaximumWidth(80)
-        self.refresh_btn.clicked.connect(self.load_hex_files)
+        self.refresh_btn.clicked.connect(self.refresh_library)
         merged_layout.addWidget(self.refresh_btn)
         
         self.browse_merged_btn = QPushButton("瀏覽")
@@ -484,6 +262,11 @@ class NRFFlasherGUI(QMainWindow):
         app_layout.addWidget(self.browse_app_btn)
         file_layout.addLayout(app_layout)
         
+        # 依偵測到的目標晶片篩選映像
+        self.filter_target_check = QCheckBox("僅顯示符合目標晶片的映像 (目標: 未偵測)")
+        self.filter_target_check.toggled.connect(self.reload_combos)
+        file_layout.addWidget(self.filter_target_check)
+        
         file_group.setLayout(file_layout)
         layout.addWidget(file_group)
         
@@ -491,6 +274,45 @@ class NRFFlasherGUI(QMainWindow):
         action_group = QGroupBox("操作")
         action_layout = QVBoxLayout()
         
+        # 裝置已是相同韌體時 (UICR 韌體標記) 的處理方式
+        up_to_date_layout = QHBoxLayout()
+        up_to_date_layout.addWidget(QLabel("已是相同韌體時:"))
+        self.up_to_date_combo = QComboBox()
+        self.up_to_date_combo.addItem("重新燒錄", None)
+        self.up_to_date_combo.addItem("略過 (比對 UICR 韌體標記)", UP_TO_DATE_TAG)
+        self.up_to_date_combo.addItem("比對每頁雜湊後略過", UP_TO_DATE_VERIFY)
+        up_to_date_layout.addWidget(self.up_to_date_combo, 1)
+        action_layout.addLayout(up_to_date_layout)
+        
+        # 燒錄後重置並擷取 RTT 日誌，直到出現指定字串或逾時
+        rtt_layout = QHBoxLayout()
+        self.rtt_check = QCheckBox("重置後擷取 RTT 日誌")
+        rtt_layout.addWidget(self.rtt_check)
+        rtt_layout.addWidget(QLabel("停止樣式:"))
+        self.rtt_pattern_edit = QLineEdit()
+        self.rtt_pattern_edit.setPlaceholderText("正規表示式 (空白: 擷取到逾時)")
+        rtt_layout.addWidget(self.rtt_pattern_edit, 1)
+        rtt_layout.addWidget(QLabel("逾時:"))
+        self.rtt_timeout_spin = QSpinBox()
+        self.rtt_timeout_spin.setRange(1, 120)
+        self.rtt_timeout_spin.setValue(5)
+        self.rtt_timeout_spin.setSuffix(" 秒")
+        rtt_layout.addWidget(self.rtt_timeout_spin)
+        action_layout.addLayout(rtt_layout)
+        
+        # 效能分析：接下來的 N 個工作在取樣分析器下執行，結果與工作日誌一起存到 profiles/
+        profile_layout = QHBoxLayout()
+        self.profile_check = QCheckBox("效能分析接下來的工作")
+        self.profile_check.toggled.connect(self.on_profile_toggled)
+        profile_layout.addWidget(self.profile_check)
+        self.profile_count_spin = QSpinBox()
+        self.profile_count_spin.setRange(1, 50)
+        self.profile_count_spin.setValue(3)
+        self.profile_count_spin.setSuffix(" 個")
+        profile_layout.addWidget(self.profile_count_spin)
+        profile_layout.addStretch(1)
+        action_layout.addLayout(profile_layout)
+        
         # 自動燒錄
         self.auto_flash_btn = QPushButton("自動燒錄 (Recover+Erase+Flash+Reset)")
         self.auto_flash_btn.clicked.connect(self.start_auto_flash)
@@ -515,6 +337,10 @@ class NRFFlasherGUI(QMainWindow):
         self.flash_separate_btn.clicked.connect(self.start_flash_separate)
         row1_layout.addWidget(self.flash_separate_btn)
         
+        self.recipe_btn = QPushButton("燒錄配方")
+        self.recipe_btn.clicked.connect(self.start_recipe)
+        row1_layout.addWidget(self.recipe_btn)
+        
         self.verify_btn = QPushButton("驗證檔案")
         self.verify_btn.clicked.connect(self.verify_hex)
         row1_layout.addWidget(self.verify_btn)
@@ -542,10 +368,22 @@ class NRFFlasherGUI(QMainWindow):
         self.reset_btn.clicked.connect(self.reset_device)
         row2_layout.addWidget(self.reset_btn)
         
+        self.readback_btn = QPushButton("讀回")
+        self.readback_btn.clicked.connect(self.readback_device)
+        row2_layout.addWidget(self.readback_btn)
+        
         self.check_connection_btn = QPushButton("檢查連線")
         self.check_connection_btn.clicked.connect(self.check_connection)
         row2_layout.addWidget(self.check_connection_btn)
         
+        self.inventory_btn = QPushButton("清點裝置")
+        self.inventory_btn.clicked.connect(self.scan_inventory)
+        row2_layout.addWidget(self.inventory_btn)
+        
+        self.stats_btn = QPushButton("生產統計")
+        self.stats_btn.clicked.connect(self.show_statistics)
+        row2_layout.addWidget(self.stats_btn)
+        
         # 日誌控制按鈕
         self.save_log_btn = QPushButton("保存日誌")
         self.save_log_btn.clicked.connect(self.save_log)
@@ -586,52 +424,113 @@ class NRFFlasherGUI(QMainWindow):
         # 狀態欄
         self.statusBar().showMessage("準備就緒")
 
+    def init_library_watcher(self):
+        """監看韌體目錄，檔案變動時增量更新索引"""
+        self.library_watcher = QFileSystemWatcher(self)
+        self.library_watcher.directoryChanged.connect(self.on_library_dir_changed)
+        self.library_watcher.fileChanged.connect(self.on_library_file_changed)
+        self.pending_library_dirs = set()
+        
+        # 建置過程會分段寫入檔案，延遲處理以合併多次通知
+        self.library_timer = QTimer(self)
+        self.library_timer.setSingleShot(True)
+        self.library_timer.setInterval(500)
+        self.library_timer.timeout.connect(self.apply_library_changes)
+        
+        self.update_watched_paths()
+
+    def update_watched_paths(self):
+        """同步監看清單 (目錄與其中的 HEX 檔案)"""
+        wanted = set()
+        for directory in self.library.directories:
+            if directory.exists():
+                wanted.add(str(directory))
+                wanted.update(str(p) for p in directory.glob("*.hex"))
+        current = set(self.library_watcher.directories()) | set(self.library_watcher.files())
+        if wanted - current:
+            self.library_watcher.addPaths(sorted(wanted - current))
+        if current - wanted:
+            self.library_watcher.removePaths(sorted(current - wanted))
+
+    def on_library_dir_changed(self, path):
+        """目錄內容變動"""
+        self.pending_library_dirs.add(path)
+        self.library_timer.start()
+
+    def on_library_file_changed(self, path):
+        """HEX 檔案被改寫"""
+        self.pending_library_dirs.add(str(Path(path).parent))
+        self.library_timer.start()
+
+    def apply_library_changes(self):
+        """處理累積的檔案變動通知"""
+        dirs = sorted(self.pending_library_dirs)
+        self.pending_library_dirs.clear()
+        self.refresh_library(dirs)
+        self.update_watched_paths()
+
+    def refresh_library(self, directories=None):
+        """增量更新韌體索引並重新載入下拉選單"""
+        changed, removed, errors = self.library.refresh(directories)
+        for path, error in errors:
+            self.log_message(f"⚠ 無法解析 {Path(path).name}: {error}\n")
+        if changed or removed:
+            self.log_message(f"韌體庫已更新: {len(changed)} 個新增/變更, {len(removed)} 個移除\n")
+        self.reload_combos()
+
+    def reload_combos(self):
+        """從索引重新載入所有下拉選單"""
+        self.load_hex_files()
+        self.load_sd_files()
+        self.load_app_files()
+
+    def library_chip_filter(self):
+        """目前的晶片篩選條件"""
+        if self.filter_target_check.isChecked():
+            return self.target_chip
+        return None
+
+    def fill_combo(self, combo, placeholder, kind):
+        """以索引項目填入下拉選單，並盡量保留原本的選擇"""
+        previous = combo.currentData()
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItem(placeholder, None)
+        entries = self.library.entries(kind, self.library_chip_filter())
+        for entry in entries:
+            combo.addItem(describe_label(entry), entry['path'])
+        index = combo.findData(previous) if previous else -1
+        combo.setCurrentIndex(max(index, 0))
+        combo.blockSignals(False)
+        return entries
+
     def load_hex_files(self):
         """載入 Merged HEX 檔案"""
-        self.hex_combo.clear()
-        self.hex_combo.addItem("-- 選擇 Merged HEX --", None)
-        
-        if self.merged_hex_dir.exists():
-            hex_files = sorted(self.merged_hex_dir.glob("*.hex"))
-            for hex_file in hex_files:
-                self.hex_combo.addItem(hex_file.name, str(hex_file))
-            
-            if hex_files:
-                self.log_message(f"找到 {len(hex_files)} 個 Merged HEX 檔案 (路徑: {self.merged_hex_dir})\n")
-            else:
-                self.log_message(f"{self.merged_hex_dir} 目錄中沒有 HEX 檔案\n")
+        entries = self.fill_combo(self.hex_combo, "-- 選擇 Merged HEX --", KIND_MERGED)
+        if entries:
+            self.log_message(f"找到 {len(entries)} 個 Merged HEX 檔案 (路徑: {self.merged_hex_dir}, {self.release_hex_dir})\n")
         else:
-            self.log_message(f"{self.merged_hex_dir} 目錄不存在\n")
+            self.log_message(f"{self.merged_hex_dir} 目錄中沒有 HEX 檔案\n")
 
     def load_sd_files(self):
         """載入 SoftDevice HEX 檔案"""
-        self.sd_combo.clear()
-        self.sd_combo.addItem("-- 選擇 SoftDevice --", None)
-        
-        if self.sd_hex_dir.exists():
-            sd_files = sorted(self.sd_hex_dir.glob("*.hex"))
-            for sd_file in sd_files:
-                self.sd_combo.addItem(sd_file.name, str(sd_file))
-            
-            if sd_files:
-                self.log_message(f"找到 {len(sd_files)} 個 SoftDevice 檔案 (路徑: {self.sd_hex_dir})\n")
-        else:
-            self.log_message(f"{self.sd_hex_dir} 目錄不存在\n")
+        entries = self.fill_combo(self.sd_combo, "-- 選擇 SoftDevice --", KIND_SOFTDEVICE)
+        if entries:
+            self.log_message(f"找到 {len(entries)} 個 SoftDevice 檔案 (路徑: {self.sd_hex_dir})\n")
 
     def load_app_files(self):
         """載入 Application HEX 檔案"""
-        self.app_combo.clear()
-        self.app_combo.addItem("-- 選擇 Application --", None)
-        
-        if self.app_hex_dir.exists():
-            app_files = sorted(self.app_hex_dir.glob("*.hex"))
-            for app_file in app_files:
-                self.app_combo.addItem(app_file.name, str(app_file))
-            
-            if app_files:
-                self.log_message(f"找到 {len(app_files)} 個 Application 檔案 (路徑: {self.app_hex_dir})\n")
-        else:
-            self.log_message(f"{self.app_hex_dir} 目錄不存在\n")
+        entries = self.fill_combo(self.app_combo, "-- 選擇 Application --", KIND_APP)
+        if entries:
+            self.log_message(f"找到 {len(entries)} 個 Application 檔案 (路徑: {self.app_hex_dir})\n")
+
+    def set_target_chip(self, chip):
+        """設定偵測到的目標晶片並更新篩選"""
+        self.target_chip = chip
+        label = chip.replace('nrf', 'nRF') if chip else "未偵測"
+        self.filter_target_check.setText(f"僅顯示符合目標晶片的映像 (目標: {label})")
+        if self.filter_target_check.isChecked():
+            self.reload_combos()
 
     def on_hex_selected(self, text):
         """Merged HEX 檔案選擇改變"""
@@ -693,6 +592,29 @@ class NRFFlasherGUI(QMainWindow):
             self.app_combo.setCurrentIndex(0)
             self.log_message(f"已選擇 Application: {Path(file_path).name}")
 
+    def create_flash_thread(self, hex_file, operation='flash', sd_file=None, timeout=300,
+                            dump_path=None):
+        """建立燒錄執行緒：有設定燒錄服務時交給服務執行"""
+        options = self.job_options()
+        if self.service_url:
+            thread = ServiceJobThread(self.service_url, hex_file, operation, sd_file, timeout,
+                                      dump_path=dump_path, **options)
+        else:
+            thread = FlashThread(hex_file, operation, sd_file, timeout, history=self.history,
+                                 dump_path=dump_path, **options)
+        if self.profile_remaining > 0:
+            self.start_profiling(thread, operation)
+        return thread
+
+    def job_options(self):
+        """操作區的工作選項 (韌體標記、RTT 擷取)"""
+        rtt = self.rtt_check.isChecked()
+        return {
+            'up_to_date': self.up_to_date_combo.currentData(),
+            'rtt_timeout': self.rtt_timeout_spin.value() if rtt else 0,
+            'rtt_pattern': (self.rtt_pattern_edit.text().strip() or None) if rtt else None,
+        }
+
     def start_auto_flash(self):
         """開始自動燒錄"""
         if not self.hex_file:
@@ -703,15 +625,15 @@ class NRFFlasherGUI(QMainWindow):
             QMessageBox.critical(self, "錯誤", f"檔案不存在:\n{self.hex_file}")
             return
         
+        options = self.job_options()
+        plan = plan_for_operation('auto', self.hex_file,
+                                  estimates=self.estimates.get(self.image_hash(self.hex_file)),
+                                  up_to_date=options['up_to_date'],
+                                  rtt_timeout=options['rtt_timeout'])
         reply = QMessageBox.information(
             self,
             "自動燒錄",
-            "自動燒錄將執行:\n"
-            "1. Recover (恢復裝置)\n"
-            "2. Erase All (擦除全部)\n"
-            "3. Flash (燒錄)\n"
-            "4. Reset (重置)\n\n"
-            "繼續?",
+            f"{plan.describe()}\n繼續?",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         
@@ -719,7 +641,7 @@ class NRFFlasherGUI(QMainWindow):
             self.set_buttons_enabled(False)
             self.progress_bar.setValue(0)
             
-            self.flash_thread = FlashThread(self.hex_file, 'auto')
+            self.flash_thread = self.create_flash_thread(self.hex_file, 'auto')
             self.flash_thread.output_signal.connect(self.log_message)
             self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
             self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -740,7 +662,7 @@ class NRFFlasherGUI(QMainWindow):
         self.set_buttons_enabled(False)
         self.progress_bar.setValue(0)
         
-        self.flash_thread = FlashThread(self.hex_file, 'flash', timeout=180)
+        self.flash_thread = self.create_flash_thread(self.hex_file, 'flash', timeout=180)
         self.flash_thread.output_signal.connect(self.log_message)
         self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
         self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -769,7 +691,7 @@ class NRFFlasherGUI(QMainWindow):
             self.set_buttons_enabled(False)
             self.progress_bar.setValue(0)
             
-            self.flash_thread = FlashThread(self.sd_file, 'flash_sd', timeout=180)
+            self.flash_thread = self.create_flash_thread(self.sd_file, 'flash_sd', timeout=180)
             self.flash_thread.output_signal.connect(self.log_message)
             self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
             self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -798,7 +720,7 @@ class NRFFlasherGUI(QMainWindow):
             self.set_buttons_enabled(False)
             self.progress_bar.setValue(0)
             
-            self.flash_thread = FlashThread(self.app_file, 'flash_app', timeout=180)
+            self.flash_thread = self.create_flash_thread(self.app_file, 'flash_app', timeout=180)
             self.flash_thread.output_signal.connect(self.log_message)
             self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
             self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -828,7 +750,7 @@ class NRFFlasherGUI(QMainWindow):
         self.progress_bar.setValue(0)
         
         # 使用固定 timeout 時間
-        self.flash_thread = FlashThread(self.app_file, 'flash_separate', self.sd_file, timeout=180)
+        self.flash_thread = self.create_flash_thread(self.app_file, 'flash_separate', self.sd_file, timeout=180)
         self.flash_thread.output_signal.connect(self.log_message)
         self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
         self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -836,6 +758,44 @@ class NRFFlasherGUI(QMainWindow):
         
         self.statusBar().showMessage("分開燒錄中...")
 
+    def start_recipe(self):
+        """選擇燒錄配方並依配方燒錄 (配方編譯一次，之後的燒錄共用)"""
+        recipe_dir = Path(__file__).parent / "recipes"
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "選擇燒錄配方",
+            str(recipe_dir) if recipe_dir.exists() else "",
+            "Recipe Files (*.json *.yaml *.yml);;All Files (*.*)"
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            compiled = get_compiled(file_path, self.estimates.get())
+        except Exception as e:
+            QMessageBox.critical(self, "配方錯誤", str(e))
+            return
+        
+        reply = QMessageBox.information(
+            self,
+            "燒錄配方",
+            f"{compiled.describe()}\n繼續?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        
+        if reply == QMessageBox.StandardButton.Yes:
+            self.set_buttons_enabled(False)
+            self.progress_bar.setValue(0)
+            
+            self.flash_thread = self.create_flash_thread(file_path, 'recipe')
+            self.flash_thread.output_signal.connect(self.log_message)
+            self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
+            self.flash_thread.finished_signal.connect(self.on_operation_finished)
+            self.flash_thread.start()
+            
+            self.statusBar().showMessage(f"配方燒錄中: {compiled.name}...")
+
     def erase_chip(self):
         """擦除晶片"""
         reply = QMessageBox.warning(
@@ -849,7 +809,7 @@ class NRFFlasherGUI(QMainWindow):
             self.set_buttons_enabled(False)
             self.progress_bar.setValue(0)
             
-            self.flash_thread = FlashThread("", 'erase', timeout=120)
+            self.flash_thread = self.create_flash_thread("", 'erase', timeout=120)
             self.flash_thread.output_signal.connect(self.log_message)
             self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
             self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -870,7 +830,7 @@ class NRFFlasherGUI(QMainWindow):
         self.set_buttons_enabled(False)
         self.progress_bar.setValue(0)
         
-        self.flash_thread = FlashThread(self.hex_file, 'verify', timeout=60)
+        self.flash_thread = self.create_flash_thread(self.hex_file, 'verify', timeout=60)
         self.flash_thread.output_signal.connect(self.log_message)
         self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
         self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -895,7 +855,7 @@ class NRFFlasherGUI(QMainWindow):
             self.set_buttons_enabled(False)
             self.progress_bar.setValue(0)
             
-            self.flash_thread = FlashThread("", 'recover')
+            self.flash_thread = self.create_flash_thread("", 'recover')
             self.flash_thread.output_signal.connect(self.log_message)
             self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
             self.flash_thread.finished_signal.connect(self.on_operation_finished)
@@ -903,6 +863,34 @@ class NRFFlasherGUI(QMainWindow):
             
             self.statusBar().showMessage("恢復中...")
 
+    def readback_device(self):
+        """讀回裝置記憶體，並與目前選擇的 Merged HEX 比對"""
+        default_name = f"readback_{time.strftime('%Y%m%d_%H%M%S')}.bin"
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "保存讀回檔案",
+            str(self.project_root / default_name),
+            "Dump Files (*.bin);;All Files (*.*)"
+        )
+        if not file_path:
+            return
+        
+        compare_file = self.hex_file if self.hex_file and Path(self.hex_file).exists() else ""
+        if compare_file:
+            self.log_message(f"讀回後將與 {Path(compare_file).name} 比對\n")
+        
+        self.set_buttons_enabled(False)
+        self.progress_bar.setValue(0)
+        
+        self.flash_thread = self.create_flash_thread(compare_file, 'readback', timeout=120,
+                                                     dump_path=file_path)
+        self.flash_thread.output_signal.connect(self.log_message)
+        self.flash_thread.progress_signal.connect(self.progress_bar.setValue)
+        self.flash_thread.finished_signal.connect(self.on_operation_finished)
+        self.flash_thread.start()
+        
+        self.statusBar().showMessage("讀回中...")
+
     def reset_device(self):
         """重置裝置"""
         try:
@@ -936,12 +924,14 @@ class NRFFlasherGUI(QMainWindow):
                         with HighLevel.DebugProbe(api, snr) as probe:
                             self.log_message(f"\n✓ 成功連接到探針 {snr}\n")
                             self.log_message("探針連線正常，可以進行燒錄操作\n")
-                            QMessageBox.information(self, "連線檢查", 
-                                f"連線狀態: ✓ 正常\n\n"
-                                f"發現 {len(probes)} 個 J-Link 探針\n"
-                                f"主探針序號: {snr}\n\n"
-                                "可以進行燒錄操作")
-                            self.statusBar().showMessage("✓ 連線正常")
+                        # DebugProbe 關閉後才以 LowLevel 連線，同一探針不能同時有兩個連線
+                        self.detect_target_chip(snr)
+                        QMessageBox.information(self, "連線檢查",
+                            f"連線狀態: ✓ 正常\n\n"
+                            f"發現 {len(probes)} 個 J-Link 探針\n"
+                            f"主探針序號: {snr}\n\n"
+                            "可以進行燒錄操作")
+                        self.statusBar().showMessage("✓ 連線正常")
                     except Exception as e:
                         self.log_message(f"✗ 無法連接到探針 {snr}\n")
                         self.log_message(f"  錯誤: {str(e)}\n")
@@ -973,9 +963,139 @@ class NRFFlasherGUI(QMainWindow):
                 f"錯誤信息: {str(e)}")
             self.statusBar().showMessage("✗ 連線檢查失敗")
 
+    def detect_target_chip(self, snr):
+        """讀取目標晶片型號，用於篩選韌體庫"""
+        try:
+            with LowLevel.API('NRF52') as api:
+                api.connect_to_emu_with_snr(snr)
+                chip = chip_from_device_version(api.read_device_version())
+                api.disconnect_from_emu()
+        except Exception as e:
+            self.log_message(f"⚠ 無法讀取晶片型號: {str(e)}\n")
+            return
+        if chip:
+            self.log_message(f"目標晶片: {chip.replace('nrf', 'nRF')}\n")
+        self.set_target_chip(chip)
+
+    def scan_inventory(self):
+        """同時清點所有探針，並依晶片自動選擇 Merged 映像"""
+        if self.service_url:
+            QMessageBox.warning(self, "清點裝置",
+                "探針由燒錄服務使用中\n\n請在服務端執行 python inventory.py")
+            return
+        if not PYNRFJPROG_AVAILABLE:
+            QMessageBox.critical(self, "錯誤", "pynrfjprog 未安裝!")
+            return
+        self.log_message("\n=== 清點裝置 ===\n")
+        self.statusBar().showMessage("清點裝置中...")
+        self.set_buttons_enabled(False)
+        self.stop_btn.setEnabled(False)
+        self.inventory_thread = InventoryThread()
+        self.inventory_thread.result_signal.connect(self.on_inventory_result)
+        self.inventory_thread.error_signal.connect(self.on_inventory_error)
+        self.inventory_thread.start()
+
+    def on_inventory_error(self, message):
+        self.set_buttons_enabled(True)
+        self.log_message(f"✗ 清點失敗: {message}\n")
+        self.statusBar().showMessage("✗ 清點失敗")
+
+    def on_inventory_result(self, records):
+        """顯示清點表格，所有探針為同一晶片時設定目標晶片並選擇映像"""
+        self.set_buttons_enabled(True)
+        if not records:
+            self.log_message("✗ 未找到連接的 J-Link 探針\n")
+            self.statusBar().showMessage("✗ 未發現探針")
+            return
+        assign_images(self.library, records, self.hex_combo.currentData())
+        self.log_message(format_table(records) + "\n")
+        
+        chips = {r['part'] for r in records if not r.get('error') and r.get('part')}
+        if len(chips) > 1:
+            self.log_message("⚠ 探針連接的晶片不同，請改用燒錄服務依探針序號分別提交工作\n")
+            self.statusBar().showMessage(f"清點完成: {len(records)} 個探針 (晶片不同)")
+            return
+        if chips:
+            self.set_target_chip(chips.pop())
+        images = {r['image'] for r in records if r.get('image')}
+        if len(images) == 1:
+            path = images.pop()
+            index = self.hex_combo.findData(path)
+            if index >= 0:
+                self.hex_combo.setCurrentIndex(index)
+                self.log_message(f"已自動選擇映像: {Path(path).name}\n")
+        self.statusBar().showMessage(f"清點完成: {len(records)} 個探針")
+
+    def show_statistics(self):
+        """顯示工作歷史統計 (良率、週期時間、最慢探針)"""
+        try:
+            day = self.history.report(time.time() - 86400, operation=FLASH_OPERATIONS)
+            total = self.history.report(operation=FLASH_OPERATIONS)
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"讀取工作紀錄失敗: {str(e)}")
+            return
+        self.log_message("\n" + day + "\n" + total)
+
+    def on_profile_toggled(self, checked):
+        """開啟時分析接下來 N 個工作，關閉時不再分析 (進行中的工作照常存檔)"""
+        self.profile_remaining = self.profile_count_spin.value() if checked else 0
+        self.profile_count_spin.setEnabled(not checked)
+        if checked:
+            self.log_message(f"效能分析: 接下來 {self.profile_remaining} 個工作，結果存到 {PROFILE_DIR}\n")
+
+    def start_profiling(self, thread, operation):
+        """工作開始前啟動取樣分析器，並另外收集此工作的日誌"""
+        if self.profiler is not None:
+            # 前一個工作停止後還沒回報結果就開始新工作：捨棄前一份分析
+            self.profiler.stop()
+        self.profile_log = []
+        thread.output_signal.connect(self.profile_log.append)
+        self.profile_operation = operation
+        self.profile_thread = thread
+        self.profiler = SamplingProfiler().start()
+
+    def finish_profiling(self, success, message):
+        """停止分析並存檔 (在顯示結果對話框之前，避免把等待操作員的時間算進去)"""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return
+        header = [f"操作: {self.profile_operation}",
+                  f"結果: {'成功' if success else '失敗'} - {message}"]
+        # 服務模式以工作編號區分同時結束的工作
+        job_id = getattr(self.profile_thread, 'job_id', None)
+        self.profile_thread = None
+        if self.service_url:
+            header.append("服務模式: 燒錄在服務程序中執行，此分析只包含 GUI 端 (日誌輪詢與顯示)")
+        try:
+            _, summary_path, _ = save_job_profile(profiler, self.profile_operation,
+                                                  ''.join(self.profile_log), '\n'.join(header),
+                                                  tag=f"job{job_id}" if job_id is not None else None)
+            self.log_message(f"\n效能分析已存檔: {summary_path} (另有 .prof 與 .log)\n")
+        except Exception as e:
+            self.log_message(f"\n⚠ 無法儲存效能分析: {str(e)}\n")
+        self.profile_log = []
+        
+        self.profile_remaining -= 1
+        if self.profile_remaining <= 0:
+            self.profile_check.setChecked(False)
+        else:
+            self.log_message(f"效能分析: 還有 {self.profile_remaining} 個工作\n")
+
+    def image_hash(self, path):
+        """韌體庫索引中的映像雜湊 (未索引或檔案已變更時回傳 None)"""
+        entry = self.library.get(path) if path else None
+        try:
+            if entry and os.stat(path).st_mtime_ns == entry['mtime_ns']:
+                return entry['hash']
+        except OSError:
+            pass
+        return None
+
     def on_operation_finished(self, success, message):
         """操作完成"""
+        self.finish_profiling(success, message)
         self.set_buttons_enabled(True)
+        self.estimates.refresh_in_background((None, self.image_hash(self.hex_file)))
         
         if success:
             self.statusBar().showMessage("✓ 操作成功")
@@ -1044,11 +1164,15 @@ class NRFFlasherGUI(QMainWindow):
         self.flash_sd_btn.setEnabled(enabled)
         self.flash_app_btn.setEnabled(enabled)
         self.flash_separate_btn.setEnabled(enabled)
+        self.recipe_btn.setEnabled(enabled)
         self.erase_btn.setEnabled(enabled)
         self.verify_btn.setEnabled(enabled)
         self.recover_btn.setEnabled(enabled)
         self.reset_btn.setEnabled(enabled)
+        self.readback_btn.setEnabled(enabled)
         self.check_connection_btn.setEnabled(enabled)
+        self.inventory_btn.setEnabled(enabled)
+        self.stats_btn.setEnabled(enabled)
         self.browse_merged_btn.setEnabled(enabled)
         self.browse_sd_btn.setEnabled(enabled)
         self.browse_app_btn.setEnabled(enabled)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+封包解碼的參考模型、差分模糊測試與重新同步成本分析
+ReferenceParser 逐位元組重現韌體 packet.c 的 packet_process_byte() /
+try_decode_packet()，包含 rx_buffer 的 memmove 壓縮與 bytes_left；
+差分模糊測試以同一段輸入比較參考模型與主機端 vesc_packet.PacketDecoder
+(不同的分段方式也必須得到相同的封包)。
+
+成本 (每個輸入位元組):
+  attempts   try_decode_packet 呼叫次數
+  crc        計算 CRC 的位元組數 (結束位元組正確但 CRC 錯誤時也會計算)
+  moved      memmove 搬移的位元組數
+  work       attempts * ATTEMPT_WORK + crc + moved (估計的位元組操作數)
+另外記錄單次 packet_process_byte 的最大工作量 (UART 中斷中的延遲尖峰)。
+
+packet_corpus/ 保存找到的最壞情況輸入與當時的成本 (manifest.json)；
+修改任一端的封包格式或解碼方式後以 compare 比較重新同步成本。
+
+用法:
+  python packet_fuzz.py fuzz [--iterations 2000] [--seed 1]
+  python packet_fuzz.py cost FILE [FILE ...]
+  python packet_fuzz.py search [--rounds 300] [--length 4096] [--seed 1]   更新 packet_corpus/
+  python packet_fuzz.py compare                                            與 manifest.json 比較
+"""
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+
+from vesc_packet import PacketDecoder, encode_packet, crc16, PACKET_MAX_PL_LEN
+
+CORPUS_DIR = Path(__file__).parent / "packet_corpus"
+MANIFEST_PATH = CORPUS_DIR / "manifest.json"
+
+# 每次解碼嘗試的固定成本 (以位元組操作計)
+ATTEMPT_WORK = 8
+
+
+class ParseCost:
+    """解碼工作量計數"""
+
+    __slots__ = ('bytes', 'attempts', 'crc', 'moved', 'max_call_work')
+
+    def __init__(self):
+        self.bytes = 0
+        self.attempts = 0
+        self.crc = 0
+        self.moved = 0
+        self.max_call_work = 0
+
+    @property
+    def work(self):
+        return self.attempts * ATTEMPT_WORK + self.crc + self.moved
+
+    def per_byte(self):
+        """每個輸入位元組的成本 (max_call_work 為單次呼叫的最大值)"""
+        n = max(self.bytes, 1)
+        return {'attempts': self.attempts / n, 'crc': self.crc / n, 'moved': self.moved / n,
+                'work': self.work / n, 'max_call_work': self.max_call_work}
+
+
+class ReferenceParser:
+    """packet.c 接收狀態機的逐位元組模型 (PACKET_MAX_PL_LEN <= 65535，沒有 24 位元長度)"""
+
+    def __init__(self, max_len=PACKET_MAX_PL_LEN):
+        self.max_len = max_len
+        self.buffer_len = max_len + 8
+        self.rx_buffer = bytearray(self.buffer_len)
+        self.rx_read_ptr = 0
+        self.rx_write_ptr = 0
+        self.bytes_left = 0
+        self.packets = []
+        self.cost = ParseCost()
+
+    def reset(self):
+        """packet_reset() (接收逾時)"""
+        self.rx_read_ptr = 0
+        self.rx_write_ptr = 0
+        self.bytes_left = 0
+
+    def feed(self, data):
+        """逐位元組處理並回傳解出的封包資料清單"""
+        before = len(self.packets)
+        for b in data:
+            self.process_byte(b)
+        return self.packets[before:]
+
+    def process_byte(self, rx_data):
+        cost = self.cost
+        work_before = cost.work
+        cost.bytes += 1
+        self._process_byte(rx_data)
+        cost.max_call_work = max(cost.max_call_work, cost.work - work_before)
+
+    def _process_byte(self, rx_data):
+        cost = self.cost
+        data_len = self.rx_write_ptr - self.rx_read_ptr
+
+        # Out of space (should not happen)
+        if data_len >= self.buffer_len:
+            self.rx_write_ptr = 0
+            self.rx_read_ptr = 0
+            self.bytes_left = 0
+            self.rx_buffer[0] = rx_data
+            self.rx_write_ptr = 1
+            return
+
+        if self.rx_write_ptr >= self.buffer_len:
+            buf = self.rx_buffer
+            buf[:data_len] = buf[self.rx_read_ptr:self.rx_read_ptr + data_len]
+            cost.moved += data_len
+            self.rx_read_ptr = 0
+            self.rx_write_ptr = data_len
+
+        self.rx_buffer[self.rx_write_ptr] = rx_data
+        self.rx_write_ptr += 1
+        data_len += 1
+
+        if self.bytes_left > 1:
+            self.bytes_left -= 1
+            return
+
+        while True:
+            res = self._try_decode(self.rx_read_ptr, data_len)
+            if res == -2:
+                break
+            if res > 0:
+                data_len -= res
+                self.rx_read_ptr += res
+            else:
+                self.rx_read_ptr += 1
+                data_len -= 1
+
+        if data_len == 0:
+            self.rx_read_ptr = 0
+            self.rx_write_ptr = 0
+
+    def _try_decode(self, pos, in_len):
+        """try_decode_packet()：>0 封包總長度，-1 結構錯誤，-2 需要更多資料"""
+        self.cost.attempts += 1
+        self.bytes_left = 0
+        buf = self.rx_buffer
+        if in_len == 0:
+            self.bytes_left = 1
+            return -2
+        data_start = buf[pos]
+        if data_start != 2 and data_start != 3:
+            return -1
+        if in_len < data_start:
+            self.bytes_left = data_start - in_len
+            return -2
+        if data_start == 2:
+            length = buf[pos + 1]
+            if length < 1:
+                return -1
+        else:
+            length = buf[pos + 1] << 8 | buf[pos + 2]
+            if length < 255:
+                return -1
+        if length > self.max_len:
+            return -1
+        total = length + data_start + 3
+        if in_len < total:
+            self.bytes_left = total - in_len
+            return -2
+        if buf[pos + data_start + length + 2] != 3:
+            return -1
+        self.cost.crc += length
+        payload = bytes(buf[pos + data_start:pos + data_start + length])
+        crc_rx = buf[pos + data_start + length] << 8 | buf[pos + data_start + length + 1]
+        if crc16(payload) != crc_rx:
+            return -1
+        self.packets.append(payload)
+        return total
+
+
+def host_cost(data, chunk=64):
+    """主機端 PacketDecoder 的成本 (依 chunk 分段送入)"""
+    decoder = PacketDecoder()
+    packets = []
+    for i in range(0, len(data), chunk):
+        packets.extend(decoder.feed(data[i:i + chunk]))
+    cost = ParseCost()
+    cost.bytes = len(data)
+    cost.attempts = decoder.attempts
+    cost.crc = decoder.crc_bytes
+    # 主機端一次處理整段資料，沒有單次呼叫的延遲尖峰
+    cost.max_call_work = None
+    return cost, packets
+
+
+def model_cost(data):
+    parser = ReferenceParser()
+    parser.feed(data)
+    return parser.cost, parser.packets
+
+
+# ---------- 輸入產生 ----------
+
+def random_payload(rng):
+    if rng.random() < 0.1:
+        return bytes(rng.getrandbits(8) for _ in range(rng.randint(256, PACKET_MAX_PL_LEN)))
+    return bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 64)))
+
+
+def mutate(rng, data):
+    """位元翻轉、刪除、插入、重複或截斷"""
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 4)):
+        if not data:
+            data.append(rng.getrandbits(8))
+        choice = rng.random()
+        pos = rng.randrange(len(data))
+        if choice < 0.35:
+            data[pos] ^= 1 << rng.randrange(8)
+        elif choice < 0.5:
+            del data[pos]
+        elif choice < 0.65:
+            data.insert(pos, rng.choice((2, 3, 0, 0xFF, rng.getrandbits(8))))
+        elif choice < 0.8:
+            end = min(len(data), pos + rng.randint(1, 16))
+            data[pos:pos] = data[pos:end]
+        else:
+            del data[pos:]
+    return bytes(data)
+
+
+def random_stream(rng, max_events=12):
+    """有效封包、損壞封包與雜訊混合的串流；None 表示接收逾時 (reset)"""
+    events = []
+    for _ in range(rng.randint(1, max_events)):
+        kind = rng.random()
+        if kind < 0.45:
+            events.append(encode_packet(random_payload(rng)))
+        elif kind < 0.75:
+            events.append(mutate(rng, encode_packet(random_payload(rng))))
+        elif kind < 0.92:
+            events.append(bytes(rng.choice((2, 3, rng.getrandbits(8)))
+                                for _ in range(rng.randint(1, 40))))
+        else:
+            events.append(None)
+    return events
+
+
+def differential(events, rng):
+    """以參考模型與主機解碼器 (隨機分段) 處理同一串流，回傳不一致的描述或 None"""
+    model = ReferenceParser()
+    host = PacketDecoder()
+    model_packets = []
+    host_packets = []
+    for event in events:
+        if event is None:
+            model.reset()
+            host.reset()
+            continue
+        model_packets.extend(model.feed(event))
+        pos = 0
+        while pos < len(event):
+            size = rng.randint(1, 32)
+            host_packets.extend(host.feed(event[pos:pos + size]))
+            pos += size
+    if model_packets != host_packets:
+        return (f"參考模型 {len(model_packets)} 個封包，主機解碼器 {len(host_packets)} 個封包"
+                + _first_difference(model_packets, host_packets))
+    return None
+
+
+def _first_difference(a, b):
+    for index, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return f"，第 {index} 個不同: {x[:16].hex()} / {y[:16].hex()}"
+    return ""
+
+
+def fuzz(iterations, seed=None, save_dir=None):
+    """回傳不一致的次數；save_dir 時保存不一致的輸入"""
+    rng = random.Random(seed)
+    failures = 0
+    for iteration in range(iterations):
+        events = random_stream(rng)
+        message = differential(events, rng)
+        if message is None:
+            continue
+        failures += 1
+        print(f"✗ 第 {iteration} 次: {message}")
+        if save_dir:
+            Path(save_dir).mkdir(parents=True, exist_ok=True)
+            path = Path(save_dir) / f"mismatch-{seed}-{iteration}.bin"
+            # 接收逾時 (reset) 無法以位元組表示，只保存位元組
+            path.write_bytes(b''.join(event for event in events if event))
+    return failures
+
+
+# ---------- 最壞情況搜尋 ----------
+
+def seed_inputs(length, rng):
+    """已知的高成本樣式"""
+    def fill(pattern):
+        return (pattern * (length // len(pattern) + 1))[:length]
+
+    # 起始 3 + 長度 512：每個位置都要等滿 518 位元組才知道失敗，緩衝區每幾個位元組就 memmove 一次
+    long_pending = fill(b'\x03\x02\x00')
+    # 週期 11 整除 517：每個候選的結束位元組都正確，每 11 位元組計算一次 512 位元組的 CRC
+    filler = bytes(rng.choice(range(4, 256)) for _ in range(8))
+    crc_heavy = fill(b'\x03\x02\x00' + filler)
+    # 長度 512 的候選之後全是無效位元組：失敗時同一次呼叫內在每個位置重試 (延遲尖峰)
+    spike = fill(b'\x03\x02\x00' + b'\x01' * (PACKET_MAX_PL_LEN + 3))
+    noise = bytes(rng.getrandbits(8) for _ in range(length))
+    start_bytes = bytes(rng.choice((2, 3)) for _ in range(length))
+    return {'long_pending': long_pending, 'crc_heavy': crc_heavy, 'spike': spike,
+            'noise': noise, 'start_bytes': start_bytes}
+
+
+def _score(name, data):
+    """spike 以單次呼叫的最大工作量為目標，其他以每位元組工作量為目標"""
+    cost = model_cost(data)[0]
+    return cost.max_call_work if name == 'spike' else cost.work / len(data)
+
+
+def search(rounds, length, seed=None):
+    """由已知樣式開始以突變爬山搜尋韌體模型工作量最大的輸入"""
+    rng = random.Random(seed)
+    corpus = seed_inputs(length, rng)
+    best = {}
+    for name, data in corpus.items():
+        best[name] = (_score(name, data), data)
+    for name in list(best):
+        score, data = best[name]
+        for _ in range(rounds):
+            candidate = bytearray(data)
+            for _ in range(rng.randint(1, 8)):
+                pos = rng.randrange(length)
+                candidate[pos] = rng.choice((2, 3, 0, rng.getrandbits(8), candidate[pos - 1]))
+            candidate = bytes(candidate)
+            candidate_score = _score(name, candidate)
+            if candidate_score > score:
+                score, data = candidate_score, candidate
+        best[name] = (score, data)
+    return {name: data for name, (_, data) in best.items()}
+
+
+def describe_costs(data):
+    model, model_packets = model_cost(data)
+    host, host_packets = host_cost(data)
+    return {'bytes': len(data), 'packets': len(model_packets),
+            'model': model.per_byte(), 'host': host.per_byte(),
+            'match': model_packets == host_packets}
+
+
+def save_corpus(corpus, directory=CORPUS_DIR):
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for name, data in sorted(corpus.items()):
+        (directory / f"{name}.bin").write_bytes(data)
+        manifest[name] = describe_costs(data)
+    with open(directory / "manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_corpus(directory=CORPUS_DIR):
+    return {path.stem: path.read_bytes() for path in sorted(directory.glob('*.bin'))}
+
+
+def format_costs(name, costs, baseline=None):
+    def cell(side, field):
+        value = costs[side][field]
+        if value is None:
+            return f"{'-':>8}"
+        text = f"{value:8.1f}" if field != 'max_call_work' else f"{value:8d}"
+        if baseline is not None and name in baseline:
+            old = baseline[name][side].get(field)
+            if old:
+                text += f" ({(value - old) * 100 / old:+5.0f}%)"
+            else:
+                text += "        "
+        return text
+
+    lines = [f"{name}: {costs['bytes']} 位元組, {costs['packets']} 個封包"
+             + ("" if costs['match'] else "  ✗ 兩端結果不一致")]
+    for side, label in (('model', "韌體模型"), ('host', "主機端")):
+        lines.append(f"  {label}  嘗試 {cell(side, 'attempts')}  CRC {cell(side, 'crc')}  "
+                     f"搬移 {cell(side, 'moved')}  工作 {cell(side, 'work')}  "
+                     f"單次最大 {cell(side, 'max_call_work')}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="封包解碼差分模糊測試與重新同步成本")
+    sub = parser.add_subparsers(dest='command', required=True)
+    fz = sub.add_parser('fuzz', help="比較參考模型與主機解碼器")
+    fz.add_argument('--iterations', type=int, default=2000)
+    fz.add_argument('--seed', type=int)
+    fz.add_argument('--save', help="保存不一致輸入的目錄")
+    cost = sub.add_parser('cost', help="每位元組成本")
+    cost.add_argument('files', nargs='+')
+    se = sub.add_parser('search', help="搜尋最壞情況並更新 packet_corpus/")
+    se.add_argument('--rounds', type=int, default=300)
+    se.add_argument('--length', type=int, default=4096)
+    se.add_argument('--seed', type=int, default=1)
+    sub.add_parser('compare', help="以目前的解碼器重新計算 packet_corpus/ 並與 manifest.json 比較")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'fuzz':
+            failures = fuzz(args.iterations, args.seed, args.save)
+            print(f"{args.iterations} 次, 不一致 {failures} 次")
+            return 1 if failures else 0
+        if args.command == 'cost':
+            for path in args.files:
+                print(format_costs(Path(path).name, describe_costs(Path(path).read_bytes())))
+            return 0
+        if args.command == 'search':
+            manifest = save_corpus(search(args.rounds, args.length, args.seed))
+            for name, costs in manifest.items():
+                print(format_costs(name, costs))
+            print(f"已寫入 {CORPUS_DIR}")
+            return 0
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            baseline = json.load(f)
+        mismatched = 0
+        for name, data in load_corpus().items():
+            costs = describe_costs(data)
+            mismatched += not costs['match']
+            print(format_costs(name, costs, baseline))
+        return 1 if mismatched else 0
+    except (OSError, ValueError) as e:
+        print(f"錯誤: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+裝置記憶體讀回與映像比對
+以大區塊將 Flash、UICR、FICR 直接讀入記憶體映射檔 (mmap)，
+再逐頁與韌體庫中的映像比對並列出差異範圍
+"""
+
+import mmap
+import struct
+from pathlib import Path
+
+from flash_pipeline import PAGE_SIZE
+from hex_library import FirmwareImage
+
+FICR_BASE = 0x10000000
+FICR_SIZE = 0x400
+FICR_CODEPAGESIZE = 0x10000010
+FICR_CODESIZE = 0x10000014
+UICR_BASE = 0x10001000
+UICR_SIZE = 0x400
+
+# 單次讀取大小 (探針一次傳輸的區塊)
+READ_BLOCK = 0x10000
+
+# 讀回檔案配置：檔頭 (magic, 版本, 各區大小) 之後依序為 Flash、UICR、FICR
+HEADER = struct.Struct('<4sIIIII')
+HEADER_MAGIC = b'NRFD'
+
+
+class DumpFile:
+    """讀回結果檔案：檔頭 + Flash + UICR + FICR，以 mmap 存取"""
+
+    def __init__(self, path, flash_size=None):
+        self.path = Path(path)
+        if flash_size is not None:
+            total = HEADER.size + flash_size + UICR_SIZE + FICR_SIZE
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(HEADER_MAGIC, 1, flash_size, UICR_SIZE, FICR_SIZE, 0))
+                f.truncate(total)
+        self._file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self._file.fileno(), 0)
+        magic, _, self.flash_size, self.uicr_size, self.ficr_size, _ = HEADER.unpack_from(self.map, 0)
+        if magic != HEADER_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} 不是讀回檔案")
+        self.regions = {
+            'flash': (0, HEADER.size, self.flash_size),
+            'uicr': (UICR_BASE, HEADER.size + self.flash_size, self.uicr_size),
+            'ficr': (FICR_BASE, HEADER.size + self.flash_size + self.uicr_size, self.ficr_size),
+        }
+
+    def region(self, name):
+        """回傳區域的 memoryview (不複製)"""
+        _, offset, size = self.regions[name]
+        return memoryview(self.map)[offset:offset + size]
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+            self.map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_flash_size(api):
+    """由 FICR 讀取 Flash 大小"""
+    return api.read_u32(FICR_CODEPAGESIZE) * api.read_u32(FICR_CODESIZE)
+
+
+def readback(api, path, progress=None, stop_check=None):
+    """讀回 Flash、UICR、FICR 至 path，回傳 DumpFile
+
+    每個區塊讀完立即寫入 mmap，不在 Python 中保留整份資料
+    """
+    flash_size = read_flash_size(api)
+    dump = DumpFile(path, flash_size)
+    total = flash_size + UICR_SIZE + FICR_SIZE
+    done = 0
+    try:
+        for name in ('flash', 'uicr', 'ficr'):
+            base, offset, size = dump.regions[name]
+            pos = 0
+            while pos < size:
+                if stop_check and stop_check():
+                    raise InterruptedError("讀回已被中止")
+                length = min(READ_BLOCK, size - pos)
+                dump.map[offset + pos:offset + pos + length] = bytes(api.read(base + pos, length))
+                pos += length
+                done += length
+                if progress:
+                    progress(done, total)
+        dump.flush()
+    except BaseException:
+        dump.close()
+        raise
+    return dump
+
+
+def diff_image(dump, hex_path):
+    """逐頁比對讀回內容與映像，回傳 (差異範圍清單, 比對位元組數)
+
+    hex_path 可以是檔案路徑或已載入的 FirmwareImage；
+    差異範圍為 (起始位址, 結束位址) 並合併相鄰的差異位元組；
+    只比對映像有資料的位址，映像以外的區域不列入
+    """
+    ranges = []
+    compared = 0
+    flash = dump.region('flash')
+    uicr = dump.region('uicr')
+
+    image = hex_path if isinstance(hex_path, FirmwareImage) else FirmwareImage.load(hex_path)
+    for addr, expected in image.page_views(PAGE_SIZE):
+        if addr >= UICR_BASE:
+            mem, mem_base = uicr, UICR_BASE
+        else:
+            mem, mem_base = flash, 0
+        length = len(expected)
+        rel = addr - mem_base
+        if rel < 0 or rel + length > len(mem):
+            ranges.append((addr, addr + length))
+        elif mem[rel:rel + length] != expected:
+            _diff_bytes(mem[rel:rel + length], expected, addr, ranges)
+        compared += length
+
+    return _merge_ranges(ranges), compared
+
+
+def _diff_bytes(actual, expected, addr, ranges):
+    """在一頁內找出不同的位元組區間"""
+    run_start = None
+    for i in range(len(expected)):
+        if actual[i] != expected[i]:
+            if run_start is None:
+                run_start = i
+        elif run_start is not None:
+            ranges.append((addr + run_start, addr + i))
+            run_start = None
+    if run_start is not None:
+        ranges.append((addr + run_start, addr + len(expected)))
+
+
+def _merge_ranges(ranges, gap=16):
+    """合併間隔小於 gap 的差異範圍"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def format_diff(ranges, compared, limit=50):
+    """差異報告文字"""
+    if not ranges:
+        return f"✓ 與映像一致 (比對 {compared} 位元組)\n"
+    changed = sum(end - start for start, end in ranges)
+    lines = [f"✗ {len(ranges)} 個差異範圍, 共 {changed} 位元組 (比對 {compared} 位元組)"]
+    for start, end in ranges[:limit]:
+        lines.append(f"  0x{start:08X} - 0x{end:08X}  ({end - start} 位元組)")
+    if len(ranges) > limit:
+        lines.append(f"  ... 其餘 {len(ranges) - limit} 個範圍省略")
+    return "\n".join(lines) + "\n"
+
+
+def export_hex(dump, out_path, skip_erased=True):
+    """將讀回的 Flash 與 UICR 匯出為 Intel HEX (略過全為 0xFF 的頁面)"""
+    with open(out_path, 'w', encoding='ascii') as f:
+        for name in ('flash', 'uicr'):
+            base, _, size = dump.regions[name]
+            mem = dump.region(name)
+            for page in range(0, size, PAGE_SIZE):
+                chunk = mem[page:page + PAGE_SIZE]
+                if skip_erased and chunk == b'\xff' * len(chunk):
+                    continue
+                addr = base + page
+                _write_hex_record(f, 0x04, 0, struct.pack('>H', addr >> 16))
+                for i in range(0, len(chunk), 16):
+                    _write_hex_record(f, 0x00, (addr + i) & 0xFFFF, bytes(chunk[i:i + 16]))
+        _write_hex_record(f, 0x01, 0, b'')
+
+
+def _write_hex_record(f, rec_type, addr, data):
+    record = bytes([len(data), addr >> 8, addr & 0xFF, rec_type]) + data
+    f.write(':' + (record + bytes([(-sum(record)) & 0xFF])).hex().upper() + '\n')
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 3:
+        print("用法: python readback.py DUMP.bin IMAGE.hex")
+        sys.exit(2)
+    with DumpFile(sys.argv[1]) as dump:
+        print(format_diff(*diff_image(dump, sys.argv[2])), end='')
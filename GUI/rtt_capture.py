@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+重置後擷取 RTT 日誌
+韌體以 NRF_LOG_ENABLED 1 建置時，NRF_LOG 經由 RTT up-buffer 0 輸出
+(sdk_config.h NRF_LOG_BACKEND_RTT_ENABLED)。重置後在 RAM 中尋找 RTT
+控制區塊，持續讀取 up-buffer 直到出現指定的字串樣式或逾時。
+
+讀取在燒錄執行緒中以探針能達到的最高頻率輪詢 (有資料時不等待)；
+輸出先累積在緩衝區，每隔 FLUSH_INTERVAL 秒才送出一次，
+多個探針同時擷取時不會以大量小段文字塞滿 GUI 的事件佇列。
+"""
+
+import codecs
+import re
+import time
+
+# 單次讀取的最大位元組數 (SEGGER_RTT_CONFIG_BUFFER_SIZE_UP 為 512)
+READ_SIZE = 1024
+
+# 沒有資料時的輪詢間隔 (秒)
+IDLE_POLL = 0.001
+
+# 輸出緩衝送出間隔 (秒)
+FLUSH_INTERVAL = 0.05
+
+# 尋找控制區塊的最長時間 (秒)
+CONTROL_BLOCK_TIMEOUT = 2.0
+
+# 樣式比對保留的前一段文字長度 (樣式可能跨越兩次讀取)
+PATTERN_OVERLAP = 256
+
+STOP_PATTERN = 'pattern'
+STOP_TIMEOUT = 'timeout'
+STOP_ABORTED = 'aborted'
+
+
+class RttResult:
+    """擷取結果：reason 為 pattern / timeout / aborted"""
+
+    def __init__(self, reason, match=None, received=0, duration=0.0):
+        self.reason = reason
+        self.match = match
+        self.received = received
+        self.duration = duration
+
+
+class RttCapture:
+    """從已連線並正在執行的目標讀取 RTT up-buffer
+
+    output(text) 收到緩衝後的文字；pattern 為正規表示式，出現時停止
+    """
+
+    def __init__(self, api, output, pattern=None, timeout=10.0, channel=0,
+                 stop_check=None, control_block=None):
+        self.api = api
+        self.output = output
+        self.pattern = re.compile(pattern) if pattern else None
+        self.timeout = timeout
+        self.channel = channel
+        self.stop_check = stop_check
+        self.control_block = control_block
+        self._pending = []
+        self._last_flush = 0.0
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        if self._pending and (force or now - self._last_flush >= FLUSH_INTERVAL):
+            self.output(''.join(self._pending))
+            self._pending = []
+            self._last_flush = now
+
+    def _stopped(self):
+        return self.stop_check is not None and self.stop_check()
+
+    def start(self, deadline):
+        """啟動 RTT 並等待找到控制區塊，逾時回傳 False"""
+        if self.control_block is not None:
+            self.api.rtt_set_control_block_address(self.control_block)
+        self.api.rtt_start()
+        cb_deadline = min(deadline, time.monotonic() + CONTROL_BLOCK_TIMEOUT)
+        while not self.api.rtt_is_control_block_found():
+            if time.monotonic() >= cb_deadline or self._stopped():
+                return False
+            time.sleep(0.01)
+        return True
+
+    def run(self):
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        received = 0
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        tail = ''
+        try:
+            if not self.start(deadline):
+                reason = STOP_ABORTED if self._stopped() else STOP_TIMEOUT
+                return RttResult(reason, duration=time.monotonic() - t0)
+            self._last_flush = time.monotonic()
+            while True:
+                if self._stopped():
+                    return RttResult(STOP_ABORTED, received=received, duration=time.monotonic() - t0)
+                if time.monotonic() >= deadline:
+                    return RttResult(STOP_TIMEOUT, received=received, duration=time.monotonic() - t0)
+                data = self.api.rtt_read(self.channel, READ_SIZE, encoding=None)
+                if not data:
+                    self._flush()
+                    time.sleep(IDLE_POLL)
+                    continue
+                received += len(data)
+                text = decoder.decode(bytes(data))
+                self._pending.append(text)
+                if self.pattern is not None:
+                    window = tail + text
+                    match = self.pattern.search(window)
+                    if match:
+                        return RttResult(STOP_PATTERN, match.group(0), received,
+                                         time.monotonic() - t0)
+                    tail = window[-PATTERN_OVERLAP:]
+                self._flush()
+        finally:
+            self._flush(force=True)
+            try:
+                self.api.rtt_stop()
+            except Exception:
+                pass
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SWD 時脈校準
+每個探針 (序號) 在每個治具上從最高的 SWD 時脈開始連線，以一小段讀取比對
+確認連線可靠，失敗就降一級；找到的時脈依「探針序號 + 治具」快取在
+swd_speeds.json，之後直接使用。工作中步驟逾時、J-Link 通訊錯誤或讀回比對
+不符時把快取降一級，線材較長的治具不會再隨機失敗。
+
+治具名稱由環境變數 NRF_FIXTURE 或 flasher_service.py serve --fixture 指定。
+
+用法:
+  python swd_speed.py            列出快取
+  python swd_speed.py --clear    清除快取 (下次連線重新校準)
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+CACHE_PATH = Path(__file__).parent / "swd_speeds.json"
+
+# 由高到低嘗試的 SWD 時脈 (kHz)；超過探針上限時 J-Link 會自動使用上限
+SPEEDS_KHZ = (12000, 8000, 4000, 2000, 1000, 500, 125)
+
+# pynrfjprog 預設時脈 (校準失敗時使用)
+DEFAULT_SPEED_KHZ = 2000
+
+DEFAULT_FIXTURE = os.environ.get("NRF_FIXTURE") or "default"
+
+# 快取超過此時間 (秒) 重新校準
+MAX_AGE = 7 * 24 * 3600
+
+# 校準讀取：FICR 開頭 (CODEPAGESIZE 應為 0x1000) 與 Flash 第一頁
+FICR_BASE = 0x10000000
+FICR_CODEPAGESIZE = 0x10000010
+VERIFY_REGIONS = ((FICR_BASE, 0x100), (0x0, 0x1000))
+VERIFY_ROUNDS = 2
+
+# pynrfjprog APIError 中屬於 SWD/J-Link 通訊的錯誤碼 (NrfjprogdllErr 名稱)，
+# 時脈超過治具能承受的範圍時會隨機發生
+LINK_ERROR_CODES = ('CANNOT_CONNECT', 'EMULATOR_NOT_CONNECTED', 'NVMC_ERROR',
+                    'JLINKARM_DLL_ERROR', 'JLINKARM_DLL_READ_ERROR',
+                    'JLINKARM_DLL_TIME_OUT_ERROR', 'TIME_OUT')
+
+_lock = threading.Lock()
+
+
+class LinkError(RuntimeError):
+    """讀回的內容與寫入的不符 (時脈過高時可能發生)"""
+
+
+def is_link_error(error):
+    """SWD 通訊錯誤：LinkError 或錯誤碼屬於 LINK_ERROR_CODES 的 APIError"""
+    if isinstance(error, LinkError):
+        return True
+    code = getattr(error, 'err_code', None)
+    return getattr(code, 'name', None) in LINK_ERROR_CODES
+
+
+def _key(snr, fixture):
+    return f"{snr}@{fixture or DEFAULT_FIXTURE}"
+
+
+class SpeedCache:
+    """探針序號 + 治具 → SWD 時脈；多個工作執行緒共用同一個檔案"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = Path(path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, data):
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def get(self, snr, fixture=None):
+        """快取的時脈；沒有或已過期時回傳 None"""
+        with _lock:
+            entry = self._load().get(_key(snr, fixture))
+        if not entry or time.time() - entry.get('calibrated', 0) > MAX_AGE:
+            return None
+        return entry['khz']
+
+    def set(self, snr, fixture, khz):
+        with _lock:
+            data = self._load()
+            data[_key(snr, fixture)] = {'khz': khz, 'calibrated': time.time(), 'demoted': 0}
+            self._save(data)
+
+    def demote(self, snr, fixture, khz):
+        """khz 發生錯誤：快取降為下一級並回傳新的時脈 (已是最低時回傳 None)"""
+        lower = [s for s in SPEEDS_KHZ if s < khz]
+        with _lock:
+            data = self._load()
+            entry = data.get(_key(snr, fixture))
+            if entry is None or entry['khz'] > khz:
+                return entry['khz'] if entry else None
+            if not lower:
+                return None
+            entry['khz'] = lower[0]
+            entry['demoted'] = entry.get('demoted', 0) + 1
+            self._save(data)
+        return lower[0]
+
+    def entries(self):
+        with _lock:
+            return self._load()
+
+    def clear(self):
+        with _lock:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+
+
+def verify_link(api):
+    """讀取 FICR 與 Flash 第一頁數次並比對；連線不可靠時回傳 False"""
+    try:
+        if api.read_u32(FICR_CODEPAGESIZE) != 0x1000:
+            return False
+        for addr, length in VERIFY_REGIONS:
+            first = bytes(api.read(addr, length))
+            for _ in range(VERIFY_ROUNDS - 1):
+                if bytes(api.read(addr, length)) != first:
+                    return False
+    except Exception:
+        return False
+    return True
+
+
+def is_protected(api):
+    """APPROTECT 啟用 (readback_status 不是 NONE)"""
+    try:
+        status = api.readback_status()
+    except Exception:
+        return False
+    return getattr(status, 'name', str(status)) != 'NONE'
+
+
+def calibrate(api, snr, speeds=SPEEDS_KHZ, log=None):
+    """由高到低連線並驗證，回傳第一個可靠的時脈並保持連線；都失敗時回傳 None
+
+    讀取保護啟用時無法以讀取驗證，同樣回傳 None (不快取，以預設時脈連線，下次連線再校準)
+    """
+    for khz in speeds:
+        try:
+            if api.is_connected_to_emu():
+                api.disconnect_from_emu()
+            api.connect_to_emu_with_snr(snr, khz)
+        except Exception as e:
+            if log:
+                log(f"  {khz} kHz: 連線失敗 ({str(e)})\n")
+            continue
+        if is_protected(api):
+            break
+        if verify_link(api):
+            return khz
+        if log:
+            log(f"  {khz} kHz: 讀取比對失敗\n")
+    if api.is_connected_to_emu():
+        api.disconnect_from_emu()
+    return None
+
+
+def main():
+    cache = SpeedCache()
+    if '--clear' in sys.argv:
+        cache.clear()
+        print("SWD 時脈快取已清除")
+        return 0
+    entries = cache.entries()
+    if not entries:
+        print("沒有快取的 SWD 時脈")
+        return 0
+    for key, entry in sorted(entries.items()):
+        when = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.get('calibrated', 0)))
+        demoted = f", 降級 {entry['demoted']} 次" if entry.get('demoted') else ""
+        print(f"{key:<30} {entry['khz']:>6} kHz  (校準於 {when}{demoted})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,123 +2,287 @@
 """
 pynrfjprog 整合驗證腳本
 檢查所有依賴和配置是否正確
+
+各項檢查同時執行 (匯入測試在獨立的子程序中進行)，結果依直譯器、套件版本、
+J-Link 函式庫與程式檔案快取在 setup_report.json；沒有變動時直接使用上次結果。
+nrf_flasher.py 啟動時讀取同一份報告，提早顯示環境問題。
+
+用法:
+  python verify_setup.py           檢查並顯示結果
+  python verify_setup.py --force   忽略快取重新檢查
+  python verify_setup.py --json    輸出 JSON 報告
 """
 
-import sys
+import glob
+import hashlib
+import json
+import os
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def check_python():
+GUI_DIR = Path(__file__).parent
+REPORT_PATH = GUI_DIR / "setup_report.json"
+REPORT_VERSION = 1
+
+# 需要檢查版本的套件 (PyPI 名稱)
+PACKAGES = ('pynrfjprog', 'PyQt6')
+
+# J-Link 函式庫名稱與常見安裝位置
+if sys.platform.startswith('win'):
+    JLINK_NAMES = ('JLinkARM.dll', 'JLink_x64.dll')
+    JLINK_DIRS = [r"C:\Program Files\SEGGER\JLink*", r"C:\Program Files (x86)\SEGGER\JLink*"]
+elif sys.platform == 'darwin':
+    JLINK_NAMES = ('libjlinkarm.dylib',)
+    JLINK_DIRS = ["/Applications/SEGGER/JLink*"]
+else:
+    JLINK_NAMES = ('libjlinkarm.so', 'libjlinkarm.so.*')
+    JLINK_DIRS = ["/opt/SEGGER/JLink*", "/usr/lib", "/usr/local/lib"]
+
+# 匯入測試的逾時秒數
+IMPORT_TIMEOUT = 30
+
+
+def package_version(name):
+    try:
+        from importlib import metadata
+        return metadata.version(name)
+    except Exception:
+        return None
+
+
+def find_jlink_libraries():
+    """在 PATH、函式庫路徑與 SEGGER 預設安裝目錄中尋找 J-Link 函式庫 (不啟動子程序)"""
+    dirs = []
+    for var in ('PATH', 'LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH'):
+        dirs += [d for d in os.environ.get(var, '').split(os.pathsep) if d]
+    for pattern in JLINK_DIRS:
+        dirs += sorted(glob.glob(pattern), reverse=True)
+
+    found = []
+    seen = set()
+    for directory in dirs:
+        for name in JLINK_NAMES:
+            for path in glob.glob(os.path.join(glob.escape(directory), name)):
+                real = os.path.realpath(path)
+                if real not in seen and os.path.isfile(real):
+                    seen.add(real)
+                    found.append(path)
+    return found
+
+
+def _stat_entry(path):
+    try:
+        stat = os.stat(path)
+        return [str(path), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [str(path), None, None]
+
+
+def environment_key(jlink_libraries):
+    """快取鍵：直譯器、套件版本、J-Link 函式庫與 GUI 程式檔案"""
+    data = {
+        'executable': sys.executable,
+        'python': sys.version,
+        'platform': sys.platform,
+        'packages': {name: package_version(name) for name in PACKAGES},
+        'jlink': [_stat_entry(p) for p in jlink_libraries],
+        'sources': [_stat_entry(p) for p in sorted(GUI_DIR.glob("*.py"))],
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _result(ok, detail, fix=None):
+    return {'ok': ok, 'detail': detail, 'fix': fix}
+
+
+def _run_import(code):
+    """在子程序中執行匯入測試，回傳 (成功, 輸出)"""
+    try:
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                timeout=IMPORT_TIMEOUT, cwd=str(GUI_DIR))
+    except subprocess.TimeoutExpired:
+        return False, f"匯入逾時 ({IMPORT_TIMEOUT} 秒)"
+    output = (result.stdout if result.returncode == 0 else result.stderr).strip()
+    return result.returncode == 0, output.splitlines()[-1] if output else ""
+
+
+def check_python(context):
     """檢查 Python 版本"""
-    print("[1/6] 檢查 Python 版本...")
     version = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
     if sys.version_info >= (3, 8):
-        print(f"  ✓ Python {version}")
-        return True
-    else:
-        print(f"  ✗ Python {version} (需要 3.8+)")
-        return False
+        return _result(True, f"Python {version}")
+    return _result(False, f"Python {version} (需要 3.8+)", "安裝 Python 3.8 或更新版本")
 
-def check_pynrfjprog():
+
+def check_pynrfjprog(context):
     """檢查 pynrfjprog"""
-    print("\n[2/6] 檢查 pynrfjprog...")
-    try:
-        sys.path.insert(0, str(Path(__file__).parent / "pynrfjprog-10.24.0"))
-        from pynrfjprog import HighLevel, LowLevel
-        print(f"  ✓ pynrfjprog 已安裝")
-        return True
-    except ImportError as e:
-        print(f"  ✗ pynrfjprog 導入失敗: {e}")
-        return False
-
-def check_pyqt6():
+    ok, output = _run_import(
+        "import pynrfjprog\n"
+        "from pynrfjprog import HighLevel, LowLevel\n"
+        "print(getattr(pynrfjprog, '__version__', ''))")
+    if ok:
+        version = output or context['packages'].get('pynrfjprog')
+        return _result(True, f"pynrfjprog {version} 已安裝" if version else "pynrfjprog 已安裝")
+    return _result(False, f"pynrfjprog 導入失敗: {output}", "pip install pynrfjprog")
+
+
+def check_pyqt6(context):
     """檢查 PyQt6"""
-    print("\n[3/6] 檢查 PyQt6...")
-    try:
-        from PyQt6.QtCore import QT_VERSION_STR
-        print(f"  ✓ PyQt6 已安裝")
-        return True
-    except ImportError:
-        print(f"  ✗ PyQt6 未安裝")
-        print("  修復: pip install PyQt6>=6.6.0")
-        return False
-
-def check_jlink():
-    """檢查 J-Link 驅動"""
-    print("\n[4/6] 檢查 J-Link DLL...")
-    try:
-        result = subprocess.run(
-            ["where", "JLinkARM.dll"],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            jlink_path = result.stdout.strip()
-            print(f"  ✓ JLinkARM.dll 找到: {jlink_path}")
-            return True
-        else:
-            print(f"  ✗ JLinkARM.dll 未找到")
-            print("  修復: 安裝 SEGGER J-Link Software Pack")
-            print("  下載: https://www.segger.com/jlink-software.html")
-            return False
-    except Exception as e:
-        print(f"  ✗ 檢查失敗: {e}")
-        return False
+    ok, output = _run_import("from PyQt6.QtCore import QT_VERSION_STR\nprint(QT_VERSION_STR)")
+    if ok:
+        return _result(True, f"PyQt6 已安裝 (Qt {output})")
+    return _result(False, f"PyQt6 未安裝: {output}", "pip install PyQt6>=6.6.0")
+
+
+def check_jlink(context):
+    """檢查 J-Link 函式庫"""
+    libraries = context['jlink']
+    if libraries:
+        return _result(True, f"{os.path.basename(libraries[0])} 找到: {libraries[0]}")
+    return _result(False, f"{JLINK_NAMES[0]} 未找到",
+                   "安裝 SEGGER J-Link Software Pack: https://www.segger.com/jlink-software.html")
 
-def check_nrf_flasher():
+
+def check_nrf_flasher(context):
     """檢查 nrf_flasher.py"""
-    print("\n[5/6] 檢查 nrf_flasher.py...")
-    flasher_path = Path(__file__).parent / "nrf_flasher.py"
-    if flasher_path.exists():
-        print(f"  ✓ nrf_flasher.py 找到")
-        return True
-    else:
-        print(f"  ✗ nrf_flasher.py 未找到")
-        return False
+    if (GUI_DIR / "nrf_flasher.py").exists():
+        return _result(True, "nrf_flasher.py 找到")
+    return _result(False, "nrf_flasher.py 未找到")
+
+
+def check_gui_sources(context):
+    """檢查 GUI 程式語法 (只編譯，不執行)"""
+    for path in sorted(GUI_DIR.glob("*.py")):
+        try:
+            with open(path, encoding='utf-8') as f:
+                compile(f.read(), str(path), 'exec')
+        except (SyntaxError, UnicodeDecodeError, OSError) as e:
+            return _result(False, f"{path.name} 語法錯誤: {e}")
+    return _result(True, "GUI 程式語法正確")
 
-def check_gui_startup():
-    """檢查 GUI 是否能啟動"""
-    print("\n[6/6] 檢查 GUI 匯入...")
+
+# (代碼, 標題, 檢查函式, 失敗時是否無法燒錄)
+CHECKS = [
+    ('python', "檢查 Python 版本", check_python, True),
+    ('pynrfjprog', "檢查 pynrfjprog", check_pynrfjprog, True),
+    ('pyqt6', "檢查 PyQt6", check_pyqt6, False),
+    ('jlink', "檢查 J-Link 函式庫", check_jlink, True),
+    ('nrf_flasher', "檢查 nrf_flasher.py", check_nrf_flasher, False),
+    ('gui_sources', "檢查 GUI 程式語法", check_gui_sources, False),
+]
+
+
+def _timed(func, context):
+    t0 = time.perf_counter()
     try:
-        flasher_path = Path(__file__).parent / "nrf_flasher.py"
-        with open(flasher_path, encoding='utf-8') as f:
-            code = compile(f.read(), flasher_path, 'exec')
-        # 只編譯,不執行
-        print(f"  ✓ nrf_flasher.py 語法正確")
-        return True
+        result = func(context)
     except Exception as e:
-        print(f"  ✗ 語法錯誤: {e}")
-        return False
+        result = _result(False, f"檢查失敗: {e}")
+    result['duration'] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def load_report(path=REPORT_PATH):
+    """讀取上次的報告，不存在或格式不符時回傳 None"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        if report.get('version') == REPORT_VERSION:
+            return report
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def save_report(report, path=REPORT_PATH):
+    tmp_path = Path(path).with_suffix('.tmp')
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def run_diagnostics(force=False, path=REPORT_PATH):
+    """執行所有檢查並回傳報告 (dict)；環境沒有變動時直接使用快取"""
+    jlink = find_jlink_libraries()
+    key = environment_key(jlink)
+    if not force:
+        cached = load_report(path)
+        if cached and cached.get('key') == key:
+            cached['cached'] = True
+            return cached
+
+    context = {'jlink': jlink, 'packages': {name: package_version(name) for name in PACKAGES}}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(CHECKS)) as pool:
+        futures = [pool.submit(_timed, func, context) for _, _, func, _ in CHECKS]
+        results = [f.result() for f in futures]
+
+    checks = []
+    for (check_id, title, _, required), result in zip(CHECKS, results):
+        checks.append(dict(result, id=check_id, title=title, required=required))
+    report = {
+        'version': REPORT_VERSION,
+        'key': key,
+        'generated': time.time(),
+        'platform': sys.platform,
+        'python': sys.executable,
+        'packages': context['packages'],
+        'jlink': jlink,
+        'ok': all(c['ok'] for c in checks),
+        'can_flash': all(c['ok'] for c in checks if c['required']),
+        'duration': round(time.perf_counter() - t0, 3),
+        'checks': checks,
+    }
+    save_report(report, path)
+    report['cached'] = False
+    return report
+
+
+def failed_checks(report):
+    """未通過的檢查"""
+    return [c for c in report['checks'] if not c['ok']]
+
 
 def main():
+    if '--json' in sys.argv:
+        print(json.dumps(run_diagnostics(force='--force' in sys.argv), indent=1, ensure_ascii=False))
+        return 0
+
     print("=" * 60)
     print("nRF52 Flasher - pynrfjprog 整合驗證")
     print("=" * 60)
     print()
-    
-    checks = [
-        check_python(),
-        check_pynrfjprog(),
-        check_pyqt6(),
-        check_jlink(),
-        check_nrf_flasher(),
-        check_gui_startup(),
-    ]
-    
+
+    t0 = time.perf_counter()
+    report = run_diagnostics(force='--force' in sys.argv)
+    total = len(report['checks'])
+    for index, check in enumerate(report['checks'], 1):
+        print(f"[{index}/{total}] {check['title']}...")
+        print(f"  {'✓' if check['ok'] else '✗'} {check['detail']}")
+        if not check['ok'] and check.get('fix'):
+            print(f"  修復: {check['fix']}")
+
     print("\n" + "=" * 60)
-    passed = sum(checks)
-    total = len(checks)
-    print(f"結果: {passed}/{total} 檢查通過")
+    passed = total - len(failed_checks(report))
+    print(f"結果: {passed}/{total} 檢查通過 "
+          f"({'使用快取, ' if report['cached'] else ''}{time.perf_counter() - t0:.2f} 秒)")
     print("=" * 60)
-    
-    if all(checks):
+
+    if report['ok']:
         print("\n✓ 所有檢查通過!")
         print("\n執行以下命令啟動 GUI:")
-        print("  run.bat")
+        print("  run.bat" if sys.platform.startswith('win') else "  python3 nrf_flasher.py")
         return 0
     else:
         print("\n✗ 部分檢查失敗,請查看上面的修復建議")
         return 1
 
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+VESC 封包格式 (與韌體 packet.c / crc.c / datatypes.h 相同)
+
+封包: 起始位元組 (2: 1 位元組長度, 3: 2 位元組長度) + 長度 + 資料
+      + CRC16 (XMODEM, 高位元組在前) + 結束位元組 3
+資料第一個位元組為 COMM_PACKET_ID
+"""
+
+import collections
+import re
+import struct
+import time
+
+PACKET_MAX_PL_LEN = 512
+
+# 韌體 packet.c 在 PACKET_RX_TIMEOUT (ms) 沒有收到資料後重設接收狀態
+PACKET_RX_TIMEOUT = 0.1
+
+# datatypes.h COMM_PACKET_ID (依序)
+COMM_NAMES = (
+    'COMM_FW_VERSION', 'COMM_JUMP_TO_BOOTLOADER', 'COMM_ERASE_NEW_APP',
+    'COMM_WRITE_NEW_APP_DATA', 'COMM_GET_VALUES', 'COMM_SET_DUTY', 'COMM_SET_CURRENT',
+    'COMM_SET_CURRENT_BRAKE', 'COMM_SET_RPM', 'COMM_SET_POS', 'COMM_SET_HANDBRAKE',
+    'COMM_SET_DETECT', 'COMM_SET_SERVO_POS', 'COMM_SET_MCCONF', 'COMM_GET_MCCONF',
+    'COMM_GET_MCCONF_DEFAULT', 'COMM_SET_APPCONF', 'COMM_GET_APPCONF',
+    'COMM_GET_APPCONF_DEFAULT', 'COMM_SAMPLE_PRINT', 'COMM_TERMINAL_CMD', 'COMM_PRINT',
+    'COMM_ROTOR_POSITION', 'COMM_EXPERIMENT_SAMPLE', 'COMM_DETECT_MOTOR_PARAM',
+    'COMM_DETECT_MOTOR_R_L', 'COMM_DETECT_MOTOR_FLUX_LINKAGE', 'COMM_DETECT_ENCODER',
+    'COMM_DETECT_HALL_FOC', 'COMM_REBOOT', 'COMM_ALIVE', 'COMM_GET_DECODED_PPM',
+    'COMM_GET_DECODED_ADC', 'COMM_GET_DECODED_CHUK', 'COMM_FORWARD_CAN',
+    'COMM_SET_CHUCK_DATA', 'COMM_CUSTOM_APP_DATA', 'COMM_NRF_START_PAIRING',
+    'COMM_GPD_SET_FSW', 'COMM_GPD_BUFFER_NOTIFY', 'COMM_GPD_BUFFER_SIZE_LEFT',
+    'COMM_GPD_FILL_BUFFER', 'COMM_GPD_OUTPUT_SAMPLE', 'COMM_GPD_SET_MODE',
+    'COMM_GPD_FILL_BUFFER_INT8', 'COMM_GPD_FILL_BUFFER_INT16',
+    'COMM_GPD_SET_BUFFER_INT_SCALE', 'COMM_GET_VALUES_SETUP', 'COMM_SET_MCCONF_TEMP',
+    'COMM_SET_MCCONF_TEMP_SETUP', 'COMM_GET_VALUES_SELECTIVE',
+    'COMM_GET_VALUES_SETUP_SELECTIVE', 'COMM_EXT_NRF_PRESENT',
+    'COMM_EXT_NRF_ESB_SET_CH_ADDR', 'COMM_EXT_NRF_ESB_SEND_DATA', 'COMM_EXT_NRF_ESB_RX_DATA',
+    'COMM_EXT_NRF_SET_ENABLED', 'COMM_DETECT_MOTOR_FLUX_LINKAGE_OPENLOOP',
+    'COMM_DETECT_APPLY_ALL_FOC', 'COMM_JUMP_TO_BOOTLOADER_ALL_CAN',
+    'COMM_ERASE_NEW_APP_ALL_CAN', 'COMM_WRITE_NEW_APP_DATA_ALL_CAN', 'COMM_PING_CAN',
+    'COMM_APP_DISABLE_OUTPUT', 'COMM_TERMINAL_CMD_SYNC', 'COMM_GET_IMU_DATA',
+    'COMM_BM_CONNECT', 'COMM_BM_ERASE_FLASH_ALL', 'COMM_BM_WRITE_FLASH', 'COMM_BM_REBOOT',
+    'COMM_BM_DISCONNECT', 'COMM_BM_MAP_PINS_DEFAULT', 'COMM_BM_MAP_PINS_NRF5X',
+    'COMM_ERASE_BOOTLOADER', 'COMM_ERASE_BOOTLOADER_ALL_CAN', 'COMM_PLOT_INIT',
+    'COMM_PLOT_DATA', 'COMM_PLOT_ADD_GRAPH', 'COMM_PLOT_SET_GRAPH',
+    'COMM_GET_DECODED_BALANCE', 'COMM_BM_MEM_READ', 'COMM_WRITE_NEW_APP_DATA_LZO',
+    'COMM_WRITE_NEW_APP_DATA_ALL_CAN_LZO', 'COMM_BM_WRITE_FLASH_LZO',
+    'COMM_SET_CURRENT_REL', 'COMM_CAN_FWD_FRAME', 'COMM_SET_BATTERY_CUT',
+    'COMM_SET_BLE_NAME', 'COMM_SET_BLE_PIN', 'COMM_SET_CAN_MODE',
+    'COMM_GET_IMU_CALIBRATION', 'COMM_GET_MCCONF_TEMP',
+)
+COMM = {name: index for index, name in enumerate(COMM_NAMES)}
+
+COMM_FW_VERSION = COMM['COMM_FW_VERSION']
+COMM_ERASE_NEW_APP = COMM['COMM_ERASE_NEW_APP']
+COMM_WRITE_NEW_APP_DATA = COMM['COMM_WRITE_NEW_APP_DATA']
+COMM_EXT_NRF_PRESENT = COMM['COMM_EXT_NRF_PRESENT']
+COMM_EXT_NRF_ESB_SET_CH_ADDR = COMM['COMM_EXT_NRF_ESB_SET_CH_ADDR']
+COMM_EXT_NRF_ESB_SEND_DATA = COMM['COMM_EXT_NRF_ESB_SEND_DATA']
+COMM_EXT_NRF_ESB_RX_DATA = COMM['COMM_EXT_NRF_ESB_RX_DATA']
+COMM_EXT_NRF_SET_ENABLED = COMM['COMM_EXT_NRF_SET_ENABLED']
+COMM_SET_BLE_NAME = COMM['COMM_SET_BLE_NAME']
+COMM_SET_BLE_PIN = COMM['COMM_SET_BLE_PIN']
+
+# datatypes.h MOTE_PACKET (ESB 遙控器封包的第一個位元組)
+MOTE_NAMES = (
+    'BATT_LEVEL', 'BUTTONS', 'ALIVE', 'FILL_RX_BUFFER', 'FILL_RX_BUFFER_LONG',
+    'PROCESS_RX_BUFFER', 'PROCESS_SHORT_BUFFER', 'PAIRING_INFO',
+)
+MOTE_PACKET_BUTTONS = MOTE_NAMES.index('BUTTONS')
+
+CRC16_TABLE = []
+for _i in range(256):
+    _crc = _i << 8
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x1021 if _crc & 0x8000 else _crc << 1) & 0xFFFF
+    CRC16_TABLE.append(_crc)
+CRC16_TABLE = tuple(CRC16_TABLE)
+
+_START_BYTE = re.compile(b'[\x02\x03]')
+
+
+def crc16(data):
+    """與 crc.c crc16() 相同 (CRC-16/XMODEM)"""
+    crc = 0
+    table = CRC16_TABLE
+    for b in data:
+        crc = table[((crc >> 8) ^ b) & 0xFF] ^ ((crc << 8) & 0xFFFF)
+    return crc
+
+
+def comm_name(command):
+    if 0 <= command < len(COMM_NAMES):
+        return COMM_NAMES[command]
+    return f"COMM_{command}"
+
+
+def mote_name(packet_type):
+    if 0 <= packet_type < len(MOTE_NAMES):
+        return MOTE_NAMES[packet_type]
+    return f"MOTE_{packet_type}"
+
+
+def encode_packet(payload):
+    """與 packet_send_packet() 相同的封包"""
+    length = len(payload)
+    if length == 0 or length > PACKET_MAX_PL_LEN:
+        raise ValueError(f"封包長度錯誤: {length}")
+    if length <= 255:
+        header = bytes((2, length))
+    else:
+        header = bytes((3, length >> 8, length & 0xFF))
+    return header + bytes(payload) + struct.pack('>HB', crc16(payload), 3)
+
+
+def esb_payload_with_crc(data):
+    """與 rfhelp_send_data_crc() 相同：ESB 資料後附加 CRC16"""
+    return bytes(data) + struct.pack('>H', crc16(data))
+
+
+class PacketDecoder:
+    """從位元組串流中解出封包 (一次處理整段資料)
+
+    與 packet_process_byte() 相同：結構錯誤或 CRC 不符時跳過一個位元組重新同步
+    """
+
+    def __init__(self, max_len=PACKET_MAX_PL_LEN):
+        self.max_len = max_len
+        self.buffer = bytearray()
+        self.packets = 0
+        self.dropped = 0
+        # 解碼嘗試次數與計算 CRC 的位元組數 (packet_fuzz.py 比較重新同步成本)
+        self.attempts = 0
+        self.crc_bytes = 0
+
+    def reset(self):
+        """與 packet_reset() 相同 (韌體在接收逾時後呼叫)"""
+        self.dropped += len(self.buffer)
+        self.buffer.clear()
+
+    def _try_decode(self, buf, pos, end):
+        """回傳 (封包長度, 資料起點, 資料長度)；-1 結構錯誤，-2 需要更多資料"""
+        self.attempts += 1
+        start = buf[pos]
+        available = end - pos
+        if available < start:
+            return -2, 0, 0
+        if start == 2:
+            length = buf[pos + 1]
+            if length < 1:
+                return -1, 0, 0
+        else:
+            length = buf[pos + 1] << 8 | buf[pos + 2]
+            if length < 255:
+                return -1, 0, 0
+        if length > self.max_len:
+            return -1, 0, 0
+        total = start + length + 3
+        if available < total:
+            return -2, 0, 0
+        if buf[pos + total - 1] != 3:
+            return -1, 0, 0
+        data_start = pos + start
+        crc_rx = buf[data_start + length] << 8 | buf[data_start + length + 1]
+        self.crc_bytes += length
+        if crc16(memoryview(buf)[data_start:data_start + length]) != crc_rx:
+            return -1, 0, 0
+        return total, data_start, length
+
+    def feed(self, data):
+        """加入資料並回傳解出的封包資料 (bytes) 清單"""
+        buf = self.buffer
+        buf += data
+        end = len(buf)
+        pos = 0
+        packets = []
+        while pos < end:
+            match = _START_BYTE.search(buf, pos)
+            if match is None:
+                self.dropped += end - pos
+                pos = end
+                break
+            self.dropped += match.start() - pos
+            pos = match.start()
+            total, data_start, length = self._try_decode(buf, pos, end)
+            if total == -2:
+                break
+            if total == -1:
+                self.dropped += 1
+                pos += 1
+                continue
+            packets.append(bytes(buf[data_start:data_start + length]))
+            pos += total
+        del buf[:pos]
+        self.packets += len(packets)
+        return packets
+
+
+class PacketLink:
+    """以 VESC 封包收送的雙向連線
+
+    stream 為 pyserial Serial 或相同介面的物件 (write(data)、read(size)、timeout)；
+    接收間隔超過 PACKET_RX_TIMEOUT 時與韌體相同地丟棄不完整的封包
+    """
+
+    def __init__(self, stream, max_len=PACKET_MAX_PL_LEN):
+        self.stream = stream
+        # 以短的讀取逾時輪詢，receive() 的 timeout 才能準確
+        self.stream.timeout = PACKET_RX_TIMEOUT / 4
+        self.decoder = PacketDecoder(max_len)
+        self.sent = 0
+        self.received = 0
+        self._packets = collections.deque()
+        self._last_rx = 0.0
+
+    def send(self, payload):
+        frame = encode_packet(payload)
+        self.stream.write(frame)
+        self.sent += len(frame)
+
+    def receive(self, timeout):
+        """回傳下一個封包資料；timeout 秒內沒有收到時回傳 None"""
+        deadline = time.monotonic() + timeout
+        while not self._packets:
+            if time.monotonic() >= deadline:
+                return None
+            chunk = self.stream.read(max(getattr(self.stream, 'in_waiting', 0), 1))
+            if not chunk:
+                continue
+            now = time.monotonic()
+            if now - self._last_rx > PACKET_RX_TIMEOUT and self.decoder.buffer:
+                self.decoder.reset()
+            self._last_rx = now
+            self.received += len(chunk)
+            self._packets.extend(self.decoder.feed(chunk))
+        return self._packets.popleft()
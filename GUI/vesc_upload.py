@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+VESC 韌體上傳
+與 VESC Tool 相同的上傳流程 (COMM_ERASE_NEW_APP → COMM_WRITE_NEW_APP_DATA ...
+→ COMM_JUMP_TO_BOOTLOADER)，但寫入以管線方式送出：最多 window 個未確認的
+寫入同時在傳輸中，不必等每一段的回覆。nRF 橋接器收到這些命令時暫停自己的
+ESB/心跳封包 (main.c m_other_comm_disable_time)。
+
+映像前面加上 4 位元組長度 + 2 位元組 CRC16 (與 VESC Tool 相同)，每段最多
+CHUNK_SIZE 位元組 (命令 + 位址後不超過 PACKET_MAX_PL_LEN)，全為 0xFF 的段落略過。
+回覆帶有寫入位址 (VESC 韌體 commands.c)，CRC 錯誤的封包被丟棄後該段逾時重送；
+回覆失敗的段落也會重送。回覆不含位址的舊版韌體一次只送一段。
+
+loopback 以模擬的 VESC (傳輸速率、延遲、Flash 寫入時間與隨機位元錯誤)
+代替實際硬體，用來測試上傳流程與視窗大小。
+
+用法:
+  python vesc_upload.py upload VESC.bin --port COM5 [--baudrate 115200] [--window 3]
+  python vesc_upload.py loopback [VESC.bin] [--size 393216] [--latency 0.02] [--corrupt 0.01]
+"""
+
+import argparse
+import heapq
+import os
+import random
+import struct
+import sys
+import time
+
+from vesc_packet import (PacketDecoder, PacketLink, encode_packet, crc16, comm_name,
+                         COMM, COMM_ERASE_NEW_APP, COMM_WRITE_NEW_APP_DATA, PACKET_MAX_PL_LEN)
+
+# 導入 pyserial (使用 pip install pyserial)
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    serial = None
+    SERIAL_AVAILABLE = False
+
+COMM_JUMP_TO_BOOTLOADER = COMM['COMM_JUMP_TO_BOOTLOADER']
+
+DEFAULT_BAUDRATE = 115200
+
+# 每段資料：命令 (1) + 位址 (4) 後不超過 PACKET_MAX_PL_LEN，並對齊 4 位元組
+CHUNK_SIZE = (PACKET_MAX_PL_LEN - 5) & ~3
+
+# nRF52832 橋接器的 UART TX 緩衝 (main.c UART_TX_BUF_SIZE)；
+# 未確認的寫入不超過緩衝，app_uart_put 才不會丟棄資料
+BRIDGE_TX_BUFFER = 2048
+DEFAULT_WINDOW = BRIDGE_TX_BUFFER // (PACKET_MAX_PL_LEN + 6)
+
+# VESC 的最大應用程式大小 (STM32F4 新映像區)
+MAX_IMAGE_SIZE = 393216
+
+ERASE_TIMEOUT = 20.0
+WRITE_TIMEOUT = 1.0
+DEFAULT_RETRIES = 5
+
+
+class UploadError(Exception):
+    """上傳失敗 (擦除失敗、重試用完或沒有回應)"""
+
+
+class UploadResult:
+    """上傳統計"""
+
+    def __init__(self, size):
+        self.size = size
+        self.chunks = 0
+        self.skipped = 0
+        self.resent = 0
+        self.nacks = 0
+        self.erase_time = 0.0
+        self.write_time = 0.0
+        self.dropped = 0
+
+    @property
+    def kbps(self):
+        """寫入階段的有效速率 (KB/s)"""
+        return self.size / 1024 / self.write_time if self.write_time else 0.0
+
+    def describe(self):
+        return (f"{self.size / 1024:.1f} KB, {self.chunks} 段 (略過空白 {self.skipped}), "
+                f"擦除 {self.erase_time:.2f} 秒, 寫入 {self.write_time:.2f} 秒 = {self.kbps:.1f} KB/s, "
+                f"重送 {self.resent} (失敗回覆 {self.nacks}), 丟棄 {self.dropped} 位元組")
+
+
+def load_image(path):
+    """讀取 VESC 韌體 (.bin)"""
+    with open(path, 'rb') as f:
+        firmware = f.read()
+    if not firmware:
+        raise ValueError(f"{path} 是空檔案")
+    if len(firmware) > MAX_IMAGE_SIZE:
+        raise ValueError(f"{path} 超過 {MAX_IMAGE_SIZE // 1024} KB")
+    return firmware
+
+
+def with_header(firmware):
+    """與 VESC Tool 相同：映像前加上長度 (int32) 與 CRC16，高位元組在前"""
+    return struct.pack('>IH', len(firmware), crc16(firmware)) + firmware
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """(位址, 資料) 段落；全為 0xFF 的段落回傳 None 資料 (擦除後不需寫入)"""
+    blank = b'\xff' * chunk_size
+    for offset in range(0, len(data), chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        yield offset, (None if chunk == blank[:len(chunk)] else chunk)
+
+
+class VescUploader:
+    """透過 PacketLink 上傳韌體；window 為同時未確認的寫入段數"""
+
+    def __init__(self, link, window=DEFAULT_WINDOW, chunk_size=CHUNK_SIZE,
+                 timeout=WRITE_TIMEOUT, retries=DEFAULT_RETRIES, progress=None, stop_check=None):
+        if window < 1:
+            raise ValueError("window 至少為 1")
+        if chunk_size + 5 > PACKET_MAX_PL_LEN:
+            raise ValueError(f"chunk_size 最大為 {PACKET_MAX_PL_LEN - 5}")
+        self.link = link
+        self.window = window
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = retries
+        self.progress = progress
+        self.stop_check = stop_check
+
+    def _stopped(self):
+        return self.stop_check is not None and self.stop_check()
+
+    def erase(self, size):
+        """擦除新映像區並等待回覆 (與 VESC Tool 相同，大小包含檔頭)"""
+        self.link.send(struct.pack('>BI', COMM_ERASE_NEW_APP, size))
+        deadline = time.monotonic() + ERASE_TIMEOUT
+        while True:
+            reply = self.link.receive(max(0.0, deadline - time.monotonic()))
+            if reply is None:
+                raise UploadError(f"{ERASE_TIMEOUT:g} 秒內沒有擦除回覆")
+            if reply[0] == COMM_ERASE_NEW_APP:
+                if len(reply) < 2 or not reply[1]:
+                    raise UploadError("VESC 擦除失敗")
+                return
+
+    def _send_write(self, offset, chunk):
+        self.link.send(struct.pack('>BI', COMM_WRITE_NEW_APP_DATA, offset) + chunk)
+
+    def write(self, data, result):
+        """以管線方式寫入所有段落
+
+        第一段單獨送出：回覆沒有位址時 (舊版韌體) 無法分辨是哪一段的回覆，
+        之後改為一次一段
+        """
+        chunks = []
+        for offset, chunk in iter_chunks(data, self.chunk_size):
+            if chunk is None:
+                result.skipped += 1
+            else:
+                chunks.append((offset, chunk))
+        result.chunks = len(chunks)
+        # 位址 → [資料, 送出時間, 已重送次數]，依送出順序排列
+        in_flight = {}
+        written = 0
+        total = sum(len(chunk) for _, chunk in chunks)
+        next_index = 0
+        window = 1
+        while next_index < len(chunks) or in_flight:
+            if self._stopped():
+                raise InterruptedError("上傳已被中止")
+            while next_index < len(chunks) and len(in_flight) < window:
+                offset, chunk = chunks[next_index]
+                next_index += 1
+                self._send_write(offset, chunk)
+                in_flight[offset] = [chunk, time.monotonic(), 0]
+
+            oldest = min(entry[1] for entry in in_flight.values())
+            reply = self.link.receive(max(0.0, oldest + self.timeout - time.monotonic()))
+            if reply is not None and reply[0] == COMM_WRITE_NEW_APP_DATA and in_flight:
+                if len(reply) >= 6:
+                    offset = struct.unpack_from('>I', reply, 2)[0]
+                    window = self.window
+                else:
+                    offset = next(iter(in_flight))
+                entry = in_flight.get(offset)
+                if entry is None:
+                    # 重送後又收到原本那一次的回覆
+                    continue
+                if len(reply) >= 2 and reply[1]:
+                    del in_flight[offset]
+                    written += len(entry[0])
+                    if self.progress:
+                        self.progress(written, total)
+                else:
+                    result.nacks += 1
+                    self._resend(offset, entry, "寫入失敗")
+                    result.resent += 1
+
+            now = time.monotonic()
+            for offset, entry in list(in_flight.items()):
+                if now - entry[1] >= self.timeout:
+                    # 封包或回覆 CRC 錯誤被丟棄
+                    self._resend(offset, entry, "沒有回覆")
+                    result.resent += 1
+
+    def _resend(self, offset, entry, reason):
+        entry[2] += 1
+        if entry[2] > self.retries:
+            raise UploadError(f"位址 0x{offset:06X} {reason}，重試 {self.retries} 次後仍失敗")
+        self._send_write(offset, entry[0])
+        entry[1] = time.monotonic()
+
+    def upload(self, firmware, jump=True):
+        """擦除、寫入並 (jump 時) 讓 VESC 跳到 bootloader 套用新韌體"""
+        data = with_header(firmware)
+        result = UploadResult(len(data))
+        dropped_before = self.link.decoder.dropped
+        t0 = time.perf_counter()
+        self.erase(len(data))
+        t1 = time.perf_counter()
+        result.erase_time = t1 - t0
+        self.write(data, result)
+        result.write_time = time.perf_counter() - t1
+        result.dropped = self.link.decoder.dropped - dropped_before
+        if jump:
+            self.link.send(bytes((COMM_JUMP_TO_BOOTLOADER,)))
+        return result
+
+
+class LoopbackVesc:
+    """模擬的 VESC (與 serial.Serial 相同的 write/read 介面)
+
+    兩個方向各以 baudrate 傳輸並加上 latency；封包依序處理 (擦除與寫入需要時間)，
+    corrupt 為每個封包被翻轉一個位元的機率 (兩個方向)
+    """
+
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, latency=0.02, corrupt=0.0,
+                 erase_time=2.0, write_time=0.002, reply_offset=True, seed=None):
+        self.byte_time = 10.0 / baudrate
+        self.latency = latency
+        self.corrupt = corrupt
+        self.erase_time = erase_time
+        self.write_time = write_time
+        self.reply_offset = reply_offset
+        self.random = random.Random(seed)
+        self.timeout = None
+        self.decoder = PacketDecoder()
+        self.flash = bytearray()
+        self.jumped = False
+        self._rx_busy = 0.0
+        self._cpu_busy = 0.0
+        self._tx_busy = 0.0
+        self._outgoing = []
+        self._ready = bytearray()
+
+    def _maybe_corrupt(self, frame):
+        if self.corrupt and self.random.random() < self.corrupt:
+            frame = bytearray(frame)
+            frame[self.random.randrange(len(frame))] ^= 1 << self.random.randrange(8)
+        return bytes(frame)
+
+    def write(self, data):
+        now = time.monotonic()
+        self._rx_busy = max(now, self._rx_busy) + len(data) * self.byte_time
+        arrival = self._rx_busy + self.latency
+        for payload in self.decoder.feed(self._maybe_corrupt(data)):
+            reply, cost = self._process(payload)
+            self._cpu_busy = max(arrival, self._cpu_busy) + cost
+            if reply is None:
+                continue
+            frame = self._maybe_corrupt(encode_packet(reply))
+            self._tx_busy = max(self._cpu_busy, self._tx_busy) + len(frame) * self.byte_time
+            heapq.heappush(self._outgoing, (self._tx_busy + self.latency, frame))
+        return len(data)
+
+    def _process(self, payload):
+        command = payload[0]
+        if command == COMM_ERASE_NEW_APP:
+            size = struct.unpack_from('>I', payload, 1)[0]
+            self.flash = bytearray(b'\xff' * size)
+            return bytes((command, 1)), self.erase_time * size / MAX_IMAGE_SIZE
+        if command == COMM_WRITE_NEW_APP_DATA:
+            offset = struct.unpack_from('>I', payload, 1)[0]
+            chunk = payload[5:]
+            ok = offset + len(chunk) <= len(self.flash)
+            if ok:
+                self.flash[offset:offset + len(chunk)] = chunk
+            reply = bytes((command, int(ok)))
+            if self.reply_offset:
+                reply += struct.pack('>I', offset)
+            return reply, self.write_time
+        if command == COMM_JUMP_TO_BOOTLOADER:
+            self.jumped = True
+        return None, 0.0
+
+    @property
+    def in_waiting(self):
+        self._collect(time.monotonic())
+        return len(self._ready)
+
+    def _collect(self, now):
+        while self._outgoing and self._outgoing[0][0] <= now:
+            self._ready += heapq.heappop(self._outgoing)[1]
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            now = time.monotonic()
+            self._collect(now)
+            if self._ready or now >= deadline:
+                break
+            next_time = self._outgoing[0][0] if self._outgoing else deadline
+            time.sleep(max(0.0, min(next_time, deadline) - now))
+        data = bytes(self._ready[:size])
+        del self._ready[:size]
+        return data
+
+    def image(self):
+        """寫入的映像 (去掉檔頭)；檔頭長度或 CRC 不符時回傳 None"""
+        if len(self.flash) < 6:
+            return None
+        size, crc = struct.unpack_from('>IH', self.flash)
+        firmware = bytes(self.flash[6:6 + size])
+        return firmware if len(firmware) == size and crc16(firmware) == crc else None
+
+
+def _print_progress(done, total):
+    print(f"\r寫入 {done * 100 // total:3d}%", end='', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VESC 韌體上傳")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('upload', "經由序列埠上傳"), ('loopback', "以模擬的 VESC 測試")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('image', nargs='?' if name == 'loopback' else None, help="VESC 韌體 (.bin)")
+        p.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE)
+        p.add_argument('--window', type=int, default=DEFAULT_WINDOW, help="未確認的寫入段數")
+        p.add_argument('--chunk', type=int, default=CHUNK_SIZE, help="每段位元組數")
+        p.add_argument('--timeout', type=float, default=WRITE_TIMEOUT, help="寫入回覆逾時 (秒)")
+        if name == 'upload':
+            p.add_argument('--port', required=True)
+            p.add_argument('--no-jump', action='store_true', help="寫入後不跳到 bootloader")
+        else:
+            p.add_argument('--size', type=int, default=MAX_IMAGE_SIZE // 2,
+                           help="未指定映像時的隨機映像大小")
+            p.add_argument('--latency', type=float, default=0.02, help="單向延遲 (秒)")
+            p.add_argument('--corrupt', type=float, default=0.0, help="封包位元錯誤機率")
+            p.add_argument('--erase-time', type=float, default=2.0, help="擦除整個映像區的秒數")
+            p.add_argument('--no-offset', action='store_true', help="模擬回覆不含位址的舊版韌體")
+            p.add_argument('--seed', type=int)
+
+    args = parser.parse_args()
+
+    try:
+        if args.image:
+            firmware = load_image(args.image)
+        else:
+            firmware = os.urandom(args.size)
+        if args.command == 'upload':
+            if not SERIAL_AVAILABLE:
+                raise RuntimeError("pyserial 未安裝 (pip install pyserial)")
+            stream = serial.Serial(args.port, args.baudrate)
+        else:
+            stream = LoopbackVesc(args.baudrate, args.latency, args.corrupt, args.erase_time,
+                                  reply_offset=not args.no_offset, seed=args.seed)
+        with_jump = args.command == 'loopback' or not args.no_jump
+        try:
+            link = PacketLink(stream)
+            uploader = VescUploader(link, args.window, args.chunk, args.timeout,
+                                    progress=_print_progress)
+            print(f"擦除 {len(firmware) / 1024:.1f} KB ...")
+            result = uploader.upload(firmware, jump=with_jump)
+            print()
+        finally:
+            if args.command == 'upload':
+                stream.close()
+        print(f"✓ 上傳完成: {result.describe()}")
+        if args.command == 'loopback':
+            if stream.image() != firmware:
+                raise RuntimeError("模擬 VESC 的內容與映像不符")
+            print("✓ 模擬 VESC 的內容與映像相同")
+        elif with_jump:
+            print(f"已送出 {comm_name(COMM_JUMP_TO_BOOTLOADER)}，VESC 重新啟動並套用新韌體")
+    except (OSError, ValueError, RuntimeError, UploadError) as e:
+        print(f"\n錯誤: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+韌體變體平行建置
+每個變體使用獨立的建置目錄 (_build/variants/<名稱>)，可同時編譯、互不干擾；
+完成後與 SoftDevice 合併，放入韌體庫 app_hex/ 並更新 manifest.json
+
+用法:
+  python3 build_variants.py release [選項]              建置所有正式變體
+  python3 build_variants.py custom NAME [NAME] [選項]   建置自訂 BLE 名稱的 nRF52832 變體
+  python3 build_variants.py list                        列出變體
+選項:
+  --only NAME      只建置指定變體 (可重複)
+  --parallel N     同時建置的變體數 (預設: 全部)
+  --jobs N         總編譯工作數 (預設: CPU 核心數，平均分給各變體)
+  --clean          先清除變體的建置目錄
+  --bin            另外輸出 .bin
+  --no-cache       不使用目的檔快取 (objcache.py)
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import objcache
+
+FW_ROOT = Path(__file__).resolve().parent.parent
+BUILD_ROOT = FW_ROOT / "_build" / "variants"
+LIBRARY_DIR = FW_ROOT / "app_hex"
+MANIFEST_PATH = LIBRARY_DIR / "manifest.json"
+MANIFEST_VERSION = 1
+
+CHIP_TARGETS = {'52832': 'nrf52832_xxaa', '52840': 'nrf52840_xxaa'}
+
+# 自訂名稱只允許不需跳脫的字元 (名稱會經過 make 與 shell 傳給編譯器)
+CUSTOM_NAME_RE = re.compile(r'^[A-Za-z0-9_\-]{1,28}$')
+
+
+class Variant:
+    """一個韌體變體：晶片與額外的 -D 定義"""
+
+    def __init__(self, name, chip, defines):
+        self.name = name
+        self.chip = chip
+        self.defines = dict(defines)
+
+    @property
+    def target(self):
+        return CHIP_TARGETS[self.chip]
+
+    @property
+    def build_dir(self):
+        return BUILD_ROOT / self.name
+
+    @property
+    def output_hex(self):
+        return LIBRARY_DIR / f"{self.name}.hex"
+
+    def build_args(self):
+        """傳給 Makefile 的 build_args (加入 CFLAGS)"""
+        args = []
+        for key, value in self.defines.items():
+            if value.startswith('"'):
+                # 字串常數需要在 shell 中保留引號
+                value = value.replace('"', '\\"')
+            args.append(f"-D{key}={value}")
+        return ' '.join(args)
+
+    def make_args(self):
+        return [f"IS_52832={1 if self.chip == '52832' else 0}",
+                f"OUTPUT_DIRECTORY={self.build_dir.relative_to(FW_ROOT).as_posix()}",
+                f"build_args={self.build_args()}"]
+
+
+# 原 rebuild_all 中的正式變體
+RELEASE_VARIANTS = [
+    Variant('nrf52840_vesc_ble_rx11_tx8_led7', '52840', {'MODULE_BUILTIN': '0'}),
+    Variant('nrf52840_vesc_ble_rx26_tx25_led27', '52840', {'MODULE_BUILTIN': '1'}),
+    Variant('nrf52840_stormcore_ble_rx31_tx30_led5', '52840',
+            {'MODULE_BUILTIN': '0', 'MODULE_STORMCORE': '1'}),
+    Variant('nrf52832_vesc_ble_rx7_tx6_led8', '52832', {'MODULE_BUILTIN': '0'}),
+    Variant('nrf52832_vesc_ble_rx6_tx7_led8', '52832', {'MODULE_BUILTIN': '1'}),
+]
+
+
+def custom_variant(dev_name):
+    """原 build_52832：內建模組 + 自訂 BLE 名稱"""
+    if not CUSTOM_NAME_RE.match(dev_name):
+        raise ValueError(f"不支援的裝置名稱: {dev_name!r} (只能使用英數字、_ 與 -，最多 28 字)")
+    return Variant(f"nrf52832_{dev_name}", '52832',
+                   {'MODULE_BUILTIN': '1', 'CUST_DEVICE_NAME': f'"{dev_name}"'})
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=FW_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def softdevice_path(chip):
+    """由 Makefile 取得對應晶片的 SoftDevice HEX 路徑"""
+    result = subprocess.run(['make', '-s', '--no-print-directory',
+                             f"IS_52832={1 if chip == '52832' else 0}", 'print_sd_path'],
+                            cwd=FW_ROOT, capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f"無法取得 SoftDevice 路徑: {result.stderr.strip()}")
+    return result.stdout.strip().splitlines()[-1]
+
+
+class VariantBuilder:
+    """建置單一變體：make (獨立建置目錄) → srec_cat 合併 → 放入韌體庫"""
+
+    def __init__(self, variant, jobs, clean=False, make_bin=False, use_cache=True):
+        self.variant = variant
+        self.jobs = jobs
+        self.clean = clean
+        self.make_bin = make_bin
+        self.use_cache = use_cache
+        self.duration = None
+
+    def prepare_build_dir(self):
+        """旗標改變時清除建置目錄 (Makefile 的相依性不包含 CFLAGS)"""
+        build_dir = self.variant.build_dir
+        stamp = build_dir / ".variant_flags"
+        flags = json.dumps(self.variant.make_args())
+        if build_dir.exists() and (self.clean or not stamp.exists() or stamp.read_text() != flags):
+            shutil.rmtree(build_dir)
+        build_dir.mkdir(parents=True, exist_ok=True)
+        stamp.write_text(flags)
+
+    def run(self, cmd, log_file):
+        log_file.write(f"$ {' '.join(cmd)}\n")
+        log_file.flush()
+        result = subprocess.run(cmd, cwd=FW_ROOT, stdout=log_file, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"{cmd[0]} 失敗 (代碼 {result.returncode})，詳見 {log_file.name}")
+
+    def build(self, sd_path):
+        variant = self.variant
+        t0 = time.perf_counter()
+        self.prepare_build_dir()
+        app_hex = variant.build_dir / f"{variant.target}.hex"
+        tmp_hex = variant.build_dir / "merged.hex"
+
+        make_cmd = ['make', f'-j{self.jobs}', *variant.make_args()]
+        if self.use_cache:
+            # 各變體共用的目的檔快取：只有受變體定義影響的檔案需要重新編譯
+            wrapper = shlex.join([sys.executable, str(Path(objcache.__file__).resolve())])
+            make_cmd.append(f"OBJCACHE={wrapper}")
+
+        with open(variant.build_dir / "build.log", 'w') as log_file:
+            self.run([*make_cmd, variant.target], log_file)
+            self.run(['srec_cat', sd_path, '-intel', str(app_hex), '-intel',
+                      '-o', str(tmp_hex), '-intel', '--line-length=44'], log_file)
+            if self.make_bin:
+                self.run(['srec_cat', str(tmp_hex), '-intel', '-o',
+                          str(variant.output_hex.with_suffix('.bin')), '-binary'], log_file)
+
+        # 完成後才放入韌體庫，避免 GUI 讀到寫到一半的檔案
+        LIBRARY_DIR.mkdir(exist_ok=True)
+        os.replace(tmp_hex, variant.output_hex)
+        self.duration = time.perf_counter() - t0
+        return {
+            'name': variant.name,
+            'chip': f"nrf{variant.chip}",
+            'defines': variant.defines,
+            'file': variant.output_hex.name,
+            'sha256': sha256_file(variant.output_hex),
+            'size': variant.output_hex.stat().st_size,
+            'softdevice': Path(sd_path).name,
+            'built': datetime.datetime.now().isoformat(timespec='seconds'),
+            'duration': round(self.duration, 1),
+        }
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == MANIFEST_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'images': {}}
+
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def build_variants(variants, parallel=None, jobs=None, clean=False, make_bin=False,
+                   use_cache=True):
+    """平行建置變體並更新 manifest；回傳 (成功項目, 失敗清單)"""
+    for tool in ('make', 'srec_cat'):
+        if shutil.which(tool) is None:
+            raise RuntimeError(f"找不到 {tool}，請先安裝建置工具")
+
+    parallel = max(1, min(parallel or len(variants), len(variants)))
+    jobs = jobs or os.cpu_count() or 1
+    per_variant_jobs = max(1, jobs // parallel)
+    print_lock = threading.Lock()
+
+    def log(text):
+        with print_lock:
+            print(text, flush=True)
+
+    sd_paths = {chip: softdevice_path(chip) for chip in {v.chip for v in variants}}
+    log(f"建置 {len(variants)} 個變體：同時 {parallel} 個，每個 make -j{per_variant_jobs}")
+
+    def build_one(variant):
+        log(f"[開始] {variant.name}")
+        try:
+            entry = VariantBuilder(variant, per_variant_jobs, clean, make_bin, use_cache).build(
+                sd_paths[variant.chip])
+        except Exception as e:
+            log(f"[失敗] {variant.name}: {e}")
+            return variant, None, str(e)
+        log(f"[完成] {variant.name} ({entry['duration']:.1f} 秒) → app_hex/{entry['file']}")
+        return variant, entry, None
+
+    hits_before, misses_before = objcache.stats()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(build_one, variants))
+    elapsed = time.perf_counter() - t0
+
+    built = [entry for _, entry, _ in results if entry]
+    failed = [(variant.name, error) for variant, _, error in results if error]
+    if built:
+        manifest = load_manifest()
+        manifest['generated'] = datetime.datetime.now().isoformat(timespec='seconds')
+        manifest['commit'] = git_revision()
+        for entry in built:
+            manifest['images'][entry['name']] = entry
+        save_manifest(manifest)
+
+    slowest = max((e['duration'] for e in built), default=0)
+    log(f"\n完成 {len(built)}/{len(variants)} 個變體，總耗時 {elapsed:.1f} 秒 "
+        f"(最慢的單一變體 {slowest:.1f} 秒)")
+    if use_cache:
+        hits, misses = objcache.stats()
+        log(f"目的檔快取: 命中 {hits - hits_before}, 編譯 {misses - misses_before}")
+    for name, error in failed:
+        log(f"  ✗ {name}: {error}")
+    return built, failed
+
+
+def main():
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--only', action='append', help="只建置指定變體 (可重複)")
+    options.add_argument('--parallel', type=int, help="同時建置的變體數")
+    options.add_argument('--jobs', type=int, help="總編譯工作數")
+    options.add_argument('--clean', action='store_true', help="先清除建置目錄")
+    options.add_argument('--bin', action='store_true', help="另外輸出 .bin")
+    options.add_argument('--no-cache', action='store_true', help="不使用目的檔快取")
+
+    parser = argparse.ArgumentParser(description="韌體變體平行建置")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('release', parents=[options], help="所有正式變體")
+    custom = sub.add_parser('custom', parents=[options], help="自訂 BLE 名稱的 nRF52832 變體")
+    custom.add_argument('names', nargs='+')
+    sub.add_parser('list', parents=[options], help="列出變體")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'custom':
+            variants = [custom_variant(name) for name in args.names]
+        else:
+            variants = list(RELEASE_VARIANTS)
+    except ValueError as e:
+        print(e)
+        return 2
+    if args.only:
+        variants = [v for v in variants if v.name in args.only]
+        if not variants:
+            print("沒有符合 --only 的變體")
+            return 2
+
+    if args.command == 'list':
+        for v in variants:
+            print(f"{v.name:<40} nRF{v.chip}  {v.build_args()}")
+        return 0
+
+    try:
+        _, failed = build_variants(variants, args.parallel, args.jobs, args.clean, args.bin,
+                                   use_cache=not args.no_cache)
+    except RuntimeError as e:
+        print(f"錯誤: {e}")
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+目的檔快取 (編譯器包裝程式)
+以 build_variants.py 建置時，Makefile 的 CC 前面會加上本程式：
+  python3 objcache.py arm-none-eabi-gcc -c -o x.c.o x.c ...
+
+快取鍵為前置處理後的原始碼 (已展開所有 #include 與 #define) 加上不影響
+前置處理的編譯旗標與編譯器版本。變體之間只有 -D 定義不同，沒有用到這些
+定義的檔案前置處理結果相同，可以直接取用其他變體編譯過的目的檔。
+-g3 的除錯資訊會包含巨集定義，快取命中時除錯資訊可能來自另一個變體，
+產生的程式碼 (hex) 不受影響。
+
+用法:
+  python3 objcache.py --stats     快取統計
+  python3 objcache.py --clear     清除快取
+"""
+
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get('OBJCACHE_DIR') or
+                 Path(__file__).resolve().parent.parent / "_build" / "objcache")
+STATS_FILE = CACHE_DIR / "stats.log"
+
+# 快取格式變更時遞增，舊項目自然失效
+CACHE_VERSION = b'objcache-2'
+
+# 小寫 .s 組合語言不經過前置處理 (-E 只會輸出空白)，所有 .s 檔會得到同一個
+# 快取鍵，因此不列入，交給編譯器直接組譯
+SOURCE_SUFFIXES = ('.c', '.S', '.cpp', '.cc')
+
+# 只影響前置處理的旗標 (效果已包含在前置處理結果中)，不列入快取鍵
+PREPROCESSOR_FLAGS = ('-D', '-U', '-I')
+PREPROCESSOR_FLAGS_WITH_ARG = ('-include', '-isystem', '-iquote', '-imacros')
+
+# 相依檔旗標：前置處理時移除，編譯時照原樣使用
+DEPENDENCY_FLAGS = ('-MD', '-MMD', '-MP')
+DEPENDENCY_FLAGS_WITH_ARG = ('-MF', '-MT', '-MQ')
+
+# 快取的 .d 檔中以此取代目的檔路徑
+OBJECT_PLACEHOLDER = '@@OBJECT@@'
+
+
+def expand_response_files(args):
+    """展開 @檔案 (SDK Makefile 以回應檔傳遞旗標)"""
+    expanded = []
+    for arg in args:
+        if arg.startswith('@') and os.path.isfile(arg[1:]):
+            with open(arg[1:], encoding='utf-8', errors='replace') as f:
+                expanded.extend(expand_response_files(shlex.split(f.read())))
+        else:
+            expanded.append(arg)
+    return expanded
+
+
+class Invocation:
+    """分析一次編譯器呼叫"""
+
+    def __init__(self, args):
+        self.args = expand_response_files(args)
+        self.output = None
+        self.source = None
+        self.dep_file = None
+        self.writes_deps = False
+        self.compile_only = False
+        self.preprocess_args = []
+        self.key_args = []
+
+        i = 0
+        while i < len(self.args):
+            arg = self.args[i]
+            value = self.args[i + 1] if i + 1 < len(self.args) else None
+            if arg == '-c':
+                self.compile_only = True
+            elif arg == '-o':
+                self.output = value
+                i += 1
+            elif arg in DEPENDENCY_FLAGS:
+                self.writes_deps = True
+            elif arg in DEPENDENCY_FLAGS_WITH_ARG:
+                if arg == '-MF':
+                    self.dep_file = value
+                i += 1
+            elif arg in PREPROCESSOR_FLAGS_WITH_ARG:
+                self.preprocess_args += [arg, value]
+                i += 1
+            elif arg.startswith(PREPROCESSOR_FLAGS):
+                self.preprocess_args.append(arg)
+                if arg in PREPROCESSOR_FLAGS:
+                    self.preprocess_args.append(value)
+                    i += 1
+            elif not arg.startswith('-') and arg.endswith(SOURCE_SUFFIXES):
+                self.source = arg
+            else:
+                self.preprocess_args.append(arg)
+                self.key_args.append(arg)
+            i += 1
+
+        if self.writes_deps and self.dep_file is None and self.output:
+            self.dep_file = os.path.splitext(self.output)[0] + '.d'
+
+    @property
+    def cacheable(self):
+        return self.compile_only and self.output and self.source
+
+
+def compiler_identity(compiler):
+    """編譯器路徑、大小與修改時間 (升級編譯器時快取失效)"""
+    path = shutil.which(compiler) or compiler
+    try:
+        stat = os.stat(path)
+        return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    except OSError:
+        return compiler.encode()
+
+
+def cache_key(compiler, inv):
+    """前置處理並計算快取鍵；失敗時回傳 None (交給編譯器回報錯誤)"""
+    result = subprocess.run([compiler, '-E', *inv.preprocess_args, inv.source],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    h = hashlib.sha256(CACHE_VERSION)
+    h.update(compiler_identity(compiler))
+    h.update('\0'.join(inv.key_args).encode())
+    h.update(os.path.splitext(inv.source)[1].encode())
+    h.update(result.stdout)
+    return h.hexdigest()
+
+
+def cache_paths(key):
+    base = CACHE_DIR / key[:2] / key
+    return base.with_suffix('.o'), base.with_suffix('.d')
+
+
+def record(event):
+    """統計 (多個編譯程序同時寫入，每次只附加一行)"""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(STATS_FILE, 'a') as f:
+            f.write(event + '\n')
+    except OSError:
+        pass
+
+
+def store(src, dst, replace=None):
+    """原子性地複製到目的地 (replace 為 (舊字串, 新字串) 時改寫內容)"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as out:
+        with open(src, 'rb') as f:
+            data = f.read()
+        if replace:
+            data = data.replace(replace[0].encode(), replace[1].encode())
+        out.write(data)
+    os.replace(tmp, dst)
+
+
+def run(argv):
+    compiler, args = argv[0], argv[1:]
+    inv = Invocation(args)
+    if not inv.cacheable:
+        return subprocess.call([compiler, *args])
+
+    key = cache_key(compiler, inv)
+    if key is None:
+        return subprocess.call([compiler, *args])
+
+    obj_path, dep_path = cache_paths(key)
+    if obj_path.exists() and (not inv.dep_file or dep_path.exists()):
+        store(obj_path, Path(inv.output))
+        if inv.dep_file:
+            store(dep_path, Path(inv.dep_file), (OBJECT_PLACEHOLDER, inv.output))
+        record('hit')
+        return 0
+
+    code = subprocess.call([compiler, *args])
+    if code == 0:
+        try:
+            if inv.dep_file and os.path.exists(inv.dep_file):
+                store(inv.dep_file, dep_path, (inv.output, OBJECT_PLACEHOLDER))
+            store(inv.output, obj_path)
+        except OSError:
+            pass
+        record('miss')
+    return code
+
+
+def stats():
+    hits = misses = 0
+    try:
+        with open(STATS_FILE) as f:
+            for line in f:
+                if line.startswith('hit'):
+                    hits += 1
+                elif line.startswith('miss'):
+                    misses += 1
+    except OSError:
+        pass
+    return hits, misses
+
+
+def cache_size():
+    total = count = 0
+    for path in CACHE_DIR.glob('*/*.o'):
+        total += path.stat().st_size
+        count += 1
+    return count, total
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 2
+    if sys.argv[1] == '--stats':
+        hits, misses = stats()
+        count, total = cache_size()
+        ratio = hits / (hits + misses) * 100 if hits + misses else 0
+        print(f"快取目錄: {CACHE_DIR}")
+        print(f"目的檔: {count} 個, {total / 1024 / 1024:.1f} MB")
+        print(f"命中: {hits}  未命中: {misses}  命中率: {ratio:.1f}%")
+        return 0
+    if sys.argv[1] == '--clear':
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        print("快取已清除")
+        return 0
+    return run(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())